@@ -4,9 +4,14 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 import os
+import time
+import asyncio
 from dotenv import load_dotenv
-from database import TokenData, find_user_by_email, document_to_dict
+from database import TokenData, find_user_by_email, update_user, document_to_dict
+from cache import TTLCache
+from metrics import timed
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,8 +20,30 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() == "true"
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "64"))
+LOGIN_FAILURE_WINDOW = int(os.getenv("LOGIN_FAILURE_WINDOW", "300"))
+LOGIN_MAX_FAILURES_PER_ACCOUNT = int(os.getenv("LOGIN_MAX_FAILURES_PER_ACCOUNT", "5"))
+LOGIN_MAX_FAILURES_PER_IP = int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", "20"))
+LOGIN_DELAY_BASE = float(os.getenv("LOGIN_DELAY_BASE", "1"))
+LOGIN_DELAY_MAX = float(os.getenv("LOGIN_DELAY_MAX", "60"))
+TRUSTED_PROXIES = {proxy.strip() for proxy in os.getenv("TRUSTED_PROXIES", "").split(",") if proxy.strip()}
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+login_failures = TTLCache(maxsize=100000, ttl=LOGIN_FAILURE_WINDOW)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt releases the GIL, so a thread pool sized to the core count keeps
+# hashing parallel without blocking the event loop.
+_password_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password"
+)
+_password_jobs = 0
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")  
 
@@ -27,20 +54,155 @@ def verify_password(plain_password, hashed_password):
         logger.error(f"Password verification error: {e}")
         return False
 
+def verify_and_update_password(plain_password, hashed_password):
+    """
+    Returns (valid, new_hash); new_hash is set when the stored hash uses
+    outdated settings (e.g. fewer BCRYPT_ROUNDS) and should be replaced.
+    """
+    try:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    except Exception as e:
+        logger.error(f"Password verification error: {e}")
+        return False, None
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def get_user(email):
+async def run_password_job(func, *args):
+    global _password_jobs
+    if _password_jobs >= PASSWORD_HASH_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-in requests right now. Please try again shortly.",
+            headers={"Retry-After": "2"},
+        )
+    _password_jobs += 1
+    try:
+        loop = asyncio.get_running_loop()
+        with timed("password"):
+            return await loop.run_in_executor(_password_executor, func, *args)
+    finally:
+        _password_jobs -= 1
+
+async def hash_password(password):
+    return await run_password_job(get_password_hash, password)
+
+def _recent_failures(key):
+    cutoff = time.monotonic() - LOGIN_FAILURE_WINDOW
+    return [attempt for attempt in login_failures.peek(key, []) if attempt > cutoff]
+
+def client_address(request):
+    """
+    The caller's IP. X-Forwarded-For is only honoured when the connection
+    comes from one of TRUSTED_PROXIES; the client is then the rightmost
+    address in the header that is not itself a trusted proxy.
+    """
+    peer = request.client.host if request.client else "unknown"
+    forwarded = request.headers.get("x-forwarded-for")
+    if peer not in TRUSTED_PROXIES or not forwarded:
+        return peer
+    for address in reversed([address.strip() for address in forwarded.split(",") if address.strip()]):
+        if address not in TRUSTED_PROXIES:
+            return address
+    return peer
+
+def _account_key(email):
+    return f"email:{email.lower()}"
+
+def _account_delay(attempts):
+    """
+    Seconds to wait after the last failure before the account may try again:
+    none for the first LOGIN_MAX_FAILURES_PER_ACCOUNT failures, then doubling
+    from LOGIN_DELAY_BASE up to LOGIN_DELAY_MAX. Unlike a lockout, a third
+    party guessing at someone's password can only slow them down.
+    """
+    excess = len(attempts) - LOGIN_MAX_FAILURES_PER_ACCOUNT
+    if excess < 0:
+        return 0
+    return min(LOGIN_DELAY_BASE * 2 ** min(excess, 32), LOGIN_DELAY_MAX)
+
+def _throttled(key, retry_after):
+    logger.warning(f"Login throttled for {key}")
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many failed login attempts. Please try again later.",
+        headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+    )
+
+def check_login_allowed(email, ip):
+    ip_key = f"ip:{ip}"
+    if len(_recent_failures(ip_key)) >= LOGIN_MAX_FAILURES_PER_IP:
+        raise _throttled(ip_key, LOGIN_FAILURE_WINDOW)
+    account_key = _account_key(email)
+    attempts = _recent_failures(account_key)
+    if attempts:
+        wait = attempts[-1] + _account_delay(attempts) - time.monotonic()
+        if wait > 0:
+            raise _throttled(account_key, wait)
+
+def record_login_failure(email, ip):
+    now = time.monotonic()
+    ip_key = f"ip:{ip}"
+    login_failures.set(ip_key, (_recent_failures(ip_key) + [now])[-LOGIN_MAX_FAILURES_PER_IP:])
+    account_key = _account_key(email)
+    login_failures.set(account_key, (_recent_failures(account_key) + [now])[-(LOGIN_MAX_FAILURES_PER_ACCOUNT + 32):])
+
+def reset_login_failures(email):
+    login_failures.pop(_account_key(email))
+
+def shutdown_password_pool():
+    _password_executor.shutdown(wait=False, cancel_futures=True)
+
+async def get_user(email):
     try:
-        user_data = find_user_by_email(email)
+        user_data = await find_user_by_email(email)
         return user_data
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting user: {e}")
         return None
 
-def authenticate_user(email, password):
+async def load_principal(email):
+    """
+    The authenticated user record without its password hash, cached per token
+    subject for PRINCIPAL_CACHE_TTL seconds.
+    """
+    principal = principal_cache.get(email)
+    if principal is None:
+        user = await get_user(email)
+        if user is None:
+            return None
+        principal = {key: value for key, value in user.items() if key != "hashed_password"}
+        principal_cache.set(email, principal)
+    return dict(principal)
+
+def invalidate_principal(email):
+    """Call after a user is changed or deactivated so the next request reloads it."""
+    principal_cache.pop(email)
+
+def clear_principal_cache():
+    principal_cache.clear()
+
+def principal_claims(user):
+    return {
+        "sub": user["email"],
+        "uid": user["id"],
+        "name": user.get("name"),
+        "active": user.get("is_active", True),
+    }
+
+def principal_from_claims(payload):
+    return {
+        "id": payload["uid"],
+        "email": payload["sub"],
+        "name": payload.get("name"),
+        "is_active": payload.get("active", True),
+    }
+
+async def authenticate_user(email, password):
     try:
-        user = get_user(email)
+        user = await get_user(email)
         if not user:
             logger.warning(f"Authentication failed: User {email} not found")
             return False
@@ -49,11 +211,22 @@ def authenticate_user(email, password):
             logger.error(f"Authentication failed: User {email} has no hashed_password")
             return False
             
-        if not verify_password(password, user["hashed_password"]):
+        valid, new_hash = await run_password_job(
+            verify_and_update_password, password, user["hashed_password"]
+        )
+        if not valid:
             logger.warning(f"Authentication failed: Invalid password for {email}")
             return False
-            
+
+        if new_hash:
+            logger.info(f"Rehashing password for {email} with current settings")
+            await update_user(email, {"hashed_password": new_hash})
+            user["hashed_password"] = new_hash
+            invalidate_principal(email)
+
         return user
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Authentication error: {e}")
         return False
@@ -69,6 +242,10 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    with timed("auth"):
+        return await resolve_token(token)
+
+async def resolve_token(token):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -87,7 +264,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         logger.error(f"Token validation error: {e}")
         raise credentials_exception
         
-    user = get_user(email=token_data.email)
+    if AUTH_TRUST_TOKEN_CLAIMS and "uid" in payload:
+        return principal_from_claims(payload)
+    user = await load_principal(token_data.email)
     if user is None:
         logger.error(f"User from token not found: {token_data.email}")
         raise credentials_exception
@@ -0,0 +1,134 @@
+"""
+Local stand-ins for WeatherAPI, Foursquare and HF chat completions, with
+configurable latency and error rate, for the benchmark harness.
+
+    FAKE_LATENCY_MS=50 FAKE_LLM_LATENCY_MS=800 FAKE_ERROR_RATE=0.01 \
+        uvicorn bench.fake_upstreams:app --port 9100
+"""
+import os
+import json
+import time
+import random
+import asyncio
+from datetime import date, timedelta
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_MS = float(os.getenv("FAKE_LATENCY_MS", "50"))
+LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "800"))
+JITTER = float(os.getenv("FAKE_JITTER", "0.2"))
+ERROR_RATE = float(os.getenv("FAKE_ERROR_RATE", "0"))
+STREAM_CHUNKS = 20
+
+app = FastAPI()
+
+async def simulate(latency_ms):
+    delay = latency_ms * random.uniform(1 - JITTER, 1 + JITTER) / 1000
+    await asyncio.sleep(max(delay, 0))
+    if random.random() < ERROR_RATE:
+        return JSONResponse(status_code=500, content={"error": "injected failure"})
+    return None
+
+def forecast(city, days):
+    start = date.today()
+    return {
+        "location": {"name": city},
+        "forecast": {
+            "forecastday": [
+                {
+                    "date": (start + timedelta(days=offset)).isoformat(),
+                    "day": {
+                        "avgtemp_c": 20 + offset, "mintemp_c": 15, "maxtemp_c": 25,
+                        "avghumidity": 60, "condition": {"text": "Sunny", "icon": "//cdn/icon.png"},
+                    },
+                }
+                for offset in range(days)
+            ]
+        },
+    }
+
+def plan_result(days):
+    return {
+        "itinerary": [
+            {"day": day, "activities": ["Old town walk", "Local market"], "notes": "", "approximate_cost": 80}
+            for day in range(1, days + 1)
+        ],
+        "accommodation_suggestions": [{"name": "Central Hotel", "price_per_night": 90, "total_cost": 90 * days}],
+        "local_customs": ["Tip 10%"],
+        "packing_tips": ["Comfortable shoes"],
+        "budget_breakdown": {
+            "accommodation": 90 * days, "food": 40 * days, "activities": 30 * days,
+            "transportation": 50, "other": 20, "total": 160 * days + 70,
+        },
+    }
+
+def suggestion_result():
+    return {
+        "suggested_destinations": [
+            {
+                "destination": name, "reason": "Good value", "estimated_total_cost": 400,
+                "cost_breakdown": {
+                    "flights_or_transportation": 150, "accommodation": 150,
+                    "food": 60, "activities": 30, "other": 10,
+                },
+            }
+            for name in ("Lisbon", "Porto", "Valencia")
+        ],
+        "itinerary_for_top_choice": [{"day": 1, "activities": ["Tram 28"], "notes": ""}],
+        "local_customs": ["Greet with a handshake"],
+        "packing_tips": ["Light jacket"],
+        "budget_considerations": ["Book trains early"],
+    }
+
+@app.get("/weather/forecast.json")
+async def fake_forecast(q: str, days: int = 5):
+    error = await simulate(LATENCY_MS)
+    return error or forecast(q, days)
+
+@app.get("/foursquare/places/search")
+async def fake_places(near: str, fsq_category_ids: str, limit: int = 4):
+    error = await simulate(LATENCY_MS)
+    if error:
+        return error
+    return {
+        "results": [
+            {
+                "name": f"{near} place {index}",
+                "fsq_place_id": f"{fsq_category_ids}-{index}",
+                "location": {"formatted_address": f"{index} Main St, {near}"},
+                "categories": [{"name": "Restaurant", "icon": {"prefix": "https://icon/", "suffix": ".png"}}],
+                "rating": 8.5,
+            }
+            for index in range(limit)
+        ]
+    }
+
+@app.post("/hf/v1/chat/completions")
+async def fake_chat_completions(request: Request):
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    if "suggest destinations" in prompt:
+        content = json.dumps(suggestion_result())
+    else:
+        content = json.dumps(plan_result(3))
+    if not body.get("stream"):
+        error = await simulate(LLM_LATENCY_MS)
+        if error:
+            return error
+        return {
+            "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": "fake",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        }
+
+    async def events():
+        step = max(len(content) // STREAM_CHUNKS, 1)
+        for start in range(0, len(content), step):
+            await asyncio.sleep(LLM_LATENCY_MS / STREAM_CHUNKS / 1000)
+            chunk = {
+                "id": "fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": "fake",
+                "choices": [{"index": 0, "delta": {"role": "assistant", "content": content[start:start + step]}}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
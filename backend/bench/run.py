@@ -0,0 +1,321 @@
+"""
+Benchmark and load-test harness for the API.
+
+Boots bench.fake_upstreams and the app with uvicorn, points the app at the
+fakes, then drives a weighted mix of requests at a fixed concurrency and
+reports throughput, p50/p95/p99 latency per endpoint and event-loop lag.
+
+    cd backend
+    python -m bench.run --backends memory,sqlite --concurrency 32 --duration 30
+    MONGODB_URI=mongodb://localhost:27017 python -m bench.run --backends mongodb
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "login=1,suggestions=2,plans=2,save=2,list=4,places=4,weather=5"
+CITIES = ["Lisbon", "Porto", "Paris", "Rome", "Tokyo", "Denver", "Cairo", "Oslo"]
+GROUP_TYPES = ["friends", "couple", "family", "solo"]
+PASSWORD = "bench-password"
+LAG_PROBE_INTERVAL = 0.1
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"Unknown operation in mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def start_server(app, port, env, log_path):
+    log = open(log_path, "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    process.log = log
+    return process
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    process.log.close()
+
+async def wait_ready(url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited early, see {process.log.name}")
+            try:
+                response = await client.get(url, timeout=1)
+                if response.status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+
+    def record(self, name, seconds, status):
+        self.latencies[name].append(seconds)
+        self.statuses[name][status] += 1
+        if status == "error" or status >= 400:
+            self.errors[name] += 1
+
+    def report(self, elapsed):
+        report = {}
+        for name in sorted(self.latencies):
+            latencies = self.latencies[name]
+            report[name] = {
+                "count": len(latencies),
+                "errors": self.errors[name],
+                "statuses": dict(self.statuses[name]),
+                "rps": round(len(latencies) / elapsed, 2),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            }
+        return report
+
+class Worker:
+    """One simulated user: registers, logs in, then runs operations from the mix."""
+    def __init__(self, client, index, run_id):
+        self.client = client
+        self.email = f"bench-{run_id}-{index}@example.com"
+        self.headers = {}
+
+    async def setup(self):
+        await self.client.post("/auth/register", json={"email": self.email, "name": "Bench", "password": PASSWORD})
+        return await self.login()
+
+    async def login(self):
+        response = await self.client.post("/auth/login", data={"username": self.email, "password": PASSWORD})
+        if response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return response
+
+    def trip_params(self):
+        return {
+            "budget": random.choice([800, 1500, 3000]),
+            "people": random.randint(1, 4),
+            "days": random.randint(2, 5),
+            "group_type": random.choice(GROUP_TYPES),
+        }
+
+    async def suggestions(self):
+        params = self.trip_params()
+        params["location"] = random.choice(CITIES)
+        return await self.client.post("/api/suggestions", json=params, headers=self.headers)
+
+    async def plans(self):
+        params = self.trip_params()
+        params["destination"] = random.choice(CITIES)
+        return await self.client.post("/api/plans", json=params, headers=self.headers)
+
+    async def save(self):
+        destination = random.choice(CITIES)
+        data = {
+            "formParams": {"destination": destination, "budget": 1500, "days": 3, "people": 2, "groupType": "couple"},
+            "planData": {"itinerary": [{"day": day, "activities": ["Walk"]} for day in range(1, 4)]},
+        }
+        return await self.client.post(
+            "/api/trips/save", json={"trip_type": "plan", "data": data}, headers=self.headers
+        )
+
+    async def list(self):
+        return await self.client.get("/api/trips", params={"limit": 20, "summary": "true"}, headers=self.headers)
+
+    async def places(self):
+        return await self.client.get(f"/places/{random.choice(CITIES)}", params={"section": "all"})
+
+    async def weather(self):
+        return await self.client.get(f"/weather/{random.choice(CITIES)}", params={"days": random.randint(1, 5)})
+
+OPERATIONS = ["login", "suggestions", "plans", "save", "list", "places", "weather"]
+
+async def drive(client, recorder, workers, mix, duration):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    deadline = time.monotonic() + duration
+
+    async def loop(worker):
+        while time.monotonic() < deadline:
+            name = random.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await getattr(worker, name)()
+                status = response.status_code
+            except httpx.HTTPError:
+                status = "error"
+            recorder.record(name, time.perf_counter() - started, status)
+
+    await asyncio.gather(*(loop(worker) for worker in workers))
+
+async def probe_lag(client, samples, stop):
+    """
+    Time a trivial endpoint at a low rate while the load runs; its latency is
+    dominated by how long the server's event loop takes to get to it.
+    """
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get("/debug/ping")
+            samples.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(LAG_PROBE_INTERVAL)
+
+async def run_backend(backend, args, fake_url, workdir):
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "STORAGE_BACKEND": backend,
+        "STORAGE_PATH": os.path.join(workdir, f"{backend}.sqlite3"),
+        "PLACES_CACHE_PATH": os.path.join(workdir, f"{backend}-places.sqlite3"),
+        "BLOB_STORE_PATH": os.path.join(workdir, f"{backend}-blobs"),
+        "WEATHERAPI_BASE_URL": f"{fake_url}/weather",
+        "FOURSQUARE_BASE_URL": f"{fake_url}/foursquare",
+        "WEATHERAPI_KEY": "bench",
+        "FOURSQUARE_API_KEY": "bench",
+        "MODEL_ID": f"{fake_url}/hf",
+        "HF_API_TOKEN": "bench",
+        "SECRET_KEY": "bench-secret",
+        "BCRYPT_ROUNDS": os.getenv("BCRYPT_ROUNDS", "4"),
+    })
+    if backend == "mongodb":
+        if not os.getenv("MONGODB_URI"):
+            raise SystemExit("The mongodb backend needs MONGODB_URI pointing at a scratch server")
+        env["DB_NAME"] = os.getenv("BENCH_DB_NAME", "holiday_planner_bench")
+    if args.no_cache:
+        env.update({
+            "WEATHER_CACHE_TTL": "0", "PLACES_CACHE_FRESH_TTL": "0",
+            "PLACES_CACHE_STALE_TTL": "0", "GENERATION_CACHE_TTL": "0",
+        })
+
+    app = start_server("main:app", port, env, os.path.join(workdir, f"{backend}-app.log"))
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await wait_ready(f"{base_url}/readyz", app)
+        limits = httpx.Limits(max_connections=args.concurrency + 2)
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            run_id = f"{int(time.time())}-{random.randint(0, 9999)}"
+            workers = [Worker(client, index, run_id) for index in range(args.concurrency)]
+            await asyncio.gather(*(worker.setup() for worker in workers))
+            if args.warmup:
+                await drive(client, Recorder(), workers, args.mix, args.warmup)
+
+            recorder = Recorder()
+            lag_samples = []
+            stop = asyncio.Event()
+            probe = asyncio.create_task(probe_lag(client, lag_samples, stop))
+            started = time.monotonic()
+            await drive(client, recorder, workers, args.mix, args.duration)
+            elapsed = time.monotonic() - started
+            stop.set()
+            await probe
+    finally:
+        stop_server(app)
+
+    endpoints = recorder.report(elapsed)
+    total = sum(endpoint["count"] for endpoint in endpoints.values())
+    return {
+        "backend": backend,
+        "concurrency": args.concurrency,
+        "duration": round(elapsed, 2),
+        "requests": total,
+        "rps": round(total / elapsed, 2),
+        "event_loop_lag_ms": {
+            "p50": round(percentile(lag_samples, 50) * 1000, 1),
+            "p99": round(percentile(lag_samples, 99) * 1000, 1),
+            "max": round(max(lag_samples, default=0) * 1000, 1),
+        },
+        "endpoints": endpoints,
+    }
+
+def print_report(result):
+    lag = result["event_loop_lag_ms"]
+    print(f"\n== {result['backend']}: {result['requests']} requests in {result['duration']}s "
+          f"({result['rps']} req/s) at concurrency {result['concurrency']}")
+    print(f"   event-loop lag p50 {lag['p50']}ms  p99 {lag['p99']}ms  max {lag['max']}ms")
+    print(f"   {'endpoint':<12}{'count':>8}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, stats in result["endpoints"].items():
+        print(f"   {name:<12}{stats['count']:>8}{stats['errors']:>8}{stats['rps']:>9}"
+              f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}")
+
+async def main(args):
+    fake_port = free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    with tempfile.TemporaryDirectory(prefix="holiday-bench-") as workdir:
+        env = dict(os.environ)
+        env.update({
+            "FAKE_LATENCY_MS": str(args.upstream_latency_ms),
+            "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+            "FAKE_ERROR_RATE": str(args.error_rate),
+        })
+        fakes = start_server("bench.fake_upstreams:app", fake_port, env, os.path.join(workdir, "fakes.log"))
+        try:
+            await wait_ready(f"{fake_url}/docs", fakes)
+            results = []
+            for backend in args.backends:
+                result = await run_backend(backend, args, fake_url, workdir)
+                results.append(result)
+                if not args.json:
+                    print_report(result)
+        finally:
+            stop_server(fakes)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Holiday Planner API against fake upstreams.")
+    parser.add_argument("--backends", default="memory", help="comma-separated: memory, sqlite, mongodb")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20, help="seconds of measured load per backend")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of unmeasured load first")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted operations, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--upstream-latency-ms", type=float, default=50)
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--no-cache", action="store_true", help="disable the weather, places and generation caches")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+    args.backends = [backend.strip() for backend in args.backends.split(",") if backend.strip()]
+    args.mix = parse_mix(args.mix)
+    return args
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
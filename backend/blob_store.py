@@ -0,0 +1,156 @@
+import os
+import json
+import zlib
+import asyncio
+import hashlib
+import logging
+import time
+import tempfile
+from dotenv import load_dotenv
+from bson import Binary
+
+import database
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+BLOB_STORE_PATH = os.getenv("BLOB_STORE_PATH", os.path.join("data", "blobs"))
+BLOB_COMPRESSION_LEVEL = int(os.getenv("BLOB_COMPRESSION_LEVEL", "6"))
+# Blobs written or re-used more recently than this are never deleted, so a
+# trip that is being saved cannot lose its payload to a concurrent delete.
+BLOB_GC_GRACE = int(os.getenv("BLOB_GC_GRACE", "600"))
+
+def encode_payload(data):
+    """Canonical JSON bytes, so identical payloads hash to the same blob."""
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+
+def blob_digest(raw):
+    """The name a payload is stored under."""
+    return hashlib.sha256(raw).hexdigest()
+
+class BlobStore:
+    """
+    Content-addressed store of zlib-compressed blobs on the local filesystem.
+    Blobs are named by the SHA-256 of their uncompressed bytes, so a payload
+    saved many times is stored once. Writes are atomic (temp file + rename),
+    which makes the directory safe to share between worker processes.
+    Re-using an existing blob refreshes its mtime, which delete() uses to
+    leave blobs alone while a save may still be referencing them.
+    """
+    def __init__(self, root, level=BLOB_COMPRESSION_LEVEL):
+        self.root = root
+        self.level = level
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def put_bytes(self, raw):
+        digest = blob_digest(raw)
+        path = self._path(digest)
+        if os.path.exists(path):
+            try:
+                os.utime(path)
+                return digest
+            except FileNotFoundError:
+                pass
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(zlib.compress(raw, self.level))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest
+
+    def get_bytes(self, digest):
+        with open(self._path(digest), "rb") as f:
+            return zlib.decompress(f.read())
+
+    def delete_bytes(self, digest, grace=BLOB_GC_GRACE):
+        """Remove a blob unless it was written or re-used in the last grace seconds. Returns True if removed."""
+        path = self._path(digest)
+        try:
+            if time.time() - os.path.getmtime(path) < grace:
+                return False
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def digests(self):
+        """Every stored digest, walking the directory tree lazily."""
+        if not os.path.isdir(self.root):
+            return
+        for prefix in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, prefix)
+            if len(prefix) != 2 or not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if len(name) == 62:
+                    yield prefix + name
+
+    async def put(self, raw):
+        return await asyncio.to_thread(self.put_bytes, raw)
+
+    async def get_json(self, digest):
+        raw = await asyncio.to_thread(self.get_bytes, digest)
+        return json.loads(raw)
+
+    async def delete(self, digest, grace=BLOB_GC_GRACE):
+        return await asyncio.to_thread(self.delete_bytes, digest, grace)
+
+    async def list_digests(self):
+        return await asyncio.to_thread(lambda: list(self.digests()))
+
+class MongoBlobStore:
+    """
+    The same content-addressed blobs as BlobStore, kept in a MongoDB
+    collection ({_id: digest, data, touched_at}) so every app host sees the
+    blobs its trip rows point to. collection is a callable returning the
+    connected collection. A missing blob raises FileNotFoundError, as on disk.
+    """
+    def __init__(self, collection, level=BLOB_COMPRESSION_LEVEL):
+        self._collection = collection
+        self.level = level
+
+    def collection(self):
+        collection = self._collection()
+        if collection is None or not database.using_mongodb:
+            raise database.DatabaseUnavailable()
+        return collection
+
+    async def put(self, raw):
+        digest = blob_digest(raw)
+        data = await asyncio.to_thread(zlib.compress, raw, self.level)
+        await self.collection().update_one(
+            {"_id": digest},
+            {"$set": {"touched_at": time.time()}, "$setOnInsert": {"data": Binary(data)}},
+            upsert=True
+        )
+        return digest
+
+    async def get_json(self, digest):
+        doc = await self.collection().find_one({"_id": digest}, {"data": 1})
+        if doc is None:
+            raise FileNotFoundError(f"Blob {digest} is not stored")
+        return json.loads(await asyncio.to_thread(zlib.decompress, doc["data"]))
+
+    async def delete(self, digest, grace=BLOB_GC_GRACE):
+        result = await self.collection().delete_one({"_id": digest, "touched_at": {"$lt": time.time() - grace}})
+        return result.deleted_count == 1
+
+    async def list_digests(self):
+        return [doc["_id"] async for doc in self.collection().find({}, {"_id": 1})]
+
+def create_blob_store():
+    """Blobs live beside the trips: in MongoDB when it is the configured backend, otherwise on local disk."""
+    if database.STORAGE_BACKEND == "mongodb" and database.MONGODB_URI:
+        logger.info("Storing trip payloads in MongoDB")
+        return MongoBlobStore(lambda: database.blobs_collection)
+    return BlobStore(BLOB_STORE_PATH)
+
+blob_store = create_blob_store()
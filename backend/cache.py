@@ -0,0 +1,243 @@
+import os
+import time
+import json
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """
+    Bounded in-memory LRU cache whose entries expire after a TTL (seconds).
+    """
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def peek(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self.peek(key, _MISSING)
+        self.record(value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def record(self, hit):
+        self.stats["hits" if hit else "misses"] += 1
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+_MISSING = object()
+
+class SingleFlight:
+    """
+    Merges concurrent calls for the same key into one in-flight coroutine.
+    """
+    def __init__(self):
+        self._inflight = {}
+
+    async def do(self, key, func):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def __contains__(self, key):
+        return key in self._inflight
+
+    def __len__(self):
+        return len(self._inflight)
+
+class MemoryBackend:
+    """
+    Tier 1: per-process LRU of (stored_at, value) pairs.
+    """
+    name = "memory"
+
+    def __init__(self, maxsize=1024, ttl=86400):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key):
+        return self._cache.peek(key)
+
+    async def set(self, key, value, stored_at):
+        self._cache.set(key, (stored_at, value))
+
+    async def close(self):
+        self._cache.clear()
+
+class SQLiteBackend:
+    """
+    Tier 2: on-disk SQLite store in WAL mode, shared by every worker on the host.
+    Values must be JSON serializable.
+    """
+    name = "sqlite"
+    PRUNE_EVERY = 500
+
+    def __init__(self, path, ttl=86400):
+        self.path = path
+        self.ttl = ttl
+        self._conn = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, stored_at REAL, value TEXT)"
+            )
+            self._prune()
+        return self._conn
+
+    def _prune(self):
+        self._conn.execute("DELETE FROM cache WHERE stored_at < ?", (time.time() - self.ttl,))
+        self._conn.commit()
+
+    def _get(self, key):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT stored_at, value FROM cache WHERE key = ?", (json.dumps(key),)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _set(self, key, value, stored_at):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, stored_at, value) VALUES (?, ?, ?)",
+                (json.dumps(key), stored_at, json.dumps(value))
+            )
+            conn.commit()
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune()
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key, value, stored_at):
+        await asyncio.to_thread(self._set, key, value, stored_at)
+
+    async def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class TieredCache:
+    """
+    Read-through cache over an ordered list of backends (fastest first).
+    Entries older than fresh_ttl are still served until stale_ttl, while a
+    background refresh replaces them.
+    """
+    def __init__(self, backends, fresh_ttl, stale_ttl):
+        self.backends = backends
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self._inflight = SingleFlight()
+        self._refresh_tasks = set()
+        self.stats = {
+            backend.name: {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "errors": 0}
+            for backend in backends
+        }
+
+    async def get_or_load(self, key, loader):
+        now = time.time()
+        stale = None
+        for index, backend in enumerate(self.backends):
+            stats = self.stats[backend.name]
+            try:
+                entry = await backend.get(key)
+            except Exception as e:
+                logger.error(f"Cache backend {backend.name} read failed: {e}")
+                stats["errors"] += 1
+                entry = None
+            if entry is None or now - entry[0] > self.stale_ttl:
+                stats["misses"] += 1
+                continue
+            stored_at, value = entry
+            if now - stored_at <= self.fresh_ttl:
+                stats["hits"] += 1
+                for upper in self.backends[:index]:
+                    await upper.set(key, value, stored_at)
+                return value
+            stats["stale_hits"] += 1
+            if stale is None or stored_at > stale[0]:
+                stale = (stored_at, value, stats)
+        if stale is not None:
+            stored_at, value, stats = stale
+            self._refresh(key, loader, stats)
+            return value
+        return await self._inflight.do(key, lambda: self._load(key, loader))
+
+    async def _load(self, key, loader):
+        value = await loader()
+        stored_at = time.time()
+        for backend in self.backends:
+            try:
+                await backend.set(key, value, stored_at)
+            except Exception as e:
+                logger.error(f"Cache backend {backend.name} write failed: {e}")
+                self.stats[backend.name]["errors"] += 1
+        return value
+
+    def _refresh(self, key, loader, stats):
+        if key in self._inflight:
+            return
+        stats["refreshes"] += 1
+
+        async def refresh():
+            try:
+                await self._inflight.do(key, lambda: self._load(key, loader))
+            except Exception as e:
+                logger.warning(f"Background cache refresh failed for {key}: {e}")
+                stats["errors"] += 1
+
+        task = asyncio.ensure_future(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def close(self):
+        for task in list(self._refresh_tasks):
+            task.cancel()
+        for backend in self.backends:
+            await backend.close()
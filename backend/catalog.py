@@ -0,0 +1,332 @@
+import os
+import json
+import time
+import heapq
+import socket
+import sqlite3
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+
+import places
+import weather
+import inference
+import gazetteer
+from generation import budget_bucket
+from prompts import build_suggest_prompt
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+CATALOG_ENABLED = os.getenv("CATALOG_ENABLED", "true").lower() == "true"
+CATALOG_PATH = os.getenv("CATALOG_PATH", os.path.join("data", "catalog.sqlite3"))
+CATALOG_TOP_N = int(os.getenv("CATALOG_TOP_N", "200"))
+CATALOG_MIN_HITS = int(os.getenv("CATALOG_MIN_HITS", "3"))
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", str(24 * 3600)))
+CATALOG_REFRESH_AGE = int(os.getenv("CATALOG_REFRESH_AGE", str(12 * 3600)))
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "300"))
+CATALOG_REFRESH_BATCH = int(os.getenv("CATALOG_REFRESH_BATCH", "10"))
+CATALOG_WARM_HOURS = os.getenv("CATALOG_WARM_HOURS", "")
+CATALOG_QUERY_RETENTION = int(os.getenv("CATALOG_QUERY_RETENTION", str(7 * 24 * 3600)))
+CATALOG_WARM_DESTINATIONS = 3
+# Longer than one regeneration, so the lease (renewed per entry) outlives a slow inference call.
+CATALOG_LEASE_TTL = 600
+
+def query_key(location, budget, people, days, group_type):
+    """Catalog key for a suggestion query; matches generation.cache_key without the date."""
+    return json.dumps([
+        gazetteer.place_key(location),
+        budget_bucket(budget),
+        people,
+        days,
+        getattr(group_type, "value", group_type),
+    ])
+
+def in_warm_window(hours=CATALOG_WARM_HOURS, now=None):
+    """
+    hours is "start-end" in local server hours (e.g. "1-6", or "22-5" across
+    midnight); empty means warming may run at any time.
+    """
+    if not hours:
+        return True
+    start, _, end = hours.partition("-")
+    hour = (now or datetime.now()).hour
+    start, end = int(start), int(end or start)
+    if start <= end:
+        return start <= hour <= end
+    return hour >= start or hour <= end
+
+class Catalog:
+    """
+    Precomputed suggestion results for the most requested query tuples.
+    Observations and entries live in memory for millisecond lookups and are
+    synced with SQLite, which is shared by every worker on the host: each
+    worker adds its new hits to the stored counts and picks up the other
+    workers' counts and entries. Regeneration is done by one worker at a time,
+    the holder of a lease row.
+    """
+    def __init__(self, path, max_age=CATALOG_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.entries = {}
+        self.queries = {}
+        self._pending_hits = {}
+        self.stats = {"hits": 0, "misses": 0, "refreshed": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS catalog_queries (
+                    key TEXT PRIMARY KEY,
+                    params TEXT NOT NULL,
+                    hits INTEGER NOT NULL,
+                    last_seen REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS catalog_entries (
+                    key TEXT PRIMARY KEY,
+                    params TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    generated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS catalog_lease (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+            """)
+            self._conn.commit()
+            self._load_queries()
+            self._load_entries()
+        logger.info(f"Loaded destination catalog: {len(self.entries)} entries, {len(self.queries)} tracked queries")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _load_queries(self):
+        self.queries = {}
+        for key, params, hits, last_seen in self._conn.execute("SELECT * FROM catalog_queries"):
+            self.queries[key] = {"params": json.loads(params), "hits": hits, "last_seen": last_seen}
+        for key, hits in self._pending_hits.items():
+            if key in self.queries:
+                self.queries[key]["hits"] += hits
+
+    def _load_entries(self):
+        """Read entries generated since the newest one held in memory (by any worker)."""
+        newest = max((entry["generated_at"] for entry in self.entries.values()), default=0)
+        rows = self._conn.execute("SELECT * FROM catalog_entries WHERE generated_at > ?", (newest,))
+        for key, params, result, generated_at in rows:
+            self.entries[key] = {
+                "params": json.loads(params), "result": json.loads(result), "generated_at": generated_at
+            }
+
+    def observe(self, location, budget, people, days, group_type):
+        key = query_key(location, budget, people, days, group_type)
+        with self._lock:
+            query = self.queries.get(key)
+            if query is None:
+                query = self.queries[key] = {"hits": 0}
+            query["params"] = {
+                "location": location, "budget": budget, "people": people,
+                "days": days, "group_type": getattr(group_type, "value", group_type),
+            }
+            query["hits"] += 1
+            query["last_seen"] = time.time()
+            self._pending_hits[key] = self._pending_hits.get(key, 0) + 1
+        return key
+
+    def lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and time.time() - entry["generated_at"] < self.max_age:
+            self.stats["hits"] += 1
+            return entry["result"]
+        self.stats["misses"] += 1
+        return None
+
+    def due(self, top_n=CATALOG_TOP_N, min_hits=CATALOG_MIN_HITS, refresh_age=CATALOG_REFRESH_AGE):
+        """
+        Queries among the top_n most requested that have no entry or one older
+        than refresh_age: missing entries first, then oldest first.
+        """
+        now = time.time()
+        with self._lock:
+            popular = heapq.nlargest(
+                top_n,
+                ((query["hits"], key) for key, query in self.queries.items() if query["hits"] >= min_hits)
+            )
+            due = []
+            for hits, key in popular:
+                entry = self.entries.get(key)
+                generated_at = entry["generated_at"] if entry else 0
+                if now - generated_at >= refresh_age:
+                    due.append((generated_at, -hits, key, dict(self.queries[key]["params"])))
+        return [(key, params) for _, _, key, params in sorted(due)]
+
+    def store(self, key, params, result):
+        entry = {"params": params, "result": result, "generated_at": time.time()}
+        with self._lock:
+            self.entries[key] = entry
+            if self._conn is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO catalog_entries (key, params, result, generated_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(params), json.dumps(result), entry["generated_at"])
+            )
+            self._conn.commit()
+
+    def sync(self, retention=CATALOG_QUERY_RETENTION):
+        """
+        Add the hits observed here since the last sync to the shared counts,
+        forget queries (and their entries) not seen within retention, and
+        reload the counts and any new entries written by other workers.
+        """
+        cutoff = time.time() - retention
+        with self._lock:
+            if self._conn is None:
+                return
+            pending, self._pending_hits = self._pending_hits, {}
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO catalog_queries (key, params, hits, last_seen) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET hits = hits + excluded.hits, params = excluded.params, "
+                    "last_seen = MAX(last_seen, excluded.last_seen)",
+                    [
+                        (key, json.dumps(self.queries[key]["params"]), hits, self.queries[key]["last_seen"])
+                        for key, hits in pending.items() if key in self.queries
+                    ]
+                )
+                self._conn.execute(
+                    "DELETE FROM catalog_entries WHERE key IN (SELECT key FROM catalog_queries WHERE last_seen < ?)",
+                    (cutoff,)
+                )
+                self._conn.execute("DELETE FROM catalog_queries WHERE last_seen < ?", (cutoff,))
+            self._load_queries()
+            self.entries = {key: entry for key, entry in self.entries.items() if key in self.queries}
+            self._load_entries()
+
+    def acquire_lease(self, ttl):
+        """
+        Take or renew the refresh lease for ttl seconds. Returns False while
+        another worker holds it.
+        """
+        now = time.time()
+        with self._lock:
+            if self._conn is None:
+                return True
+            with self._conn:
+                cursor = self._conn.execute(
+                    "INSERT INTO catalog_lease (name, owner, expires_at) VALUES ('refresh', ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                    "WHERE catalog_lease.owner = excluded.owner OR catalog_lease.expires_at < ?",
+                    (self.owner, now + ttl, now)
+                )
+            return cursor.rowcount > 0
+
+    def release_lease(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            with self._conn:
+                self._conn.execute("DELETE FROM catalog_lease WHERE name = 'refresh' AND owner = ?", (self.owner,))
+
+catalog = Catalog(CATALOG_PATH)
+
+async def warm_destinations(result, days):
+    """Prefetch weather and places for the top suggested destinations into their caches."""
+    destinations = [
+        item["destination"] for item in result.get("suggested_destinations", [])[:CATALOG_WARM_DESTINATIONS]
+    ]
+    jobs = []
+    for destination in destinations:
+        if weather.API_KEY:
+            jobs.append(weather.get_forecast(destination, min(days, 10)))
+        if places.FOURSQUARE_API_KEY:
+            jobs.append(places.fetch_categories(destination, places.SECTION_CATEGORIES["all"].values()))
+    for outcome in await asyncio.gather(*jobs, return_exceptions=True):
+        if isinstance(outcome, Exception):
+            logger.warning(f"Catalog prefetch failed: {outcome}")
+
+async def refresh_catalog(batch=CATALOG_REFRESH_BATCH, lease_ttl=CATALOG_LEASE_TTL):
+    """
+    One incremental refresh pass: sync with the other workers, then, if this
+    worker holds the refresh lease, regenerate up to batch due entries,
+    stopping early as soon as live requests are waiting for inference.
+    """
+    await asyncio.to_thread(catalog.sync)
+    if not in_warm_window() or not await asyncio.to_thread(catalog.acquire_lease, lease_ttl):
+        return 0
+    try:
+        return await _refresh_due(batch, lease_ttl)
+    finally:
+        await asyncio.to_thread(catalog.release_lease)
+
+async def _refresh_due(batch, lease_ttl):
+    refreshed = 0
+    for key, params in catalog.due()[:batch]:
+        if inference.metrics["queue_depth"] > 0:
+            logger.info("Pausing catalog refresh for live inference traffic")
+            break
+        if not await asyncio.to_thread(catalog.acquire_lease, lease_ttl):
+            logger.warning("Lost the catalog refresh lease to another worker")
+            break
+        try:
+            prompt = build_suggest_prompt(
+                params["location"], params["budget"], params["people"], params["days"], params["group_type"]
+            )
+            result, problems = await inference.generate_structured("suggestions", prompt, params["budget"])
+        except Exception as e:
+            catalog.stats["failed"] += 1
+            logger.warning(f"Catalog refresh failed for {params['location']}: {e}")
+            continue
+        if problems:
+            catalog.stats["failed"] += 1
+            continue
+        await asyncio.to_thread(catalog.store, key, params, result)
+        await warm_destinations(result, params["days"])
+        catalog.stats["refreshed"] += 1
+        refreshed += 1
+    if refreshed:
+        logger.info(f"Refreshed {refreshed} catalog entries")
+    return refreshed
+
+async def _warm_loop(interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_catalog()
+        except Exception as e:
+            logger.error(f"Catalog refresh pass failed: {e}")
+
+_warm_task = None
+
+async def start_catalog(interval=CATALOG_REFRESH_INTERVAL):
+    global _warm_task
+    if not CATALOG_ENABLED:
+        return
+    await asyncio.to_thread(catalog.open)
+    if _warm_task is None or _warm_task.done():
+        _warm_task = asyncio.create_task(_warm_loop(interval))
+
+async def stop_catalog():
+    global _warm_task
+    if _warm_task is not None:
+        _warm_task.cancel()
+        try:
+            await _warm_task
+        except asyncio.CancelledError:
+            pass
+        _warm_task = None
+    await asyncio.to_thread(catalog.sync)
+    catalog.close()
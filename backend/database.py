@@ -1,11 +1,18 @@
 import os
+import time
+import functools
 from dotenv import load_dotenv
 from typing import Optional, List, Dict, Any
 import logging
 from datetime import datetime
 from pydantic import BaseModel, Field, EmailStr
-import pymongo
+import asyncio
+from pymongo import AsyncMongoClient, ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError
 from bson import ObjectId
+from fastapi import HTTPException, status
+from storage import MemoryStore, SQLiteStore, project
+from metrics import timed, db_seconds
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,41 +20,231 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 MONGODB_URI = os.getenv("MONGODB_URI")
 DB_NAME = os.getenv("DB_NAME", "holiday_planner")
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongodb").lower()
+STORAGE_PATH = os.getenv("STORAGE_PATH", os.path.join("data", "holiday_planner.sqlite3"))
+STORAGE_FSYNC = os.getenv("STORAGE_FSYNC", "normal")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", "60000"))
+MONGO_RETRY_INTERVAL = float(os.getenv("MONGO_RETRY_INTERVAL", "5"))
+MONGO_RETRY_MAX_INTERVAL = float(os.getenv("MONGO_RETRY_MAX_INTERVAL", "60"))
+MONGO_HEALTH_INTERVAL = float(os.getenv("MONGO_HEALTH_INTERVAL", "15"))
+MONGO_STARTUP_WAIT = float(os.getenv("MONGO_STARTUP_WAIT", "6"))
+READY_REQUIRES_MONGO = os.getenv("READY_REQUIRES_MONGO", "false").lower() == "true"
+# Development only: serve from the volatile local store while MongoDB is unreachable.
+MONGO_LOCAL_FALLBACK = os.getenv("MONGO_LOCAL_FALLBACK", "false").lower() == "true"
+MONGO_CONFIGURED = STORAGE_BACKEND == "mongodb" and bool(MONGODB_URI)
 
-in_memory_db = {
-    "users": [],
-    "trips": []
-}
+class DatabaseUnavailable(HTTPException):
+    """
+    Raised instead of touching the local store while a configured MongoDB is
+    unreachable, so nothing is read from or written to storage that would
+    be lost or diverge from Mongo. Answers 503.
+    """
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Storage is temporarily unavailable. Please try again shortly.",
+            headers={"Retry-After": str(int(MONGO_RETRY_INTERVAL))},
+        )
+
+def create_local_store():
+    if STORAGE_BACKEND == "sqlite":
+        logger.info(f"Using SQLite storage at {STORAGE_PATH}")
+        return SQLiteStore(STORAGE_PATH, fsync=STORAGE_FSYNC)
+    return MemoryStore()
+
+local_db = create_local_store()
+LOCAL_BACKEND = "sqlite" if isinstance(local_db, SQLiteStore) else "memory"
 
 using_mongodb = False
 client = None
 db = None
+users_collection = None
+trips_collection = None
+jobs_collection = None
+trip_versions_collection = None
+blobs_collection = None
 
-try:
-    if MONGODB_URI:
-        logger.info(f"Attempting to connect to MongoDB Atlas using URI: {MONGODB_URI[:20]}...")
-        client = pymongo.MongoClient(
-            MONGODB_URI,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=5000,
-            socketTimeoutMS=5000
-        )
-        
-        client.admin.command('ping')
-        
-        db = client[DB_NAME]
-        users_collection = db.users
-        trips_collection = db.trips
-        
-        logger.info("Successfully connected to MongoDB Atlas")
-        using_mongodb = True
-    else:
+TRIP_LIST_FIELDS = [
+    "user_id", "trip_type", "created_at", "updated_at", "data_blob",
+    "destination", "location", "budget", "people", "days", "group_type",
+    "data.formParams", "data.location", "data.budget", "data.days", "data.people", "data.groupType",
+    "data.planData.itinerary.day",
+    "data.suggested_destinations.destination", "data.itinerary_for_top_choice.day",
+    "data.suggestions.suggested_destinations.destination", "data.suggestions.itinerary_for_top_choice.day",
+]
+
+def _build_client():
+    return AsyncMongoClient(
+        MONGODB_URI,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_MS,
+        serverSelectionTimeoutMS=5000,
+        connectTimeoutMS=5000,
+        socketTimeoutMS=5000
+    )
+
+async def connect_db():
+    """
+    Connect the async MongoDB client, verify it with a ping and ensure indexes.
+    Local storage is used when Mongo is not configured; while a configured
+    Mongo is unreachable requests get 503 (or, with MONGO_LOCAL_FALLBACK, the
+    local store). Returns True when Mongo is in use.
+    """
+    global using_mongodb, client, db, users_collection, trips_collection, jobs_collection, trip_versions_collection
+    global blobs_collection
+    if STORAGE_BACKEND != "mongodb":
+        return False
+    if not MONGODB_URI:
         logger.warning("No MONGODB_URI environment variable found")
+        return False
+    mongo_status["last_attempt"] = datetime.utcnow()
+    try:
+        if client is None:
+            logger.info(f"Attempting to connect to MongoDB Atlas using URI: {MONGODB_URI[:20]}...")
+            client = _build_client()
+        await client.admin.command('ping')
+
+        if db is None:
+            # The globals are only set once every index exists, so a failed
+            # index build is retried on the next attempt.
+            database = client[DB_NAME]
+            await database.users.create_index("email", unique=True)
+            await database.trips.create_index(
+                [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]
+            )
+            await database.trips.create_index(
+                [("user_id", ASCENDING), ("import_key", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"import_key": {"$exists": True}}
+            )
+            await database.trips.create_index("data_blob", sparse=True)
+            await database.jobs.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+            await database.jobs.create_index([("dedupe_key", ASCENDING), ("created_at", DESCENDING)])
+            await database.jobs.create_index("finished_at")
+            users_collection = database.users
+            trips_collection = database.trips
+            jobs_collection = database.jobs
+            trip_versions_collection = database.trip_versions
+            blobs_collection = database.blobs
+            db = database
+
+        if not using_mongodb:
+            logger.info("Successfully connected to MongoDB Atlas")
+        using_mongodb = True
+        mongo_status["last_error"] = None
+    except Exception as e:
+        if using_mongodb:
+            logger.error(f"Lost connection to MongoDB: {e}")
+        else:
+            logger.error(f"Failed to connect to MongoDB: {e}")
+        if MONGO_LOCAL_FALLBACK:
+            logger.warning("Using local storage as fallback until MongoDB is reachable again")
+        else:
+            logger.warning("Answering 503 for storage requests until MongoDB is reachable again")
         using_mongodb = False
-except Exception as e:
-    logger.error(f"Failed to connect to MongoDB: {e}")
-    logger.warning("Using in-memory storage as fallback")
+        mongo_status["last_error"] = str(e)
+    return using_mongodb
+
+mongo_status = {"last_attempt": None, "last_error": None}
+_connect_attempted = asyncio.Event()
+_monitor_task = None
+
+async def _monitor_db():
+    """
+    Connect in the background, then keep checking: while Mongo is unreachable
+    retry with backoff, and once connected ping every MONGO_HEALTH_INTERVAL
+    seconds so an outage is noticed (readiness fails) and recovery resumes
+    service.
+    """
+    delay = MONGO_RETRY_INTERVAL
+    while True:
+        connected = await connect_db()
+        _connect_attempted.set()
+        if connected:
+            delay = MONGO_RETRY_INTERVAL
+            await asyncio.sleep(MONGO_HEALTH_INTERVAL)
+        else:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MONGO_RETRY_MAX_INTERVAL)
+
+def start_db():
+    """Start connecting without blocking startup; see _monitor_db."""
+    global _monitor_task
+    if not MONGO_CONFIGURED:
+        _connect_attempted.set()
+        return
+    if _monitor_task is None or _monitor_task.done():
+        _monitor_task = asyncio.create_task(_monitor_db())
+
+async def wait_for_db(timeout=MONGO_STARTUP_WAIT):
+    """
+    Hold a request until the first connection attempt has finished, so early
+    requests are not written to local storage while Mongo is still connecting.
+    """
+    if _connect_attempted.is_set() or _monitor_task is None:
+        return
+    try:
+        await asyncio.wait_for(_connect_attempted.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+def local_store_allowed():
+    return not MONGO_CONFIGURED or MONGO_LOCAL_FALLBACK
+
+def db_status():
+    return {
+        "backend": "mongodb" if using_mongodb else LOCAL_BACKEND if local_store_allowed() else "unavailable",
+        "ready": _connect_attempted.is_set() and (
+            using_mongodb or not MONGO_CONFIGURED or (MONGO_LOCAL_FALLBACK and not READY_REQUIRES_MONGO)
+        ),
+        "mongodb": {
+            "configured": MONGO_CONFIGURED,
+            "connected": using_mongodb,
+            "last_attempt": mongo_status["last_attempt"],
+            "last_error": mongo_status["last_error"],
+        },
+    }
+
+async def close_db():
+    global using_mongodb, _monitor_task
+    if _monitor_task is not None:
+        _monitor_task.cancel()
+        try:
+            await _monitor_task
+        except asyncio.CancelledError:
+            pass
+        _monitor_task = None
     using_mongodb = False
+    if client is not None:
+        await client.close()
+    local_db.close()
+
+def instrumented(func):
+    """Time a database operation into db_operation_duration_seconds and the request's "db" stage."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        await wait_for_db()
+        backend = "mongodb" if using_mongodb else LOCAL_BACKEND
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with timed("db"):
+                result = await func(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            db_seconds.observe(time.perf_counter() - started, operation=func.__name__, backend=backend, outcome=outcome)
+    return wrapper
+
+async def _local(method, *args):
+    if not local_store_allowed():
+        raise DatabaseUnavailable()
+    if local_db.blocking:
+        return await asyncio.to_thread(getattr(local_db, method), *args)
+    return getattr(local_db, method)(*args)
 
 def serialize_id(item):
     if isinstance(item, dict) and item.get("_id"):
@@ -100,108 +297,350 @@ class TripResponse(TripBase):
     created_at: datetime
     updated_at: datetime
 
-def find_user_by_email(email):
+@instrumented
+async def find_user_by_email(email):
     try:
         if using_mongodb:
-            user = users_collection.find_one({"email": email})
+            user = await users_collection.find_one({"email": email})
             return serialize_id(user) if user else None
         else:
-            for user in in_memory_db["users"]:
-                if user.get("email") == email:
-                    return serialize_id(user)
-            return None
+            return serialize_id(await _local("find_user_by_email", email))
     except Exception as e:
         logger.error(f"Error finding user by email: {e}")
-        for user in in_memory_db["users"]:
-            if user.get("email") == email:
-                return serialize_id(user)
-        return None
+        return serialize_id(await _local("find_user_by_email", email))
 
-def insert_user(user_data):
+@instrumented
+async def insert_user(user_data):
     try:
         if using_mongodb:
-            result = users_collection.insert_one(user_data)
+            result = await users_collection.insert_one(user_data)
             return str(result.inserted_id)
         else:
-            user_id = str(ObjectId())
-            user_data["_id"] = user_id
-            in_memory_db["users"].append(user_data)
-            return user_id
+            return await _local("insert_user", user_data)
     except Exception as e:
         logger.error(f"Error inserting user: {e}")
-        user_id = str(ObjectId())
-        user_data["_id"] = user_id
-        in_memory_db["users"].append(user_data)
-        return user_id
+        return await _local("insert_user", user_data)
+
+@instrumented
+async def update_user(email, fields):
+    try:
+        if using_mongodb:
+            result = await users_collection.update_one({"email": email}, {"$set": fields})
+            return result.modified_count
+        else:
+            return await _local("update_user", email, fields)
+    except Exception as e:
+        logger.error(f"Error updating user: {e}")
+        return await _local("update_user", email, fields)
 
-def find_trip(trip_id, user_id=None):
+@instrumented
+async def find_trip(trip_id, user_id=None):
     try:
         if using_mongodb:
             query = {"_id": ObjectId(trip_id)}
             if user_id:
                 query["user_id"] = user_id
-            trip = trips_collection.find_one(query)
+            trip = await trips_collection.find_one(query)
             return serialize_id(trip) if trip else None
         else:
-            for trip in in_memory_db["trips"]:
-                if str(trip.get("_id")) == trip_id and (not user_id or trip.get("user_id") == user_id):
-                    return serialize_id(trip)
-            return None
+            return serialize_id(await _local("find_trip", trip_id, user_id))
     except Exception as e:
         logger.error(f"Error finding trip: {e}")
-        for trip in in_memory_db["trips"]:
-            if str(trip.get("_id")) == trip_id and (not user_id or trip.get("user_id") == user_id):
-                return serialize_id(trip)
-        return None
+        return serialize_id(await _local("find_trip", trip_id, user_id))
 
-def find_trips_by_user(user_id):
+@instrumented
+async def find_trips_by_user(user_id, fields=None):
+    """
+    fields: optional list of (dotted) field paths to return instead of whole documents.
+    """
     try:
         if using_mongodb:
-            trips = list(trips_collection.find({"user_id": user_id}))
-            return [serialize_id(trip) for trip in trips]
+            projection = dict.fromkeys(fields, 1) if fields else None
+            cursor = trips_collection.find({"user_id": user_id}, projection).sort("created_at", ASCENDING)
+            return [serialize_id(trip) async for trip in cursor]
         else:
-            return [serialize_id(trip) for trip in in_memory_db["trips"] if trip.get("user_id") == user_id]
+            trips = await _local("find_trips_by_user", user_id)
+            return [serialize_id(project(trip, fields)) for trip in trips]
     except Exception as e:
         logger.error(f"Error finding trips: {e}")
-        return [serialize_id(trip) for trip in in_memory_db["trips"] if trip.get("user_id") == user_id]
+        trips = await _local("find_trips_by_user", user_id)
+        return [serialize_id(project(trip, fields)) for trip in trips]
+
+@instrumented
+async def find_trips_page(user_id, limit, after=None, fields=None):
+    """
+    Keyset page of a user's trips, newest first. after is the (created_at, id)
+    of the last trip on the previous page.
+    """
+    try:
+        if using_mongodb:
+            query = {"user_id": user_id}
+            if after:
+                created_at, trip_id = after
+                query["$or"] = [
+                    {"created_at": {"$lt": created_at}},
+                    {"created_at": created_at, "_id": {"$lt": ObjectId(trip_id)}},
+                ]
+            projection = dict.fromkeys(fields, 1) if fields else None
+            cursor = trips_collection.find(query, projection).sort(
+                [("created_at", DESCENDING), ("_id", DESCENDING)]
+            ).limit(limit)
+            return [serialize_id(trip) async for trip in cursor]
+        else:
+            trips = await _local("find_trips_page", user_id, limit, after)
+            return [serialize_id(project(trip, fields)) for trip in trips]
+    except Exception as e:
+        logger.error(f"Error finding trips page: {e}")
+        trips = await _local("find_trips_page", user_id, limit, after)
+        return [serialize_id(project(trip, fields)) for trip in trips]
+
+async def iter_trips_by_user(user_id, batch_size=500, fields=None):
+    """
+    Async generator over all of a user's trips, newest first, fetched in
+    keyset pages of batch_size so memory stays flat however many there are.
+    """
+    await wait_for_db()
+    after = None
+    while True:
+        trips = await find_trips_page(user_id, batch_size, after, fields)
+        for trip in trips:
+            yield trip
+        if len(trips) < batch_size:
+            return
+        created_at = trips[-1].get("created_at")
+        after = (created_at if isinstance(created_at, datetime) else datetime.min, str(trips[-1]["id"]))
 
-def insert_trip(trip_data):
+@instrumented
+async def trip_usage(user_id):
+    """
+    Number of trips a user has saved and the total size of their payloads in bytes.
+    """
     try:
         if using_mongodb:
-            result = trips_collection.insert_one(trip_data)
+            pipeline = [
+                {"$match": {"user_id": user_id}},
+                {"$group": {"_id": None, "count": {"$sum": 1}, "bytes": {"$sum": {"$ifNull": ["$data_size", 0]}}}},
+            ]
+            cursor = await trips_collection.aggregate(pipeline)
+            async for row in cursor:
+                return {"count": row["count"], "bytes": row["bytes"]}
+            return {"count": 0, "bytes": 0}
+        else:
+            return await _local("trip_usage", user_id)
+    except Exception as e:
+        logger.error(f"Error computing trip usage: {e}")
+        return await _local("trip_usage", user_id)
+
+async def _bump_trips_version(user_id, count=1):
+    """
+    Advance the user's trips version after a Mongo write. Errors are only
+    logged: the write itself succeeded and must not be retried locally.
+    """
+    try:
+        await trip_versions_collection.update_one({"_id": user_id}, {"$inc": {"version": count}}, upsert=True)
+    except Exception as e:
+        logger.error(f"Error updating trips version: {e}")
+
+@instrumented
+async def trips_version(user_id):
+    """
+    A counter that every insert and delete of the user's trips advances, from
+    any process, so cached views of them can be checked with one key lookup.
+    """
+    try:
+        if using_mongodb:
+            doc = await trip_versions_collection.find_one({"_id": user_id})
+            return doc["version"] if doc else 0
+        else:
+            return await _local("trips_version", user_id)
+    except Exception as e:
+        logger.error(f"Error finding trips version: {e}")
+        return await _local("trips_version", user_id)
+
+@instrumented
+async def insert_trip(trip_data):
+    try:
+        if using_mongodb:
+            result = await trips_collection.insert_one(trip_data)
+            await _bump_trips_version(trip_data.get("user_id"))
             return str(result.inserted_id)
         else:
-            trip_id = str(ObjectId())
-            trip_data["_id"] = trip_id
-            in_memory_db["trips"].append(trip_data)
-            return trip_id
+            return await _local("insert_trip", trip_data)
     except Exception as e:
         logger.error(f"Error inserting trip: {e}")
-        trip_id = str(ObjectId())
-        trip_data["_id"] = trip_id
-        in_memory_db["trips"].append(trip_data)
-        return trip_id
+        return await _local("insert_trip", trip_data)
+
+@instrumented
+async def insert_trips(trips):
+    """
+    Insert a batch of trips with one write. Returns the ids of the trips that
+    were inserted; trips whose (user_id, import_key) already exists are
+    skipped instead of failing the batch.
+    """
+    try:
+        if using_mongodb:
+            try:
+                result = await trips_collection.insert_many(trips, ordered=False)
+                inserted = [str(trip_id) for trip_id in result.inserted_ids]
+            except BulkWriteError as e:
+                failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                inserted = [str(trip["_id"]) for index, trip in enumerate(trips) if index not in failed]
+            if inserted:
+                await _bump_trips_version(trips[0].get("user_id"), len(inserted))
+            return inserted
+        else:
+            return await _local("insert_trips", trips)
+    except Exception as e:
+        logger.error(f"Error inserting trips: {e}")
+        return await _local("insert_trips", trips)
+
+@instrumented
+async def find_trip_keys(user_id, keys):
+    """Which of keys are already the id or import_key of one of the user's trips."""
+    keys = list(keys)
+    try:
+        if using_mongodb:
+            object_ids = [ObjectId(key) for key in keys if ObjectId.is_valid(key)]
+            query = {
+                "user_id": user_id,
+                "$or": [{"import_key": {"$in": keys}}, {"_id": {"$in": object_ids}}],
+            }
+            found = set()
+            async for trip in trips_collection.find(query, {"import_key": 1}):
+                found.add(str(trip["_id"]))
+                if trip.get("import_key"):
+                    found.add(trip["import_key"])
+            return found & set(keys)
+        else:
+            return await _local("find_trip_keys", user_id, keys)
+    except Exception as e:
+        logger.error(f"Error finding trip keys: {e}")
+        return await _local("find_trip_keys", user_id, keys)
+
+@instrumented
+async def find_referenced_blobs(digests):
+    """
+    Which of digests are still the data_blob of some trip, in Mongo (when
+    connected) and in local storage. Unlike the other queries this does not
+    fall back on errors: a missed reference would let a live blob be deleted.
+    """
+    digests = list(digests)
+    found = await _local("find_referenced_blobs", digests)
+    if using_mongodb:
+        found |= set(await trips_collection.distinct("data_blob", {"data_blob": {"$in": digests}}))
+    elif STORAGE_BACKEND == "mongodb" and MONGODB_URI:
+        raise RuntimeError("MongoDB is configured but not connected, so blob references cannot be checked")
+    return found
 
-def delete_trip(trip_id, user_id):
+@instrumented
+async def delete_trip(trip_id, user_id):
     try:
         if using_mongodb:
-            result = trips_collection.delete_one({"_id": ObjectId(trip_id), "user_id": user_id})
+            result = await trips_collection.delete_one({"_id": ObjectId(trip_id), "user_id": user_id})
+            if result.deleted_count:
+                await _bump_trips_version(user_id)
             return result.deleted_count
         else:
-            trip_index = next((i for i, trip in enumerate(in_memory_db["trips"]) 
-                            if str(trip.get("_id")) == trip_id and trip.get("user_id") == user_id), -1)
-            if trip_index >= 0:
-                in_memory_db["trips"].pop(trip_index)
-                return 1
-            return 0
+            return await _local("delete_trip", trip_id, user_id)
     except Exception as e:
         logger.error(f"Error deleting trip: {e}")
-        trip_index = next((i for i, trip in enumerate(in_memory_db["trips"]) 
-                        if str(trip.get("_id")) == trip_id and trip.get("user_id") == user_id), -1)
-        if trip_index >= 0:
-            in_memory_db["trips"].pop(trip_index)
-            return 1
-        return 0
+        return await _local("delete_trip", trip_id, user_id)
+
+@instrumented
+async def insert_job(job):
+    try:
+        if using_mongodb:
+            await jobs_collection.insert_one(job)
+            return job["_id"]
+        else:
+            return await _local("insert_job", job)
+    except Exception as e:
+        logger.error(f"Error inserting job: {e}")
+        return await _local("insert_job", job)
+
+@instrumented
+async def find_job(job_id):
+    try:
+        if using_mongodb:
+            return serialize_id(await jobs_collection.find_one({"_id": job_id}))
+        else:
+            return serialize_id(await _local("find_job", job_id))
+    except Exception as e:
+        logger.error(f"Error finding job: {e}")
+        return serialize_id(await _local("find_job", job_id))
+
+@instrumented
+async def find_job_by_key(dedupe_key):
+    """The most recent job submitted with dedupe_key."""
+    try:
+        if using_mongodb:
+            job = await jobs_collection.find_one({"dedupe_key": dedupe_key}, sort=[("created_at", DESCENDING)])
+            return serialize_id(job)
+        else:
+            return serialize_id(await _local("find_job_by_key", dedupe_key))
+    except Exception as e:
+        logger.error(f"Error finding job by key: {e}")
+        return serialize_id(await _local("find_job_by_key", dedupe_key))
+
+@instrumented
+async def update_job(job_id, fields, expected=None):
+    """
+    Set fields on a job, only if its current values match expected (e.g. it is
+    still leased to this worker). Returns the number of jobs updated.
+    """
+    try:
+        if using_mongodb:
+            result = await jobs_collection.update_one({"_id": job_id, **(expected or {})}, {"$set": fields})
+            return result.matched_count
+        else:
+            return await _local("update_job", job_id, fields, expected)
+    except Exception as e:
+        logger.error(f"Error updating job: {e}")
+        return await _local("update_job", job_id, fields, expected)
+
+@instrumented
+async def claim_job(owner, lease_expires, now):
+    """
+    Atomically lease the oldest queued job (or a running one whose lease
+    expired, e.g. because its worker died) to owner. Returns the job or None.
+    """
+    try:
+        if using_mongodb:
+            job = await jobs_collection.find_one_and_update(
+                {"$or": [{"status": "queued"}, {"status": "running", "lease_expires": {"$lt": now}}]},
+                {"$set": {"status": "running", "owner": owner, "lease_expires": lease_expires}},
+                sort=[("created_at", ASCENDING)],
+                return_document=ReturnDocument.AFTER
+            )
+            return serialize_id(job)
+        else:
+            return serialize_id(await _local("claim_job", owner, lease_expires, now))
+    except Exception as e:
+        logger.error(f"Error claiming job: {e}")
+        return serialize_id(await _local("claim_job", owner, lease_expires, now))
+
+@instrumented
+async def count_jobs(status):
+    try:
+        if using_mongodb:
+            return await jobs_collection.count_documents({"status": status})
+        else:
+            return await _local("count_jobs", status)
+    except Exception as e:
+        logger.error(f"Error counting jobs: {e}")
+        return await _local("count_jobs", status)
+
+@instrumented
+async def delete_jobs_finished_before(cutoff):
+    try:
+        if using_mongodb:
+            result = await jobs_collection.delete_many({"finished_at": {"$lt": cutoff}})
+            return result.deleted_count
+        else:
+            return await _local("delete_jobs_finished_before", cutoff)
+    except Exception as e:
+        logger.error(f"Error deleting jobs: {e}")
+        return await _local("delete_jobs_finished_before", cutoff)
 
 document_to_dict = serialize_id
            
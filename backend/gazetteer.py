@@ -0,0 +1,251 @@
+import os
+import re
+import bisect
+import difflib
+import logging
+import threading
+import unicodedata
+from dotenv import load_dotenv
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+GAZETTEER_ENABLED = os.getenv("GAZETTEER_ENABLED", "true").lower() == "true"
+GAZETTEER_PATH = os.getenv(
+    "GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cities.tsv")
+)
+GAZETTEER_FUZZY_MIN_LENGTH = int(os.getenv("GAZETTEER_FUZZY_MIN_LENGTH", "6"))
+GAZETTEER_FUZZY_CUTOFF = float(os.getenv("GAZETTEER_FUZZY_CUTOFF", "0.85"))
+GAZETTEER_CACHE_SIZE = int(os.getenv("GAZETTEER_CACHE_SIZE", "4096"))
+GEONAMES_COLUMNS = 19
+
+# Common ways of writing a country that are not its name or ISO code.
+COUNTRY_ALIASES = {
+    "US": ["usa", "united states of america", "america"],
+    "GB": ["uk", "great britain", "britain", "england", "scotland", "wales"],
+    "AE": ["uae", "emirates"],
+    "NL": ["holland"],
+    "CZ": ["czechia"],
+    "KR": ["korea"],
+    "TR": ["turkiye"],
+    "BR": ["brasil"],
+    "DE": ["deutschland"],
+    "ES": ["espana"],
+    "IT": ["italia"],
+}
+
+_MISSING = object()
+
+def normalize_text(text):
+    """Case-, accent- and punctuation-insensitive form of a place name ("São Paulo " -> "sao paulo")."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char)).casefold()
+    text = re.sub(r"[.'’]", "", text)
+    text = re.sub(r"[^\w,]+", " ", text)
+    return " ".join(text.split())
+
+class Gazetteer:
+    """
+    In-memory city index. Lookups try an exact alias, then a close spelling
+    of the whole name; trailing ", country" or ", region" qualifiers narrow
+    the candidates and the most populous one wins. Input with words that are
+    neither part of the name nor a known qualifier ("Vancouver WA") is left
+    unresolved rather than matched loosely. Resolutions are cached, including
+    misses.
+    """
+    def __init__(self, path=GAZETTEER_PATH, fuzzy_min_length=GAZETTEER_FUZZY_MIN_LENGTH,
+                 fuzzy_cutoff=GAZETTEER_FUZZY_CUTOFF):
+        self.path = path
+        self.fuzzy_min_length = fuzzy_min_length
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.places = {}
+        self.aliases = {}
+        self.qualifiers = set()
+        self._sorted_aliases = []
+        self.resolutions = TTLCache(maxsize=GAZETTEER_CACHE_SIZE, ttl=24 * 3600)
+        self.stats = {"exact": 0, "fuzzy": 0, "unresolved": 0}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self):
+        """
+        Read the index once. path is the bundled cities.tsv format, or a GeoNames
+        dump (e.g. cities15000.txt) for wider coverage.
+        """
+        with self._lock:
+            if self._loaded:
+                return
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip() or line.startswith("#"):
+                        continue
+                    columns = line.rstrip("\n").split("\t")
+                    if len(columns) >= GEONAMES_COLUMNS:
+                        self._add_geonames(columns)
+                    else:
+                        self._add_bundled(columns)
+            self._sorted_aliases = sorted(self.aliases)
+            self._loaded = True
+        logger.info(f"Loaded gazetteer: {len(self.places)} places, {len(self.aliases)} aliases")
+
+    def _add_bundled(self, columns):
+        name, aliases, region, country_code, country, lat, lon, population = columns
+        place = {
+            "key": f"{country_code.lower()}:{normalize_text(name).replace(' ', '-')}",
+            "name": name,
+            "region": region,
+            "country": country,
+            "country_code": country_code,
+            "lat": float(lat),
+            "lon": float(lon),
+            "population": int(population or 0),
+        }
+        self._add(place, [name] + [alias for alias in aliases.split("|") if alias])
+
+    def _add_geonames(self, columns):
+        place = {
+            "key": f"geonames:{columns[0]}",
+            "name": columns[1],
+            "region": columns[10],
+            "country": columns[8],
+            "country_code": columns[8],
+            "lat": float(columns[4]),
+            "lon": float(columns[5]),
+            "population": int(columns[14] or 0),
+        }
+        self._add(place, [columns[1], columns[2]] + columns[3].split(","))
+
+    def _add(self, place, names):
+        self.places[place["key"]] = place
+        for name in names:
+            alias = normalize_text(name)
+            if alias and "," not in alias:
+                keys = self.aliases.setdefault(alias, [])
+                if place["key"] not in keys:
+                    keys.append(place["key"])
+        for word in [place["country"], place["region"]] + COUNTRY_ALIASES.get(place["country_code"], []):
+            word = normalize_text(word)
+            if word:
+                self.qualifiers.add(word)
+
+    def _matches(self, place, qualifiers):
+        if not qualifiers:
+            return True
+        names = {
+            place["country_code"].casefold(),
+            normalize_text(place["country"]),
+            normalize_text(place["region"]),
+            *COUNTRY_ALIASES.get(place["country_code"], []),
+        }
+        return all(qualifier in names for qualifier in qualifiers)
+
+    def _fuzzy_matches(self, name):
+        """
+        Aliases spelled like name with the same number of words, so a typo is
+        forgiven but "vancouver wa" never matches "vancouver".
+        """
+        # Only compare against aliases sharing the first letter, to keep this cheap on large indexes.
+        start = bisect.bisect_left(self._sorted_aliases, name[0])
+        end = bisect.bisect_left(self._sorted_aliases, chr(ord(name[0]) + 1))
+        words = len(name.split())
+        close = difflib.get_close_matches(name, self._sorted_aliases[start:end], n=3, cutoff=self.fuzzy_cutoff)
+        return [key for alias in close if len(alias.split()) == words for key in self.aliases[alias]]
+
+    def _split(self, query):
+        """Split "paris, france" (or "paris france") into the name and its qualifiers."""
+        parts = [part.strip() for part in query.split(",") if part.strip()]
+        if not parts:
+            return "", []
+        name, qualifiers = parts[0], parts[1:]
+        if not qualifiers and name not in self.aliases:
+            words = name.split()
+            for size in (3, 2, 1):
+                suffix = " ".join(words[-size:])
+                if len(words) > size and suffix in self.qualifiers:
+                    return " ".join(words[:-size]), [suffix]
+        return name, qualifiers
+
+    def _lookup(self, query):
+        name, qualifiers = self._split(query)
+        if not name:
+            return None, None
+        stages = [("exact", lambda: self.aliases.get(name, []))]
+        if len(name) >= self.fuzzy_min_length:
+            stages.append(("fuzzy", lambda: self._fuzzy_matches(name)))
+        for match, candidates in stages:
+            keys = [key for key in candidates() if self._matches(self.places[key], qualifiers)]
+            if keys:
+                best = max(keys, key=lambda key: self.places[key]["population"])
+                return self.places[best], match
+        return None, None
+
+    def resolve(self, text):
+        """The place text most likely refers to, as a dict with a "match" field, or None."""
+        if not self._loaded:
+            self.load()
+        query = normalize_text(text)
+        cached = self.resolutions.get(query, _MISSING)
+        if cached is not _MISSING:
+            return cached
+        place, match = self._lookup(query)
+        self.stats[match or "unresolved"] += 1
+        result = dict(place, match=match) if place else None
+        self.resolutions.set(query, result)
+        return result
+
+gazetteer = Gazetteer()
+
+def load_gazetteer():
+    if GAZETTEER_ENABLED:
+        gazetteer.load()
+
+def resolve(text):
+    if not GAZETTEER_ENABLED or not text:
+        return None
+    return gazetteer.resolve(text)
+
+def place_key(text):
+    """
+    Stable cache key for a user-typed place: the gazetteer key when it resolves,
+    otherwise its normalized text.
+    """
+    place = resolve(text)
+    return place["key"] if place else normalize_text(text)
+
+def display_name(place):
+    return place["name"] if place["name"] == place["country"] else f"{place['name']}, {place['country']}"
+
+def canonical_name(text):
+    """The name to show users and put in prompts ("paris " -> "Paris, France")."""
+    place = resolve(text)
+    return display_name(place) if place else " ".join(text.split())
+
+def qualified_name(place):
+    """Name, region and country for upstream geocoders, without repeats ("Singapore")."""
+    parts = []
+    for part in (place["name"], place["region"], place["country"]):
+        if part and part not in parts:
+            parts.append(part)
+    return ", ".join(parts)
+
+def coordinates(place):
+    return f"{place['lat']},{place['lon']}"
+
+def describe(text):
+    """Client view of how text was canonicalized, or None when it is not in the index."""
+    place = resolve(text)
+    if place is None:
+        return None
+    return {
+        "key": place["key"],
+        "name": display_name(place),
+        "city": place["name"],
+        "region": place["region"],
+        "country": place["country"],
+        "country_code": place["country_code"],
+        "lat": place["lat"],
+        "lon": place["lon"],
+        "match": place["match"],
+    }
@@ -0,0 +1,48 @@
+import os
+import math
+from datetime import datetime
+from dotenv import load_dotenv
+
+import gazetteer
+from cache import TTLCache
+
+load_dotenv()
+GENERATION_CACHE_TTL = int(os.getenv("GENERATION_CACHE_TTL", str(6 * 3600)))
+GENERATION_CACHE_SIZE = int(os.getenv("GENERATION_CACHE_SIZE", "1000"))
+GENERATION_BUDGET_BUCKET_PCT = float(os.getenv("GENERATION_BUDGET_BUCKET_PCT", "5"))
+GENERATION_LAST_GOOD_TTL = int(os.getenv("GENERATION_LAST_GOOD_TTL", str(7 * 24 * 3600)))
+LAST_GOOD_WARNING = "The planner is temporarily unavailable, so this is an earlier result for the same trip."
+
+generation_cache = TTLCache(maxsize=GENERATION_CACHE_SIZE, ttl=GENERATION_CACHE_TTL)
+last_good = TTLCache(maxsize=GENERATION_CACHE_SIZE, ttl=GENERATION_LAST_GOOD_TTL)
+
+def budget_bucket(budget, pct=GENERATION_BUDGET_BUCKET_PCT):
+    """
+    Map a budget onto geometric buckets pct percent wide, so budgets within a
+    few percent of each other share a cache entry. pct <= 0 disables bucketing.
+    """
+    if pct <= 0 or budget <= 0:
+        return round(budget, 2)
+    return math.floor(math.log(budget) / math.log1p(pct / 100))
+
+def cache_key(kind, place, budget, people, days, group_type):
+    # The prompt embeds today's date, so entries never outlive the day they were generated on.
+    date = datetime.now().strftime("%Y-%m-%d")
+    return (
+        kind,
+        gazetteer.place_key(place),
+        budget_bucket(budget),
+        people,
+        days,
+        getattr(group_type, "value", group_type),
+        date,
+    )
+
+def remember(key, result):
+    """Cache a validated result, and keep it (across days) as the last known good one."""
+    generation_cache.set(key, result)
+    last_good.set(key[:-1], result)
+
+def last_known_good(key):
+    """The most recent result for the same query on any day, for when inference is unavailable."""
+    return last_good.peek(key[:-1])
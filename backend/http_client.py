@@ -0,0 +1,101 @@
+import os
+import time
+import logging
+import httpx
+from dotenv import load_dotenv
+
+from metrics import timed, upstream_seconds
+from resilience import CircuitOpen, policies, retryable_status
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3"))
+KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+
+UPSTREAMS = {
+    "weatherapi": {
+        "base_url": os.getenv("WEATHERAPI_BASE_URL", "https://api.weatherapi.com/v1"),
+        "max_connections": int(os.getenv("WEATHERAPI_MAX_CONNECTIONS", "20")),
+        "timeout": float(os.getenv("WEATHERAPI_TIMEOUT", "5")),
+    },
+    "foursquare": {
+        "base_url": os.getenv("FOURSQUARE_BASE_URL", "https://places-api.foursquare.com"),
+        "max_connections": int(os.getenv("FOURSQUARE_MAX_CONNECTIONS", "20")),
+        "timeout": float(os.getenv("FOURSQUARE_TIMEOUT", "4")),
+    },
+}
+
+_clients = {}
+
+def _build_client(name):
+    config = UPSTREAMS[name]
+    limits = httpx.Limits(
+        max_connections=config["max_connections"],
+        max_keepalive_connections=config["max_connections"],
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+    return httpx.AsyncClient(
+        base_url=config["base_url"],
+        limits=limits,
+        timeout=httpx.Timeout(config["timeout"], connect=CONNECT_TIMEOUT)
+    )
+
+async def start_clients():
+    for name in UPSTREAMS:
+        if name not in _clients or _clients[name].is_closed:
+            _clients[name] = _build_client(name)
+    logger.info(f"Started HTTP clients for upstreams: {', '.join(_clients)}")
+
+async def close_clients():
+    for name, client in list(_clients.items()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.error(f"Error closing HTTP client {name}: {e}")
+    _clients.clear()
+
+def get_client(name):
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _build_client(name)
+        _clients[name] = client
+    return client
+
+async def request(name, method, path, timeout=None, deadline=None, **kwargs):
+    """
+    Send a request to a configured upstream over its pooled client.
+    timeout overrides the upstream default for each attempt (seconds);
+    deadline bounds the whole call including retries and hedges.
+    Calls go through the upstream's resilience policy: idempotent requests
+    are retried on transport errors, 5xx and 429 and hedged when slow, and CircuitOpen
+    is raised while the upstream's circuit breaker is open.
+    """
+    client = get_client(name)
+    if timeout is not None:
+        kwargs["timeout"] = httpx.Timeout(timeout, connect=min(timeout, CONNECT_TIMEOUT))
+    idempotent = method in ("GET", "HEAD")
+    started = time.perf_counter()
+    status = "error"
+    try:
+        with timed(name):
+            response = await policies[name].call(
+                lambda: client.request(method, path, **kwargs),
+                is_failure=retryable_status,
+                retries=None if idempotent else 0,
+                hedge=None if idempotent else False,
+                deadline=deadline
+            )
+        status = response.status_code
+        return response
+    except CircuitOpen:
+        status = "circuit_open"
+        raise
+    except (httpx.TimeoutException, TimeoutError):
+        status = "timeout"
+        raise
+    finally:
+        upstream_seconds.observe(time.perf_counter() - started, upstream=name, status=status)
+
+async def get(name, path, timeout=None, deadline=None, **kwargs):
+    return await request(name, "GET", path, timeout=timeout, deadline=deadline, **kwargs)
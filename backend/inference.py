@@ -0,0 +1,266 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from cache import SingleFlight
+from llm_output import ParseError, extract_json, validate_output
+from prompts import build_repair_prompt
+from metrics import timed, upstream_seconds
+from resilience import policies, retryable_error
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+HF_API_TOKEN = os.getenv("HF_API_TOKEN")
+MODEL_ID = os.getenv("MODEL_ID")
+INFERENCE_CONCURRENCY = int(os.getenv("INFERENCE_CONCURRENCY", "4"))
+INFERENCE_QUEUE_DEPTH = int(os.getenv("INFERENCE_QUEUE_DEPTH", "16"))
+INFERENCE_QUEUE_TIMEOUT = float(os.getenv("INFERENCE_QUEUE_TIMEOUT", "30"))
+INFERENCE_RETRY_AFTER = 5
+LLM_REPAIR_RETRIES = int(os.getenv("LLM_REPAIR_RETRIES", "1"))
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    The HF InferenceClient, built on first use. huggingface_hub is imported
+    here rather than at module load to keep worker start-up fast.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from huggingface_hub import InferenceClient
+                _client = InferenceClient(model=MODEL_ID, token=HF_API_TOKEN)
+    return _client
+
+async def warm_client():
+    """Build the client on a worker thread after start-up, off the request path."""
+    try:
+        await asyncio.to_thread(get_client)
+    except Exception as e:
+        logger.error(f"Failed to initialise inference client: {e}")
+
+def inference_status():
+    return {
+        "ready": bool(MODEL_ID),
+        "configured": bool(MODEL_ID),
+        "client_initialised": _client is not None,
+        "queue_depth": metrics["queue_depth"],
+        "running": metrics["running"],
+    }
+
+_executor = ThreadPoolExecutor(max_workers=INFERENCE_CONCURRENCY, thread_name_prefix="inference")
+_slots = None
+_inflight = SingleFlight()
+
+metrics = {
+    "queue_depth": 0,
+    "running": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "coalesced": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+    "run_seconds_total": 0.0,
+    "run_seconds_max": 0.0,
+}
+
+class InferenceBusy(Exception):
+    """Raised when the inference queue is full or a request waited too long for a slot."""
+    retry_after = INFERENCE_RETRY_AFTER
+
+def _get_slots():
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(INFERENCE_CONCURRENCY)
+    return _slots
+
+def _record(kind, seconds):
+    metrics[f"{kind}_seconds_total"] += seconds
+    metrics[f"{kind}_seconds_max"] = max(metrics[f"{kind}_seconds_max"], seconds)
+
+def check_capacity():
+    """Fail fast with CircuitOpen or InferenceBusy before queueing for a slot."""
+    policies["huggingface"].ensure_available()
+    if metrics["queue_depth"] >= INFERENCE_QUEUE_DEPTH:
+        metrics["rejected"] += 1
+        raise InferenceBusy("Inference queue is full")
+
+@asynccontextmanager
+async def inference_slot():
+    """
+    Admission control: wait (bounded by depth and time) for one of the
+    INFERENCE_CONCURRENCY slots and hold it for the duration of the block.
+    """
+    check_capacity()
+    slots = _get_slots()
+    metrics["queue_depth"] += 1
+    queued_at = time.monotonic()
+    try:
+        await asyncio.wait_for(slots.acquire(), INFERENCE_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        metrics["rejected"] += 1
+        raise InferenceBusy("Timed out waiting for an inference slot")
+    finally:
+        metrics["queue_depth"] -= 1
+    _record("wait", time.monotonic() - queued_at)
+    metrics["running"] += 1
+    started_at = time.monotonic()
+    try:
+        yield
+        metrics["completed"] += 1
+    except BaseException:
+        metrics["failed"] += 1
+        raise
+    finally:
+        metrics["running"] -= 1
+        _record("run", time.monotonic() - started_at)
+        slots.release()
+
+async def generate(prompt):
+    """
+    Run ai_huggingface on the bounded inference pool. Concurrent calls with an
+    identical prompt share a single inference.
+    """
+    key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    if key in _inflight:
+        metrics["coalesced"] += 1
+
+    async def run():
+        async with inference_slot():
+            loop = asyncio.get_running_loop()
+            return await policies["huggingface"].call(
+                lambda: loop.run_in_executor(_executor, ai_huggingface, prompt)
+            )
+
+    with timed("inference"):
+        return await _inflight.do(key, run)
+
+def _parse(text):
+    with timed("validate"):
+        return extract_json(text)
+
+def _validate(kind, data, budget):
+    with timed("validate"):
+        return validate_output(kind, data, budget)
+
+async def structure_output(kind, prompt, text, budget):
+    """
+    Parse and validate raw model output for kind ("plan" or "suggestions").
+    Unparsable output is regenerated once; fields that fail validation or the
+    budget check are re-requested on their own, up to LLM_REPAIR_RETRIES times.
+    Returns (result dict, {field: problem} still outstanding).
+    """
+    try:
+        data = _parse(text)
+    except ParseError as e:
+        logger.warning(f"Unparsable {kind} output, regenerating: {e}")
+        data = _parse(await generate(prompt))
+
+    result, problems = _validate(kind, data, budget)
+    for attempt in range(LLM_REPAIR_RETRIES):
+        if not problems:
+            break
+        logger.info(f"Repairing {kind} fields: {', '.join(problems)}")
+        try:
+            patch = _parse(await generate(build_repair_prompt(prompt, data, problems)))
+        except ParseError as e:
+            logger.warning(f"Unparsable {kind} repair output: {e}")
+            continue
+        data = dict(data)
+        data.update({field: patch[field] for field in problems if field in patch})
+        result, problems = _validate(kind, data, budget)
+
+    if result is None:
+        raise ParseError(f"Model output failed validation: {problems}")
+    if problems:
+        logger.warning(f"Returning {kind} with unresolved problems: {problems}")
+    return result, problems
+
+async def generate_structured(kind, prompt, budget):
+    text = await generate(prompt)
+    return await structure_output(kind, prompt, text, budget)
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+def _status_of(error):
+    return getattr(getattr(error, "response", None), "status_code", None) or type(error).__name__
+
+def ai_huggingface(prompt):
+    messages = [{"role": "user", "content": prompt}]
+    started = time.perf_counter()
+    status = 200
+    try:
+        response = get_client().chat.completions.create(messages)
+    except Exception as e:
+        status = _status_of(e)
+        raise
+    finally:
+        upstream_seconds.observe(time.perf_counter() - started, upstream="huggingface", status=status)
+    return response.choices[0].message.content
+
+async def stream_huggingface(prompt):
+    """
+    Yield completion text chunks as the model produces them.
+    The blocking HF stream is consumed on a worker thread and handed back to
+    the event loop through a queue; closing the generator stops the thread.
+    The stream holds an inference slot until it finishes.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+    finished = object()
+
+    def produce():
+        started = time.perf_counter()
+        status = 200
+        try:
+            messages = [{"role": "user", "content": prompt}]
+            for chunk in get_client().chat.completions.create(messages, stream=True):
+                if stop.is_set():
+                    break
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if text:
+                    loop.call_soon_threadsafe(queue.put_nowait, text)
+        except Exception as e:
+            status = _status_of(e)
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            upstream_seconds.observe(time.perf_counter() - started, upstream="huggingface_stream", status=status)
+            loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+    policy = policies["huggingface"]
+    async with inference_slot():
+        policy.check()
+        loop.run_in_executor(_executor, produce)
+        started = time.monotonic()
+        success = None
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    # Client errors leave the breaker alone, like in UpstreamPolicy.call.
+                    success = False if retryable_error(item) else None
+                    raise item
+                yield item
+            success = True
+        finally:
+            stop.set()
+            if success is None:
+                policy.breaker.release()
+            else:
+                policy.record(success, time.monotonic() - started)
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+import inference
+import generation
+from prompts import build_plan_prompt
+from resilience import CircuitOpen
+from database import (
+    serialize_id, insert_job, find_job, find_job_by_key, update_job, claim_job, count_jobs, delete_jobs_finished_before
+)
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", os.getenv("INFERENCE_CONCURRENCY", "4")))
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "100"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_PRUNE_INTERVAL = 60
+JOB_POLL_AFTER = 2
+
+class JobQueueFull(Exception):
+    """Raised when JOB_QUEUE_LIMIT jobs are already waiting for a worker."""
+    retry_after = 10
+
+def _finished(status, result=None, warnings=(), error=None, cached=False):
+    return {
+        "status": status,
+        "result": result,
+        "warnings": list(warnings),
+        "error": error,
+        "cached": cached,
+        "finished_at": time.time(),
+        "lease_expires": None,
+    }
+
+class JobManager:
+    """
+    Background plan generation. Jobs are stored in the database, so any worker
+    process can answer status polls, event streams and saves for them. Every
+    process runs a fixed pool of worker tasks that lease queued jobs and renew
+    the lease while generating; a job whose worker died is picked up again
+    once its lease (JOB_LEASE_SECONDS) expires. Jobs are deduplicated per user
+    on the generation cache key and kept for JOB_RESULT_TTL seconds after
+    they finish.
+
+    With STORAGE_BACKEND=memory jobs only exist in the process that created
+    them, so run a single worker or use the SQLite or Mongo backend.
+    """
+    def __init__(self, workers=JOB_WORKERS, queue_limit=JOB_QUEUE_LIMIT, result_ttl=JOB_RESULT_TTL,
+                 lease_seconds=JOB_LEASE_SECONDS):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.result_ttl = result_ttl
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = None
+        self._tasks = []
+        self._last_prune = 0.0
+        self.stats = {"submitted": 0, "deduplicated": 0, "completed": 0, "failed": 0, "fallbacks": 0}
+
+    def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _expired(self, job):
+        return bool(job["finished_at"]) and job["finished_at"] < time.time() - self.result_ttl
+
+    async def _prune(self):
+        now = time.time()
+        if now - self._last_prune >= JOB_PRUNE_INTERVAL:
+            self._last_prune = now
+            await delete_jobs_finished_before(now - self.result_ttl)
+
+    async def get(self, job_id, user_id):
+        job = await find_job(job_id)
+        if job is None or job["user_id"] != user_id or self._expired(job):
+            return None
+        return job
+
+    async def submit(self, user_id, params, no_cache=False):
+        """
+        Queue a plan job for params (destination, budget, people, days, group_type).
+        Returns (job, deduplicated). A pending or finished job for the same user
+        and query is returned instead of starting a new one, unless no_cache.
+        """
+        cache_key = generation.cache_key(
+            "plan", params["destination"], params["budget"], params["people"], params["days"], params["group_type"]
+        )
+        dedupe_key = json.dumps([user_id, *cache_key], separators=(",", ":"))
+        existing = None if no_cache else await find_job_by_key(dedupe_key)
+        if existing and existing["status"] != "failed" and not self._expired(existing):
+            self.stats["deduplicated"] += 1
+            return existing, True
+
+        job = {
+            "_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "kind": "plan",
+            "status": "queued",
+            "params": params,
+            "result": None,
+            "warnings": [],
+            "error": None,
+            "cached": False,
+            "trip_id": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "cache_key": list(cache_key),
+            "dedupe_key": dedupe_key,
+            "owner": None,
+            "lease_expires": None,
+        }
+        cached = None if no_cache else generation.generation_cache.get(cache_key)
+        if cached is not None:
+            job.update(_finished("done", result=cached, cached=True))
+        elif await count_jobs("queued") >= self.queue_limit:
+            raise JobQueueFull("Too many plan jobs are queued")
+        await insert_job(job)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        self.stats["submitted"] += 1
+        return serialize_id(job), False
+
+    async def wait(self, job, timeout):
+        """The job once its status differs from job's, or after timeout; None if it expired meanwhile."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(JOB_POLL_INTERVAL, max(0, deadline - time.monotonic())))
+            current = await self.get(job["id"], job["user_id"])
+            if current is None or current["status"] != job["status"]:
+                return current
+        return job
+
+    async def record_trip(self, job_id, trip_id):
+        """Remember the trip a job was saved as. Returns False if another request saved it first."""
+        return bool(await update_job(job_id, {"trip_id": trip_id}, {"trip_id": None}))
+
+    async def _work(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                now = time.time()
+                job = await claim_job(self.owner, now + self.lease_seconds, now)
+                if job is not None:
+                    await self._run(job)
+                    continue
+                await self._prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Plan job worker error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _renew(self, job_id):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await update_job(job_id, {"lease_expires": time.time() + self.lease_seconds}, {"owner": self.owner})
+
+    async def _finish(self, job_id, fields):
+        if not await update_job(job_id, fields, {"owner": self.owner, "status": "running"}):
+            logger.warning(f"Plan job {job_id} was taken over by another worker before it finished here")
+
+    async def _run(self, job):
+        job_id = job["id"]
+        await update_job(job_id, {"started_at": time.time()}, {"owner": self.owner})
+        renew = asyncio.create_task(self._renew(job_id))
+        params = job["params"]
+        cache_key = tuple(job["cache_key"])
+        try:
+            prompt = build_plan_prompt(
+                params["destination"], params["budget"], params["people"], params["days"], params["group_type"]
+            )
+            try:
+                result, problems = await inference.generate_structured("plan", prompt, params["budget"])
+            except CircuitOpen:
+                fallback = generation.last_known_good(cache_key)
+                if fallback is None:
+                    raise
+                self.stats["fallbacks"] += 1
+                self.stats["completed"] += 1
+                await self._finish(job_id, _finished(
+                    "done", result=fallback, warnings=[generation.LAST_GOOD_WARNING], cached=True
+                ))
+                return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Plan job {job_id} failed: {e}")
+            self.stats["failed"] += 1
+            await self._finish(job_id, _finished("failed", error="Generation failed"))
+            return
+        finally:
+            renew.cancel()
+        if not problems:
+            generation.remember(cache_key, result)
+        self.stats["completed"] += 1
+        await self._finish(job_id, _finished("done", result=result, warnings=problems.values()))
+
+def job_status(job):
+    """Public view of a job; the result is included once it is done."""
+    view = {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "params": job["params"],
+        "created_at": job["created_at"],
+        "finished_at": job["finished_at"],
+        "trip_id": job["trip_id"],
+    }
+    if job["status"] == "done":
+        view.update({"plan": job["result"], "cached": job["cached"], "warnings": job["warnings"]})
+    elif job["status"] == "failed":
+        view["error"] = job["error"]
+    else:
+        view["poll_after"] = JOB_POLL_AFTER
+    return view
+
+def trip_payload(job):
+    """The saved-trip data for a finished plan job, in the shape the frontend saves."""
+    params = job["params"]
+    return {
+        "formParams": {
+            "destination": params["destination"],
+            "budget": params["budget"],
+            "people": params["people"],
+            "days": params["days"],
+            "groupType": params["group_type"],
+        },
+        "planData": job["result"],
+    }
+
+job_manager = JobManager()
@@ -0,0 +1,247 @@
+import re
+import json
+import logging
+from typing import Annotated, List, Optional
+from pydantic import BaseModel, BeforeValidator, ValidationError
+
+logger = logging.getLogger(__name__)
+
+BUDGET_TOLERANCE = 0.05
+
+class ParseError(ValueError):
+    pass
+
+def parse_cost(value):
+    if isinstance(value, str):
+        cleaned = re.sub(r"[^0-9.\-]", "", value)
+        return float(cleaned) if cleaned not in ("", ".", "-") else 0
+    return 0 if value is None else value
+
+Cost = Annotated[float, BeforeValidator(parse_cost)]
+
+class ItineraryDay(BaseModel):
+    day: int
+    activities: List[str] = []
+    notes: str = ""
+    approximate_cost: Optional[Cost] = None
+
+class AccommodationSuggestion(BaseModel):
+    name: str
+    price_per_night: Cost = 0
+    total_cost: Cost = 0
+
+class PlanBudgetBreakdown(BaseModel):
+    accommodation: Cost = 0
+    food: Cost = 0
+    activities: Cost = 0
+    transportation: Cost = 0
+    other: Cost = 0
+    total: Cost = 0
+
+class PlanResult(BaseModel):
+    itinerary: List[ItineraryDay]
+    accommodation_suggestions: List[AccommodationSuggestion] = []
+    local_customs: List[str] = []
+    packing_tips: List[str] = []
+    budget_breakdown: PlanBudgetBreakdown
+
+class CostBreakdown(BaseModel):
+    flights_or_transportation: Cost = 0
+    accommodation: Cost = 0
+    food: Cost = 0
+    activities: Cost = 0
+    other: Cost = 0
+
+class SuggestedDestination(BaseModel):
+    destination: str
+    reason: str = ""
+    estimated_total_cost: Cost = 0
+    cost_breakdown: CostBreakdown = CostBreakdown()
+
+class SuggestionResult(BaseModel):
+    suggested_destinations: List[SuggestedDestination]
+    itinerary_for_top_choice: List[ItineraryDay] = []
+    local_customs: List[str] = []
+    packing_tips: List[str] = []
+    budget_considerations: List[str] = []
+
+SCHEMAS = {
+    "plan": PlanResult,
+    "suggestions": SuggestionResult,
+}
+
+def _scan(text, start=0):
+    """
+    Walk text from start tracking JSON strings and nesting. Returns the index
+    just past the bracket closing the first value, or None with the stack of
+    still-open brackets if the text ends first.
+    """
+    stack = []
+    in_string = False
+    escape = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return index + 1, [], False
+    return None, stack, in_string
+
+def _drop_trailing_commas(text):
+    out = []
+    in_string = False
+    escape = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == ",":
+            rest = text[index + 1:].lstrip()
+            if not rest or rest[0] in "}]":
+                continue
+        out.append(char)
+    return "".join(out)
+
+def _close_truncated(text, stack, in_string):
+    if in_string:
+        text += '"'
+    text = re.sub(r"[\s,.]+$", "", text)
+    if stack and stack[-1] == "}":
+        # Drop a key the cut left without a value.
+        text = re.sub(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*:?$', r"\1", text)
+        text = re.sub(r"[\s,]+$", "", text)
+    return text + "".join(reversed(stack))
+
+def extract_json(text):
+    """
+    Pull the first JSON object out of model output, tolerating code fences,
+    surrounding prose, trailing commas and truncation.
+    """
+    if not isinstance(text, str):
+        raise ParseError("Model output is not text")
+    start = text.find("{")
+    if start < 0:
+        raise ParseError("No JSON object found in model output")
+    end, stack, in_string = _scan(text, start)
+    candidate = text[start:end] if end else text[start:]
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        pass
+    repaired = _drop_trailing_commas(candidate)
+    if end is None:
+        repaired = _close_truncated(repaired, stack, in_string)
+    try:
+        data = json.loads(repaired)
+    except ValueError as e:
+        raise ParseError(f"Could not repair model output: {e}")
+    if not isinstance(data, dict):
+        raise ParseError("Model output is not a JSON object")
+    return data
+
+def budget_problems(kind, result, budget, tolerance=BUDGET_TOLERANCE):
+    limit = budget * (1 + tolerance)
+    if kind == "plan":
+        breakdown = result.budget_breakdown
+        total = breakdown.total or (
+            breakdown.accommodation + breakdown.food + breakdown.activities
+            + breakdown.transportation + breakdown.other
+        )
+        if total > limit:
+            return {"budget_breakdown": f"total {total:.0f} exceeds the budget of {budget:.0f}"}
+    else:
+        over = [
+            destination.destination for destination in result.suggested_destinations
+            if destination.estimated_total_cost > limit
+        ]
+        if over:
+            return {"suggested_destinations": f"{', '.join(over)} exceed the budget of {budget:.0f}"}
+    return {}
+
+def validate_output(kind, data, budget):
+    """
+    Validate parsed model output against the schema for kind.
+    Returns (validated dict or None, {field: problem}) for fields that need fixing.
+    """
+    try:
+        result = SCHEMAS[kind].model_validate(data)
+    except ValidationError as e:
+        problems = {}
+        for error in e.errors():
+            field = str(error["loc"][0]) if error["loc"] else "root"
+            problems.setdefault(field, error["msg"])
+        return None, problems
+    return result.model_dump(), budget_problems(kind, result, budget)
+
+class ItineraryProgress:
+    """
+    Incrementally scans streamed model output and returns each itinerary day
+    object as soon as its closing brace arrives.
+    """
+    def __init__(self, key="itinerary"):
+        self._pattern = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+        self._buffer = ""
+        self._pos = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = None
+        self._done = False
+
+    def feed(self, text):
+        self._buffer += text
+        if self._done:
+            return []
+        if self._pos is None:
+            match = self._pattern.search(self._buffer)
+            if not match:
+                return []
+            self._pos = match.end()
+        days = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0 and char == "{":
+                    self._start = self._pos
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    self._done = True
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._start is not None:
+                    try:
+                        days.append(json.loads(buffer[self._start:self._pos + 1]))
+                    except ValueError as e:
+                        logger.warning(f"Skipping unparsable itinerary day: {e}")
+                    self._start = None
+            self._pos += 1
+        return days
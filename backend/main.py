@@ -1,29 +1,56 @@
-from fastapi import FastAPI, Body, Depends, HTTPException, status
+from fastapi import FastAPI, Body, Depends, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import Annotated, List
+from fastapi.responses import StreamingResponse, JSONResponse
+from typing import Annotated, List, Optional
 from dotenv import load_dotenv
-from huggingface_hub import InferenceClient
 import os
 import json
 import re
+import hashlib
 import random
-import requests
+import asyncio
 from enum import Enum
 from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 
+import http_client
+import metrics
+import places
+import weather
+import generation
+import catalog
+import gazetteer
+from jobs import job_manager, job_status, trip_payload, JobQueueFull
+from prompts import build_suggest_prompt, build_plan_prompt
+import inference
+from inference import InferenceBusy, stream_huggingface
+from llm_output import ItineraryProgress, ParseError
+from trips import (
+    summarize_trip, encode_cursor, decode_cursor, store_trip_data, load_trip_data, listed_trip_data,
+    release_trip_data, start_blob_gc, stop_blob_gc, TripDataMissing
+)
+from blob_store import encode_payload
+from trip_transfer import export_trips, read_ndjson, TripImport
+from trip_search import trip_search, public_doc, SORTS as SEARCH_SORTS
+from resilience import CircuitOpen, CircuitBreaker, UpstreamFailed, policies as upstream_policies
+
 from database import (
     UserResponse as User, 
     UserCreate, UserLogin, Token, 
     TripResponse as Trip,
     TripCreate,
     find_user_by_email, insert_user, find_trip, find_trips_by_user,
-    insert_trip, delete_trip, using_mongodb, serialize_id
+    insert_trip, delete_trip, serialize_id,
+    find_trips_page, trip_usage, start_db, close_db, db_status, TRIP_LIST_FIELDS
 )
 from auth import (
-    get_password_hash, authenticate_user, create_access_token,
+    authenticate_user, create_access_token,
     get_current_user, get_current_active_user,
+    load_principal, invalidate_principal, principal_claims, hash_password, principal_cache,
+    check_login_allowed, record_login_failure, client_address, reset_login_failures, shutdown_password_pool,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 
@@ -31,12 +58,38 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
-HF_API_TOKEN = os.getenv("HF_API_TOKEN")
-MODEL_ID = os.getenv("MODEL_ID")
 API_KEY = os.getenv("WEATHERAPI_KEY")
 FOURSQUARE_API_KEY = os.getenv("FOURSQUARE_API_KEY")
-
-app = FastAPI()
+TRIP_MAX_PAYLOAD_BYTES = int(os.getenv("TRIP_MAX_PAYLOAD_BYTES", str(512 * 1024)))
+TRIP_MAX_PER_USER = int(os.getenv("TRIP_MAX_PER_USER", "1000"))
+TRIP_USER_QUOTA_BYTES = int(os.getenv("TRIP_USER_QUOTA_BYTES", str(50 * 1024 * 1024)))
+MAX_BATCH_CITIES = 10
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await http_client.start_clients()
+    await asyncio.to_thread(gazetteer.load_gazetteer)
+    start_db()
+    warm_inference = asyncio.create_task(inference.warm_client())
+    metrics.start_loop_monitor()
+    await catalog.start_catalog()
+    job_manager.start()
+    start_blob_gc()
+    yield
+    warm_inference.cancel()
+    await stop_blob_gc()
+    await job_manager.stop()
+    await catalog.stop_catalog()
+    await metrics.stop_loop_monitor()
+    await http_client.close_clients()
+    await places.places_cache.close()
+    inference.shutdown()
+    shutdown_password_pool()
+    await close_db()
+
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -45,17 +98,106 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(ParseError)
+async def parse_error_handler(request, exc: ParseError):
+    logger.error(f"Model output error: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_502_BAD_GATEWAY,
+        content={"detail": "The planner returned an invalid response. Please try again."}
+    )
+
+@app.exception_handler(InferenceBusy)
+async def inference_busy_handler(request, exc: InferenceBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "The planner is busy right now. Please try again shortly."},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+UPSTREAM_NAMES = {"huggingface": "The planner", "weatherapi": "The weather service", "foursquare": "The places service"}
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open_handler(request, exc: CircuitOpen):
+    name = UPSTREAM_NAMES.get(exc.upstream, "An upstream service")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": f"{name} is temporarily unavailable. Please try again shortly."},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+def upstream_failure_detail(exc: UpstreamFailed):
+    name = UPSTREAM_NAMES.get(exc.upstream, "An upstream service")
+    if exc.timed_out:
+        return f"{name} did not respond in time. Please try again shortly."
+    return f"{name} could not answer this request. Please try again shortly."
+
+@app.exception_handler(UpstreamFailed)
+async def upstream_failed_handler(request, exc: UpstreamFailed):
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT if exc.timed_out else status.HTTP_502_BAD_GATEWAY,
+        content={"detail": upstream_failure_detail(exc)}
+    )
+
+@app.exception_handler(TripDataMissing)
+async def trip_data_missing_handler(request, exc: TripDataMissing):
+    logger.error(f"Trip data missing: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_410_GONE,
+        content={"detail": "This trip's details are no longer available."}
+    )
+
+@app.exception_handler(JobQueueFull)
+async def job_queue_full_handler(request, exc: JobQueueFull):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many plans are being generated right now. Please try again shortly."},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 class GroupType(str,Enum):
     friends="friends"
     couple="couple"
     family="family"
     solo="solo"
 
-client = InferenceClient(model=MODEL_ID, token=HF_API_TOKEN)
-def ai_huggingface(prompt):
-    messages = [{"role": "user", "content": prompt}]
-    response =client.chat.completions.create(messages)
-    return response.choices[0].message.content
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def replay_cached(result):
+    yield json.dumps(result)
+
+async def stream_generation(kind, prompt, cache_key, budget, itinerary_key, cached=None):
+    progress = ItineraryProgress(itinerary_key)
+    parts = []
+    tokens = replay_cached(cached) if cached is not None else stream_huggingface(prompt)
+    try:
+        async for text in tokens:
+            parts.append(text)
+            yield sse_event("token", {"text": text})
+            for day in progress.feed(text):
+                yield sse_event("day", day)
+        if cached is not None:
+            result, problems = cached, {}
+        else:
+            result, problems = await inference.structure_output(kind, prompt, "".join(parts), budget)
+            if not problems:
+                generation.remember(cache_key, result)
+    except Exception as e:
+        logger.error(f"Streaming generation error: {e}")
+        yield sse_event("error", {"detail": "Generation failed"})
+        return
+    yield sse_event("done", {
+        "result": result,
+        "cached": cached is not None,
+        "warnings": list(problems.values())
+    })
+
+def event_stream_response(events):
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/")
 async def read_root():
@@ -65,25 +207,24 @@ async def read_root():
 async def get_weather(city: str, days: int = 5):
     """
     Fetch weather forecast for a city using weatherapi.com.
+    Responses are cached per canonical place for WEATHER_CACHE_TTL seconds;
+    "place" reports what the city resolved to (null if it is not in the gazetteer).
+    While WeatherAPI's circuit is open the last good forecast is served with
+    "stale": true, or 503 if there is none. Other WeatherAPI failures answer
+    502 (504 on timeout).
     """
+    return {**await resolve_weather(city, days), "place": gazetteer.describe(city)}
+
+async def resolve_weather(city, days=5):
     try:
         if not API_KEY:
             return {"error": "Weather API key not set"}
-        days = min(days, 14)
-        url = f"https://api.weatherapi.com/v1/forecast.json"
-        params = {
-            "key": API_KEY,
-            "q": city,
-            "days": days,
-            "aqi": "no",
-            "alerts": "no"
-        }
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            return {"error": f"Failed to fetch weather: {response.text}"}
-        return response.json()
+        return await weather.get_forecast(city, days)
+    except CircuitOpen:
+        raise
     except Exception as e:
-        return {"error": str(e)}
+        logger.error(f"Exception fetching weather for {city}: {e!r}")
+        raise UpstreamFailed.from_error("weatherapi", e) from e
 
 @app.post("/auth/register", response_model=User)
 async def register_user(user_data: UserCreate):
@@ -98,7 +239,7 @@ async def register_user(user_data: UserCreate):
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Password must be at least 8 characters long"
             )
-        existing_user = find_user_by_email(user_data.email)
+        existing_user = await find_user_by_email(user_data.email)
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -108,12 +249,13 @@ async def register_user(user_data: UserCreate):
         new_user = {
             "email": user_data.email,
             "name": user_data.name,
-            "hashed_password": get_password_hash(user_data.password),
+            "hashed_password": await hash_password(user_data.password),
             "created_at": now,
             "updated_at": now,
             "is_active": True
         }
-        user_id = insert_user(new_user)
+        user_id = await insert_user(new_user)
+        invalidate_principal(new_user["email"])
         new_user["_id"] = user_id
         user = serialize_id(new_user)
         del user["hashed_password"]
@@ -128,27 +270,86 @@ async def register_user(user_data: UserCreate):
         )
 
 @app.post("/auth/login", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    client_ip = client_address(request)
+    check_login_allowed(form_data.username, client_ip)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
+        record_login_failure(form_data.username, client_ip)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    reset_login_failures(form_data.username)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user["email"]}, expires_delta=access_token_expires
+        data=principal_claims(user), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/auth/me", response_model=User)
 async def read_users_me(current_user = Depends(get_current_active_user)):
+    if "created_at" not in current_user:
+        # Principal built from token claims only; fetch the full profile.
+        current_user = await load_principal(current_user["email"]) or current_user
     user = dict(current_user)
     if "hashed_password" in user:
         del user["hashed_password"]
     return user
 
+async def generate_result(kind, prompt, budget, cache_key):
+    """
+    Generate and cache a validated result. While the inference circuit breaker
+    is open, fall back to the last known good result for the same query.
+    Returns (result, cached, warnings).
+    """
+    try:
+        result, problems = await inference.generate_structured(kind, prompt, budget)
+    except CircuitOpen:
+        fallback = generation.last_known_good(cache_key)
+        if fallback is None:
+            raise
+        return fallback, True, [generation.LAST_GOOD_WARNING]
+    if not problems:
+        generation.remember(cache_key, result)
+    return result, False, list(problems.values())
+
+def admit_stream(cache_key, cached):
+    """
+    Fail fast before opening a stream that needs inference; while the circuit
+    is open, replay the last known good result instead if there is one.
+    """
+    if cached is not None:
+        return cached
+    try:
+        inference.check_capacity()
+    except CircuitOpen:
+        cached = generation.last_known_good(cache_key)
+        if cached is None:
+            raise
+    return cached
+
+def user_place(text):
+    """
+    The place as the user typed it, whitespace tidied. Prompts and responses
+    use this; only cache and upstream keys go through the gazetteer, so a
+    region or landmark ("Hawaii", "Machu Picchu") is never swapped for a city.
+    """
+    return " ".join(text.split())
+
+def lookup_suggestions(cache_key, location, budget, people, days, group_type):
+    """
+    Record the query for catalog warming, then serve it from the precomputed
+    catalog or the generation cache if either has it.
+    """
+    if catalog.CATALOG_ENABLED:
+        key = catalog.catalog.observe(location, budget, people, days, group_type)
+        result = catalog.catalog.lookup(key)
+        if result is not None:
+            return result
+    return generation.generation_cache.get(cache_key)
+
 @app.post("/api/suggestions", status_code=status.HTTP_200_OK)
 async def suggest_destinations(
     location: Annotated[str, Body()],
@@ -156,54 +357,19 @@ async def suggest_destinations(
     people: Annotated[int, Body()],
     days: Annotated[int, Body()],
     group_type: Annotated[GroupType, Body()],
+    no_cache: Annotated[bool, Body()] = False,
     current_user = Depends(get_current_active_user)
 ):
-    date = datetime.now().strftime("%Y-%m-%d")
-    prompt_suggest_template = f"""
-    You are a travel assistant specializing in budget-conscious travel recommendations. Based on the user's location ({location}), STRICT budget (${budget}), number of people ({people}), group type ({group_type}), number of days ({days}), and starting date ({date}), suggest destinations that are specifically tailored to these parameters.
-
-    BUDGET CONSTRAINTS ARE CRITICAL:
-    - Only suggest destinations that are realistic to visit with ${budget} for {people} people for {days} days
-    - Consider flight/transportation costs from {location} to each suggested destination
-    - Factor in typical accommodation costs for {people} people
-    - Account for food, local transportation, and activity costs
-
-    TAILOR THE SUGGESTIONS TO:
-    - Group type: {group_type} (suggest destinations with appropriate activities)
-    - Travel period: {days} days (recommend destinations with enough attractions to fill this timeframe)
-    - Starting point: {location} (consider travel time and costs from this location)
-    - Number of travelers: {people} (suggest accommodations and activities suitable for this group size)
-
-    Return ONLY a valid JSON object with this exact structure and field names:
-
-    {{
-      "suggested_destinations": [
-        {{
-          "destination": "",
-          "reason": "",
-          "estimated_total_cost": 0,
-          "cost_breakdown": {{
-            "flights_or_transportation": 0,
-            "accommodation": 0,
-            "food": 0,
-            "activities": 0,
-            "other": 0
-          }}
-        }}
-      ],
-      "itinerary_for_top_choice": [
-        {{"day": 1, "activities": [""], "notes": ""}}
-      ],
-      "local_customs": [""],
-      "packing_tips": [""],
-      "budget_considerations": [""]
-    }}
-
-    IMPORTANT: Only include destinations where the total estimated cost is at or below the user's budget of ${budget}. Be realistic about costs based on current prices.
-    Do not include any explanation, markdown formatting, or code blocks. Return only the valid JSON object.
-    """
-    result = ai_huggingface(prompt_suggest_template)
-    return result
+    location = user_place(location)
+    cache_key = generation.cache_key("suggestions", location, budget, people, days, group_type)
+    if not no_cache:
+        cached = lookup_suggestions(cache_key, location, budget, people, days, group_type)
+        if cached is not None:
+            return {"suggestions": cached, "location": location, "cached": True, "warnings": []}
+    with metrics.timed("prompt"):
+        prompt_suggest_template = build_suggest_prompt(location, budget, people, days, group_type)
+    result, cached, warnings = await generate_result("suggestions", prompt_suggest_template, budget, cache_key)
+    return {"suggestions": result, "location": location, "cached": cached, "warnings": warnings}
 
 @app.post("/api/plans", status_code=status.HTTP_200_OK)
 async def plan_holiday(
@@ -212,104 +378,331 @@ async def plan_holiday(
     people: Annotated[int, Body()],
     days: Annotated[int, Body()],
     group_type: Annotated[GroupType, Body()],
+    no_cache: Annotated[bool, Body()] = False,
+    current_user = Depends(get_current_active_user)
+):
+    destination = user_place(destination)
+    cache_key = generation.cache_key("plan", destination, budget, people, days, group_type)
+    if not no_cache:
+        cached = generation.generation_cache.get(cache_key)
+        if cached is not None:
+            return {"plan": cached, "destination": destination, "cached": True, "warnings": []}
+    with metrics.timed("prompt"):
+        prompt_plan_template = build_plan_prompt(destination, budget, people, days, group_type)
+    result, cached, warnings = await generate_result("plan", prompt_plan_template, budget, cache_key)
+    return {"plan": result, "destination": destination, "cached": cached, "warnings": warnings}
+
+@app.post("/api/suggestions/stream")
+async def suggest_destinations_stream(
+    location: Annotated[str, Body()],
+    budget: Annotated[float, Body()],
+    people: Annotated[int, Body()],
+    days: Annotated[int, Body()],
+    group_type: Annotated[GroupType, Body()],
+    no_cache: Annotated[bool, Body()] = False,
+    current_user = Depends(get_current_active_user)
+):
+    """
+    Server-sent events: "token" chunks as they arrive, a "day" event per complete
+    itinerary_for_top_choice entry, then "done" with the full result (or "error").
+    """
+    location = user_place(location)
+    cache_key = generation.cache_key("suggestions", location, budget, people, days, group_type)
+    cached = None if no_cache else lookup_suggestions(cache_key, location, budget, people, days, group_type)
+    cached = admit_stream(cache_key, cached)
+    prompt = build_suggest_prompt(location, budget, people, days, group_type)
+    return event_stream_response(
+        stream_generation("suggestions", prompt, cache_key, budget, "itinerary_for_top_choice", cached)
+    )
+
+@app.post("/api/plans/stream")
+async def plan_holiday_stream(
+    destination: Annotated[str, Body()],
+    budget: Annotated[float, Body()],
+    people: Annotated[int, Body()],
+    days: Annotated[int, Body()],
+    group_type: Annotated[GroupType, Body()],
+    no_cache: Annotated[bool, Body()] = False,
+    current_user = Depends(get_current_active_user)
+):
+    """
+    Server-sent events: "token" chunks as they arrive, a "day" event per complete
+    itinerary entry, then "done" with the full result (or "error").
+    """
+    destination = user_place(destination)
+    cache_key = generation.cache_key("plan", destination, budget, people, days, group_type)
+    cached = None if no_cache else generation.generation_cache.get(cache_key)
+    cached = admit_stream(cache_key, cached)
+    prompt = build_plan_prompt(destination, budget, people, days, group_type)
+    return event_stream_response(
+        stream_generation("plan", prompt, cache_key, budget, "itinerary", cached)
+    )
+
+@app.post("/api/plans/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_plan_job(
+    response: Response,
+    destination: Annotated[str, Body()],
+    budget: Annotated[float, Body()],
+    people: Annotated[int, Body()],
+    days: Annotated[int, Body()],
+    group_type: Annotated[GroupType, Body()],
+    no_cache: Annotated[bool, Body()] = False,
     current_user = Depends(get_current_active_user)
 ):
-    date = datetime.now().strftime("%Y-%m-%d")
-    prompt_plan_template = f"""
-    You are a travel assistant that specializes in creating realistic and budget-conscious travel plans. Generate a detailed {days}-day travel plan for {people} people ({group_type}) visiting {destination} with a STRICT total budget of {budget} dollars, starting on {date}.
-
-    IMPORTANT BUDGET CONSTRAINTS:
-    - The total cost MUST NOT exceed {budget} dollars for all {people} people
-    - Allocate budget appropriately across accommodations, food, activities, and transportation
-    - Choose accommodations, activities, and dining options that are realistic for the {budget} dollar budget
-    - Consider local cost of living in {destination} when making recommendations
-
-    TAILOR THE PLAN TO THE USER'S SPECIFIC NEEDS:
-    - Group type: {group_type} (adjust activities to be appropriate for this group type)
-    - Number of people: {people} (consider group discounts or family packages if applicable)
-    - Length of stay: {days} days (pace the itinerary appropriately)
-    - Budget: ${budget} (very important - all suggestions must be affordable within this budget)
-
-    Return ONLY a valid JSON object with this exact structure and field names. Do NOT include any example values, explanations, or extra text.
-
-    {{
-      "itinerary": [
-        {{"day": 1, "activities": [""], "notes": "", "approximate_cost": 0}},
-        {{"day": 2, "activities": [""], "notes": "", "approximate_cost": 0}}
-      ],
-      "accommodation_suggestions": [
-        {{"name": "", "price_per_night": 0, "total_cost": 0}}
-      ],
-      "local_customs": [""],
-      "packing_tips": [""],
-      "budget_breakdown": {{
-        "accommodation": 0,
-        "food": 0,
-        "activities": 0,
-        "transportation": 0,
-        "other": 0,
-        "total": 0
-      }}
-    }}
-
-    IMPORTANT: The sum of all costs in the budget_breakdown MUST equal or be less than {budget}. Each suggested activity, hotel, and restaurant must be realistically priced for {destination}.
-    Do not include any explanation, markdown formatting, or code blocks. Return only the valid JSON object.
-    """
-    result = ai_huggingface(prompt_plan_template)
-    return result
+    """
+    Queue plan generation and return a job id straight away. Poll
+    GET /api/plans/jobs/{job_id} or subscribe to .../events for the result.
+    Resubmitting the same query returns the existing job.
+    """
+    params = {
+        "destination": user_place(destination),
+        "budget": budget,
+        "people": people,
+        "days": days,
+        "group_type": group_type.value,
+    }
+    job, deduplicated = await job_manager.submit(current_user["id"], params, no_cache)
+    response.headers["Location"] = f"/api/plans/jobs/{job['id']}"
+    return {**job_status(job), "deduplicated": deduplicated}
+
+async def get_user_job(job_id, current_user):
+    job = await job_manager.get(job_id, current_user["id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/plans/jobs/{job_id}")
+async def get_plan_job(job_id: str, current_user = Depends(get_current_active_user)):
+    return job_status(await get_user_job(job_id, current_user))
+
+@app.get("/api/plans/jobs/{job_id}/events")
+async def plan_job_events(job_id: str, current_user = Depends(get_current_active_user)):
+    """
+    Server-sent events: the current "status", then "done" with the full job
+    (or "error" if it failed). Comments keep idle connections open meanwhile.
+    The job may be running in another worker process; its state is polled
+    from the database.
+    """
+    job = await get_user_job(job_id, current_user)
+
+    async def events():
+        current = job
+        yield sse_event("status", {"status": current["status"]})
+        while current["status"] not in ("done", "failed"):
+            previous = current["status"]
+            current = await job_manager.wait(current, 15)
+            if current is None:
+                yield sse_event("error", {"detail": "Job expired"})
+                return
+            if current["status"] != previous:
+                yield sse_event("status", {"status": current["status"]})
+            else:
+                yield ": keep-alive\n\n"
+        yield sse_event("done" if current["status"] == "done" else "error", job_status(current))
+
+    return event_stream_response(events())
+
+@app.post("/api/plans/jobs/{job_id}/save", status_code=status.HTTP_200_OK)
+async def save_plan_job(job_id: str, current_user = Depends(get_current_active_user)):
+    """Save a finished job's plan as a trip without sending the payload back."""
+    job = await get_user_job(job_id, current_user)
+    if job["status"] != "done":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job is {job['status']}")
+    if job["trip_id"]:
+        return {"message": "Trip already saved", "trip_id": job["trip_id"]}
+    trip_id = await persist_trip(current_user, "plan", trip_payload(job))
+    if not await job_manager.record_trip(job_id, trip_id):
+        # A concurrent save (possibly on another worker) won; keep only its trip.
+        await delete_trip(trip_id, current_user["id"])
+        trip_search.remove(current_user["id"], trip_id)
+        job = await get_user_job(job_id, current_user)
+        return {"message": "Trip already saved", "trip_id": job["trip_id"]}
+    return {"message": "Trip saved successfully", "trip_id": trip_id}
+
+def etag_response(request: Request, payload):
+    with metrics.timed("serialize"):
+        content = jsonable_encoder(payload)
+        body = json.dumps(content, separators=(",", ":"), sort_keys=True)
+        etag = '"' + hashlib.sha1(body.encode("utf-8")).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=content, headers=headers)
 
 @app.get("/api/trips")
-async def get_user_trips(current_user = Depends(get_current_active_user)):
-    trips = find_trips_by_user(current_user["id"])
-    return [
-        {
-            "id": trip.get("id"),
-            "trip_type": trip.get("trip_type"),
-            "data": trip.get("data"),
-            "created_at": trip.get("created_at"),
-            "updated_at": trip.get("updated_at"),
-        }
-        for trip in trips
-    ]
+async def get_user_trips(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = None,
+    summary: bool = False,
+    current_user = Depends(get_current_active_user)
+):
+    """
+    Without limit/cursor returns every trip as a list (legacy shape).
+    With limit, returns {"trips": [...], "next_cursor": ...} pages, newest first.
+    summary=true returns only destination, days, budget, people, group_type,
+    trip_type and dates instead of the trip data. Otherwise "data" holds the
+    trip's form parameters (and top destination), not the full itinerary:
+    use GET /api/trips/{trip_id} for that.
+    """
+    if limit is None and cursor is None:
+        trips = await find_trips_by_user(current_user["id"], fields=TRIP_LIST_FIELDS)
+        page = None
+    else:
+        limit = limit or 20
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        trips = await find_trips_page(current_user["id"], limit, after, fields=TRIP_LIST_FIELDS)
+        page = encode_cursor(trips[-1]) if len(trips) == limit else None
+
+    if summary:
+        items = [summarize_trip(trip) for trip in trips]
+    else:
+        items = [
+            {
+                "id": trip.get("id"),
+                "trip_type": trip.get("trip_type"),
+                "data": listed_trip_data(trip),
+                "created_at": trip.get("created_at"),
+                "updated_at": trip.get("updated_at"),
+            }
+            for trip in trips
+        ]
+    payload = items if limit is None and cursor is None else {"trips": items, "next_cursor": page}
+    return etag_response(request, payload)
+
+@app.get("/api/trips/export")
+async def export_user_trips(current_user = Depends(get_current_active_user)):
+    """
+    Every saved trip of the current user as NDJSON (one trip with its full
+    data per line, newest first), streamed in chunks as it is read.
+    """
+    filename = f"trips-{datetime.utcnow().strftime('%Y%m%d')}.ndjson"
+    return StreamingResponse(
+        export_trips(current_user["id"]),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/api/trips/import", status_code=status.HTTP_200_OK)
+async def import_user_trips(request: Request, current_user = Depends(get_current_active_user)):
+    """
+    Import an NDJSON body in the export format. The body is read as a stream
+    and written in batches. Lines already imported (same idempotency_key or
+    id) are skipped, so a retried upload does not duplicate trips. The usual
+    payload size and per-user quota limits apply.
+    """
+    trip_import = TripImport(
+        current_user["id"],
+        max_payload_bytes=TRIP_MAX_PAYLOAD_BYTES,
+        max_trips=TRIP_MAX_PER_USER,
+        quota_bytes=TRIP_USER_QUOTA_BYTES
+    )
+    return await trip_import.run(read_ndjson(request.stream(), TRIP_MAX_PAYLOAD_BYTES * 2))
+
+@app.get("/api/trips/search")
+async def search_trips(
+    q: Optional[str] = None,
+    destination: Optional[str] = None,
+    country: Optional[str] = None,
+    group_type: Optional[str] = None,
+    trip_type: Optional[str] = None,
+    budget_min: Optional[float] = Query(None, ge=0),
+    budget_max: Optional[float] = Query(None, ge=0),
+    days_min: Optional[int] = Query(None, ge=0),
+    days_max: Optional[int] = Query(None, ge=0),
+    people_min: Optional[int] = Query(None, ge=0),
+    people_max: Optional[int] = Query(None, ge=0),
+    sort: str = "newest",
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_user = Depends(get_current_active_user)
+):
+    """
+    Search the current user's saved trips. q matches destination, location,
+    country and itinerary text (all words, the last as a prefix); the other
+    filters are exact (destination and country understand city/country
+    aliases) or inclusive ranges. Returns the total, a page of trip summaries
+    and facet counts over all matches, e.g. family trips under $2000 to Japan:
+    ?group_type=family&budget_max=2000&country=Japan
+    """
+    if sort not in SEARCH_SORTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"sort must be one of {', '.join(SEARCH_SORTS)}"
+        )
+    total, trips, facets = await trip_search.search(
+        current_user["id"],
+        q=q,
+        filters={"place": destination, "country": country, "group_type": group_type, "trip_type": trip_type},
+        ranges={"budget": (budget_min, budget_max), "days": (days_min, days_max), "people": (people_min, people_max)},
+        sort=sort,
+        limit=limit,
+        offset=offset
+    )
+    return {
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "trips": [public_doc(trip) for trip in trips],
+        "facets": facets,
+    }
 
 @app.get("/api/trips/{trip_id}")
 async def get_trip(trip_id: str, current_user = Depends(get_current_active_user)):
-    trip = find_trip(trip_id, current_user["id"])
+    trip = await find_trip(trip_id, current_user["id"])
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     return {
         "id": trip.get("id"),
         "trip_type": trip.get("trip_type"),
-        "data": trip.get("data"),
+        "data": await load_trip_data(trip),
         "created_at": trip.get("created_at"),
         "updated_at": trip.get("updated_at"),
     }
 
 @app.delete("/api/trips/{trip_id}", status_code=status.HTTP_200_OK)
 async def delete_trip_endpoint(trip_id: str, current_user = Depends(get_current_active_user)):
-    deleted_count = delete_trip(trip_id, current_user["id"])
-    if deleted_count == 0:
+    trip = await find_trip(trip_id, current_user["id"])
+    if not trip or await delete_trip(trip_id, current_user["id"]) == 0:
         raise HTTPException(status_code=404, detail="Trip not found")
+    trip_search.remove(current_user["id"], trip_id)
+    await release_trip_data(trip)
     return {"detail": "Trip deleted successfully"}
 
-@app.post("/api/trips/save", status_code=status.HTTP_200_OK)
-async def save_trip(
-    trip_type: Annotated[str, Body()],
-    data: Annotated[dict, Body()],
-    current_user = Depends(get_current_active_user)
-):
+async def persist_trip(current_user, trip_type, data):
+    """
+    Store a trip payload for current_user after the size and quota checks.
+    Returns the new trip id.
+    """
+    raw = encode_payload(data)
+    if len(raw) > TRIP_MAX_PAYLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Trip is too large to save"
+        )
+    usage = await trip_usage(current_user["id"])
+    if usage["count"] >= TRIP_MAX_PER_USER or usage["bytes"] + len(raw) > TRIP_USER_QUOTA_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Saved trip limit reached. Delete some trips to save new ones."
+        )
     try:
         now = datetime.utcnow()
         new_trip = {
             "user_id": current_user["id"],
             "trip_type": trip_type,
-            "data": data,
             "created_at": now,
             "updated_at": now
         }
-        trip_id = insert_trip(new_trip)
-        new_trip["_id"] = trip_id
-        return {"message": "Trip saved successfully", "trip_id": str(trip_id)}
+        new_trip.update(await store_trip_data(trip_type, data, raw))
+        trip_id = str(await insert_trip(new_trip))
+        trip_search.add(current_user["id"], {**new_trip, "id": trip_id})
+        return trip_id
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error saving trip: {e}")
         raise HTTPException(
@@ -317,6 +710,15 @@ async def save_trip(
             detail="Failed to save trip"
         )
 
+@app.post("/api/trips/save", status_code=status.HTTP_200_OK)
+async def save_trip(
+    trip_type: Annotated[str, Body()],
+    data: Annotated[dict, Body()],
+    current_user = Depends(get_current_active_user)
+):
+    trip_id = await persist_trip(current_user, trip_type, data)
+    return {"message": "Trip saved successfully", "trip_id": trip_id}
+
 async def create_trip(trip_data: TripCreate, current_user) -> Trip:
     now = datetime.utcnow()
     new_trip = {
@@ -332,85 +734,235 @@ async def create_trip(trip_data: TripCreate, current_user) -> Trip:
         "created_at": now,
         "updated_at": now
     }
-    trip_id = insert_trip(new_trip)
+    trip_id = await insert_trip(new_trip)
     new_trip["_id"] = trip_id
     return serialize_id(new_trip)
 
+def collect_cache_metrics():
+    requests = metrics.Counter("cache_requests_total", "Cache lookups by result.", ("cache", "tier", "result"))
+    hit_ratio = metrics.Gauge("cache_hit_ratio", "Fraction of cache lookups served from the cache.", ("cache", "tier"))
+    caches = {
+        ("weather", "memory"): weather.forecast_cache.stats,
+        ("generation", "memory"): generation.generation_cache.stats,
+        ("principal", "memory"): principal_cache.stats,
+        ("catalog", "memory"): catalog.catalog.stats,
+        ("gazetteer", "memory"): gazetteer.gazetteer.resolutions.stats,
+    }
+    for tier, stats in places.places_cache.stats.items():
+        caches[("places", tier)] = stats
+    for (cache, tier), stats in caches.items():
+        served = stats.get("hits", 0) + stats.get("stale_hits", 0)
+        lookups = served + stats.get("misses", 0)
+        for result in ("hits", "stale_hits", "misses"):
+            if result in stats:
+                requests.inc(stats[result], cache=cache, tier=tier, result=result)
+        hit_ratio.set(served / lookups if lookups else 0, cache=cache, tier=tier)
+
+    breaker_state = metrics.Gauge(
+        "circuit_breaker_state", "Upstream circuit breaker state (0 closed, 1 half-open, 2 open).", ("upstream",)
+    )
+    resilience_events = metrics.Counter(
+        "upstream_resilience_events_total", "Retries, hedges and rejected calls per upstream.", ("upstream", "event")
+    )
+    states = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+    for name, policy in upstream_policies.items():
+        breaker_state.set(states[policy.breaker.state], upstream=name)
+        for event in ("retries", "hedged", "hedge_wins", "rejected", "failures"):
+            resilience_events.inc(policy.stats[event], upstream=name, event=event)
+
+    inference_gauge = metrics.Gauge("inference_pool", "Inference admission-control counters.", ("metric",))
+    for name, value in inference.metrics.items():
+        inference_gauge.set(value, metric=name)
+    return [requests, hit_ratio, breaker_state, resilience_events, inference_gauge]
+
+metrics.register_collector(collect_cache_metrics)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of request, stage, upstream, database, cache and event-loop metrics."""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and its event loop is responding."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness per dependency. Returns 503 until the first database connection
+    attempt has finished, and while a configured MongoDB is unreachable (unless
+    MONGO_LOCAL_FALLBACK serves from local storage without READY_REQUIRES_MONGO).
+    Inference and upstream API keys are reported but do not block readiness.
+    """
+    checks = {
+        "database": db_status(),
+        "inference": inference.inference_status(),
+        "weather": {"ready": bool(API_KEY)},
+        "places": {"ready": bool(FOURSQUARE_API_KEY)},
+    }
+    ready = checks["database"]["ready"]
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=jsonable_encoder({"ready": ready, "checks": checks})
+    )
+
 @app.get("/debug/ping")
 async def debug_ping():
     return {"status": "ok", "timestamp": datetime.now().isoformat()}
 
+@app.get("/debug/cache")
+async def debug_cache():
+    return {
+        "weather": weather.forecast_cache.stats,
+        "places": places.places_cache.stats,
+        "generation": generation.generation_cache.stats,
+        "catalog": {**catalog.catalog.stats, "entries": len(catalog.catalog.entries)},
+        "gazetteer": {**gazetteer.gazetteer.stats, "cache": gazetteer.gazetteer.resolutions.stats},
+        "jobs": {**job_manager.stats, "owner": job_manager.owner},
+        "trip_search": {**trip_search.stats, "indexes": len(trip_search.indexes)},
+    }
+
+@app.get("/debug/upstreams")
+async def debug_upstreams():
+    return {name: policy.status() for name, policy in upstream_policies.items()}
+
+@app.get("/debug/inference")
+async def debug_inference():
+    return inference.metrics
+
 @app.post("/debug/echo")
 async def debug_echo(data: dict):
     return {"status": "ok", "received": data}
 
-@app.get("/places/{city}")
-async def get_places(city: str, limit: int = 8, section: str = "food"):
-    """
-    Fetch suggested restaurants and hotels for a city using Foursquare Places API (new endpoint).
-    section: "food" for restaurants, "hotel" for hotels, or "all" for both.
-    """
+def parse_categories(categories):
+    cat_ids = [cat_id.strip() for cat_id in categories.split(",") if cat_id.strip()]
+    if len(cat_ids) > places.MAX_CATEGORIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {places.MAX_CATEGORIES} categories per request"
+        )
+    return cat_ids
+
+async def resolve_places(city, section="food", cat_ids=None):
     try:
         if not FOURSQUARE_API_KEY:
             return {"error": "Foursquare API key not set"}
-        url = "https://places-api.foursquare.com/places/search"
-        headers = {
-            "Authorization": f"Bearer {FOURSQUARE_API_KEY}",
-            "X-Places-Api-Version": "2025-06-17",
-            "Accept": "application/json"
-        }
-        results = {}
-
-        RESTAURANT_CAT = "4d4b7105d754a06374d81259"
-        HOTEL_CAT = "4bf58dd8d48988d1fa931735"
-
-        def get_icon_url(categories):
-            if categories and isinstance(categories, list) and categories[0].get("icon"):
-                icon = categories[0]["icon"]
-                return f"{icon['prefix']}64{icon['suffix']}"
-            return None
-
-        def fetch_section_cat(cat_id):
-            params = {
-                "near": city,
-                "limit": 4,
-                "sort": "RELEVANCE",
-                "fsq_category_ids": cat_id
-            }
-            resp = requests.get(url, headers=headers, params=params)
-            if resp.status_code != 200:
-                logger.error(f"Foursquare API error: {resp.status_code} {resp.text}")
-                return []
-            data = resp.json()
-            return [
-                {
-                    "name": place.get("name"),
-                    "address": place.get("location", {}).get("formatted_address", ""),
-                    "categories": [cat.get("name") for cat in place.get("categories", [])],
-                    "icon": get_icon_url(place.get("categories", [])),
-                    "rating": place.get("rating"),
-                    "fsq_id": place.get("fsq_place_id"),
-                    "website": place.get("website"),
-                }
-                for place in data.get("results", [])
-            ]
-
-        if section == "all":
-            results["restaurants"] = fetch_section_cat(RESTAURANT_CAT)
-            results["hotels"] = fetch_section_cat(HOTEL_CAT)
-        elif section == "hotel":
-            results["hotels"] = fetch_section_cat(HOTEL_CAT)
-        else:
-            results["restaurants"] = fetch_section_cat(RESTAURANT_CAT)
-
-        if (
-            (section == "all" and not results["restaurants"] and not results["hotels"])
-            or (section == "food" and not results["restaurants"])
-            or (section == "hotel" and not results["hotels"])
-        ):
-            logger.warning(f"No Foursquare results for city={city}, section={section}")
 
+        if cat_ids:
+            fetched, failed = await places.fetch_categories(city, cat_ids)
+            results = {"categories": fetched}
+        else:
+            sections = places.SECTION_CATEGORIES.get(section, places.SECTION_CATEGORIES["food"])
+            fetched, failed = await places.fetch_categories(city, sections.values())
+            results = {name: fetched.get(cat_id, []) for name, cat_id in sections.items()}
+            if not any(results.values()):
+                logger.warning(f"No Foursquare results for city={city}, section={section}")
+
+        if failed:
+            results["partial"] = True
+            results["failed_categories"] = failed
         return results
+    except (CircuitOpen, UpstreamFailed):
+        raise
     except Exception as e:
-        logger.error(f"Exception in /places/{city}: {e}")
-        return {"error": str(e)}
+        logger.error(f"Exception fetching places for {city}: {e!r}")
+        raise UpstreamFailed.from_error("foursquare", e) from e
+
+@app.get("/places/{city}")
+async def get_places(city: str, limit: int = 8, section: str = "food", categories: Optional[str] = None):
+    """
+    Fetch suggested restaurants and hotels for a city using Foursquare Places API (new endpoint).
+    section: "food" for restaurants, "hotel" for hotels, or "all" for both.
+    categories: optional comma-separated Foursquare category IDs, fetched concurrently
+    and returned under "categories" keyed by ID (overrides section).
+    Cached results are served (stale if need be) while Foursquare's circuit is
+    open; with nothing cached the response is 503. If every category fails
+    otherwise the response is 502 (504 on timeout).
+    """
+    cat_ids = parse_categories(categories) if categories else None
+    return {**await resolve_places(city, section, cat_ids), "place": gazetteer.describe(city)}
+
+async def unless_upstream_fails(lookup):
+    """
+    A batch answers for several upstreams at once, so an open circuit or a
+    failed upstream is reported in its part of the result instead of failing
+    the whole request.
+    """
+    try:
+        return await lookup
+    except CircuitOpen as e:
+        return {"error": str(e), "retry_after": e.retry_after}
+    except UpstreamFailed as e:
+        return {"error": upstream_failure_detail(e)}
+
+async def resolve_destination(city, days, section, cat_ids, include):
+    jobs = {}
+    if "weather" in include:
+        jobs["weather"] = unless_upstream_fails(resolve_weather(city, days))
+    if "places" in include:
+        jobs["places"] = unless_upstream_fails(resolve_places(city, section, cat_ids))
+    results = await asyncio.gather(*jobs.values())
+    return {"city": city, "place": gazetteer.describe(city), **dict(zip(jobs, results))}
+
+@app.get("/destinations/resolve")
+async def resolve_city(q: str):
+    """
+    Canonicalize free-text city input against the gazetteer, e.g. "paris " ->
+    "Paris, France". place is null when the city is not in the index.
+    """
+    return {"query": q, "name": gazetteer.canonical_name(q), "place": gazetteer.describe(q)}
+
+@app.post("/destinations/batch")
+async def get_destinations_batch(
+    cities: Annotated[List[str], Body()],
+    days: Annotated[int, Body()] = 5,
+    section: Annotated[str, Body()] = "all",
+    categories: Annotated[Optional[str], Body()] = None,
+    include: Annotated[List[str], Body()] = ["weather", "places"],
+    stream: Annotated[bool, Body()] = False,
+):
+    """
+    Weather and places for up to MAX_BATCH_CITIES cities in one round trip,
+    resolved concurrently through the shared caches. Spellings of the same
+    city are looked up once. Returns
+    {"destinations": {city: {"weather": ..., "places": ...}}} keyed by each
+    city exactly as given, in request order, or with stream=true a
+    server-sent "destination" event per place as it completes (its "cities"
+    are the spellings it answers) followed by "done".
+    """
+    spellings = {}
+    for city in cities:
+        if city.strip():
+            names = spellings.setdefault(gazetteer.place_key(city), [])
+            if city not in names:
+                names.append(city)
+    if not spellings:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No cities given")
+    if len(spellings) > MAX_BATCH_CITIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_CITIES} cities per request"
+        )
+    include = [item for item in include if item in ("weather", "places")]
+    cat_ids = parse_categories(categories) if categories else None
+    async def lookup(names):
+        result = await resolve_destination(names[0].strip(), days, section, cat_ids, include)
+        return {**result, "cities": names}
+
+    lookups = [lookup(names) for names in spellings.values()]
+
+    if not stream:
+        by_spelling = {}
+        for result in await asyncio.gather(*lookups):
+            del result["city"]
+            for name in result.pop("cities"):
+                by_spelling[name] = result
+        return {"destinations": {city: by_spelling[city] for city in cities if city in by_spelling}}
+
+    async def events():
+        for lookup in asyncio.as_completed(lookups):
+            yield sse_event("destination", await lookup)
+        yield sse_event("done", {"count": len(lookups)})
+
+    return event_stream_response(events())
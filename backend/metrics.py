@@ -0,0 +1,236 @@
+import os
+import math
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Gauge(Counter):
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus text format, keyed by label values."""
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][index] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {series['sum']!r}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+request_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+stage_seconds = Histogram(
+    "request_stage_duration_seconds", "Time spent in each stage of a request.", ("route", "stage")
+)
+upstream_seconds = Histogram(
+    "upstream_request_duration_seconds", "Upstream API call latency.", ("upstream", "status")
+)
+db_seconds = Histogram(
+    "db_operation_duration_seconds", "Database operation latency.", ("operation", "backend", "outcome")
+)
+loop_lag_seconds = Histogram(
+    "event_loop_lag_seconds", "How late the event loop woke a periodic timer.", buckets=LAG_BUCKETS
+)
+loop_lag_current = Gauge("event_loop_lag_current_seconds", "Most recent event-loop lag sample.")
+
+METRICS = [request_seconds, stage_seconds, upstream_seconds, db_seconds, loop_lag_seconds, loop_lag_current]
+
+_collectors = []
+
+def register_collector(collect):
+    """
+    Register a callable that returns metric objects (Counter/Gauge/Histogram)
+    built at scrape time, e.g. from a module's existing stats dict.
+    """
+    _collectors.append(collect)
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        try:
+            for metric in collect():
+                lines.extend(metric.render())
+        except Exception as e:
+            logger.error(f"Metrics collector failed: {e}")
+    return "\n".join(lines) + "\n"
+
+_stages = ContextVar("request_stages", default=None)
+
+@contextmanager
+def timed(stage):
+    """
+    Time a block as a named stage of the current request. Stages feed the
+    request_stage_duration_seconds histogram and the Server-Timing header.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages = _stages.get()
+        if stages is not None:
+            stages.append((stage, time.perf_counter() - started))
+
+def _route_of(scope):
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that times every HTTP request by route template, collects
+    the stages recorded with timed() and, when SERVER_TIMING is on, reports
+    them in a Server-Timing response header.
+    """
+    def __init__(self, app, server_timing=SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stages = []
+        token = _stages.set(stages)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing:
+                    message = dict(message)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", self._header(stages, time.perf_counter() - started).encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _stages.reset(token)
+            route = _route_of(scope)
+            request_seconds.observe(
+                time.perf_counter() - started, method=scope["method"], route=route, status=status_code
+            )
+            for stage, seconds in stages:
+                stage_seconds.observe(seconds, route=route, stage=stage)
+
+    @staticmethod
+    def _header(stages, total):
+        totals = {}
+        for stage, seconds in stages:
+            totals[stage] = totals.get(stage, 0) + seconds
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items()]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+async def _monitor_loop_lag(interval):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - expected, 0)
+        loop_lag_seconds.observe(lag)
+        loop_lag_current.set(lag)
+
+_lag_task = None
+
+def start_loop_monitor(interval=LOOP_LAG_INTERVAL):
+    global _lag_task
+    if _lag_task is None or _lag_task.done():
+        _lag_task = asyncio.create_task(_monitor_loop_lag(interval))
+
+async def stop_loop_monitor():
+    global _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        try:
+            await _lag_task
+        except asyncio.CancelledError:
+            pass
+        _lag_task = None
@@ -0,0 +1,126 @@
+import os
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+import http_client
+import gazetteer
+from cache import TieredCache, MemoryBackend, SQLiteBackend
+from resilience import CircuitOpen, UpstreamFailed
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+FOURSQUARE_API_KEY = os.getenv("FOURSQUARE_API_KEY")
+CATEGORY_TIMEOUT = float(os.getenv("FOURSQUARE_CATEGORY_TIMEOUT", "3"))
+# Budget for one category including retries and hedges, so it must exceed CATEGORY_TIMEOUT.
+CATEGORY_DEADLINE = float(os.getenv("FOURSQUARE_CATEGORY_DEADLINE", "8"))
+MAX_CATEGORIES = 10
+PLACES_CACHE_BACKENDS = os.getenv("PLACES_CACHE_BACKENDS", "memory,sqlite")
+PLACES_CACHE_PATH = os.getenv("PLACES_CACHE_PATH", os.path.join(".cache", "places.sqlite3"))
+PLACES_CACHE_SIZE = int(os.getenv("PLACES_CACHE_SIZE", "1024"))
+PLACES_CACHE_FRESH_TTL = int(os.getenv("PLACES_CACHE_FRESH_TTL", str(24 * 3600)))
+PLACES_CACHE_STALE_TTL = int(os.getenv("PLACES_CACHE_STALE_TTL", str(7 * 24 * 3600)))
+
+RESTAURANT_CAT = "4d4b7105d754a06374d81259"
+HOTEL_CAT = "4bf58dd8d48988d1fa931735"
+
+SECTION_CATEGORIES = {
+    "food": {"restaurants": RESTAURANT_CAT},
+    "hotel": {"hotels": HOTEL_CAT},
+    "all": {"restaurants": RESTAURANT_CAT, "hotels": HOTEL_CAT},
+}
+
+class PlacesError(Exception):
+    pass
+
+def build_cache_backends(names):
+    backends = []
+    for name in [name.strip() for name in names.split(",") if name.strip()]:
+        if name == "memory":
+            backends.append(MemoryBackend(maxsize=PLACES_CACHE_SIZE, ttl=PLACES_CACHE_STALE_TTL))
+        elif name == "sqlite":
+            backends.append(SQLiteBackend(PLACES_CACHE_PATH, ttl=PLACES_CACHE_STALE_TTL))
+        else:
+            logger.warning(f"Unknown places cache backend: {name}")
+    return backends
+
+places_cache = TieredCache(
+    build_cache_backends(PLACES_CACHE_BACKENDS),
+    fresh_ttl=PLACES_CACHE_FRESH_TTL,
+    stale_ttl=PLACES_CACHE_STALE_TTL
+)
+
+def get_icon_url(categories):
+    if categories and isinstance(categories, list) and categories[0].get("icon"):
+        icon = categories[0]["icon"]
+        return f"{icon['prefix']}64{icon['suffix']}"
+    return None
+
+def format_place(place):
+    return {
+        "name": place.get("name"),
+        "address": place.get("location", {}).get("formatted_address", ""),
+        "categories": [cat.get("name") for cat in place.get("categories", [])],
+        "icon": get_icon_url(place.get("categories", [])),
+        "rating": place.get("rating"),
+        "fsq_id": place.get("fsq_place_id"),
+        "website": place.get("website"),
+    }
+
+async def fetch_category(city, cat_id, limit=4, timeout=CATEGORY_TIMEOUT, deadline=CATEGORY_DEADLINE):
+    headers = {
+        "Authorization": f"Bearer {FOURSQUARE_API_KEY}",
+        "X-Places-Api-Version": "2025-06-17",
+        "Accept": "application/json"
+    }
+    params = {
+        "near": city,
+        "limit": limit,
+        "sort": "RELEVANCE",
+        "fsq_category_ids": cat_id
+    }
+    resp = await http_client.get(
+        "foursquare", "/places/search", headers=headers, params=params, timeout=timeout, deadline=deadline
+    )
+    if resp.status_code != 200:
+        logger.error(f"Foursquare API error: {resp.status_code} {resp.text}")
+        raise PlacesError(f"Foursquare API error: {resp.status_code}")
+    return [format_place(place) for place in resp.json().get("results", [])]
+
+async def get_category(city, cat_id, limit=4, timeout=CATEGORY_TIMEOUT, deadline=CATEGORY_DEADLINE):
+    # Known cities are searched by their full name, so Foursquare geocodes them unambiguously.
+    place = gazetteer.resolve(city)
+    near = gazetteer.qualified_name(place) if place else city
+    key = ("places", gazetteer.place_key(city), cat_id, limit)
+    return await places_cache.get_or_load(key, lambda: fetch_category(near, cat_id, limit, timeout, deadline))
+
+async def fetch_categories(city, cat_ids, limit=4, timeout=CATEGORY_TIMEOUT, deadline=CATEGORY_DEADLINE):
+    """
+    Fetch several Foursquare categories for a city concurrently. Each is
+    bounded by the resilience policy's deadline, so timeouts count towards
+    Foursquare's circuit breaker.
+    Returns (results by category id, list of category ids that failed or timed out).
+    Raises CircuitOpen if Foursquare's circuit is open and no category could be
+    served from the cache, or UpstreamFailed if every category failed otherwise.
+    """
+    cat_ids = list(dict.fromkeys(cat_ids))
+    responses = await asyncio.gather(
+        *(get_category(city, cat_id, limit, timeout, deadline) for cat_id in cat_ids),
+        return_exceptions=True
+    )
+    results = {}
+    failed = []
+    for cat_id, response in zip(cat_ids, responses):
+        if isinstance(response, BaseException):
+            logger.error(f"Foursquare category {cat_id} failed for city={city}: {response!r}")
+            failed.append(cat_id)
+        else:
+            results[cat_id] = response
+    circuit_open = [response for response in responses if isinstance(response, CircuitOpen)]
+    if not results and circuit_open:
+        raise circuit_open[0]
+    if not results and failed:
+        timed_out = all(UpstreamFailed.from_error("foursquare", response).timed_out for response in responses)
+        raise UpstreamFailed("foursquare", timed_out=timed_out)
+    return results, failed
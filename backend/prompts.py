@@ -0,0 +1,110 @@
+import json
+from datetime import datetime
+
+def build_suggest_prompt(location, budget, people, days, group_type, date=None):
+    date = date or datetime.now().strftime("%Y-%m-%d")
+    return f"""
+    You are a travel assistant specializing in budget-conscious travel recommendations. Based on the user's location ({location}), STRICT budget (${budget}), number of people ({people}), group type ({group_type}), number of days ({days}), and starting date ({date}), suggest destinations that are specifically tailored to these parameters.
+
+    BUDGET CONSTRAINTS ARE CRITICAL:
+    - Only suggest destinations that are realistic to visit with ${budget} for {people} people for {days} days
+    - Consider flight/transportation costs from {location} to each suggested destination
+    - Factor in typical accommodation costs for {people} people
+    - Account for food, local transportation, and activity costs
+
+    TAILOR THE SUGGESTIONS TO:
+    - Group type: {group_type} (suggest destinations with appropriate activities)
+    - Travel period: {days} days (recommend destinations with enough attractions to fill this timeframe)
+    - Starting point: {location} (consider travel time and costs from this location)
+    - Number of travelers: {people} (suggest accommodations and activities suitable for this group size)
+
+    Return ONLY a valid JSON object with this exact structure and field names:
+
+    {{
+      "suggested_destinations": [
+        {{
+          "destination": "",
+          "reason": "",
+          "estimated_total_cost": 0,
+          "cost_breakdown": {{
+            "flights_or_transportation": 0,
+            "accommodation": 0,
+            "food": 0,
+            "activities": 0,
+            "other": 0
+          }}
+        }}
+      ],
+      "itinerary_for_top_choice": [
+        {{"day": 1, "activities": [""], "notes": ""}}
+      ],
+      "local_customs": [""],
+      "packing_tips": [""],
+      "budget_considerations": [""]
+    }}
+
+    IMPORTANT: Only include destinations where the total estimated cost is at or below the user's budget of ${budget}. Be realistic about costs based on current prices.
+    Do not include any explanation, markdown formatting, or code blocks. Return only the valid JSON object.
+    """
+
+def build_plan_prompt(destination, budget, people, days, group_type, date=None):
+    date = date or datetime.now().strftime("%Y-%m-%d")
+    return f"""
+    You are a travel assistant that specializes in creating realistic and budget-conscious travel plans. Generate a detailed {days}-day travel plan for {people} people ({group_type}) visiting {destination} with a STRICT total budget of {budget} dollars, starting on {date}.
+
+    IMPORTANT BUDGET CONSTRAINTS:
+    - The total cost MUST NOT exceed {budget} dollars for all {people} people
+    - Allocate budget appropriately across accommodations, food, activities, and transportation
+    - Choose accommodations, activities, and dining options that are realistic for the {budget} dollar budget
+    - Consider local cost of living in {destination} when making recommendations
+
+    TAILOR THE PLAN TO THE USER'S SPECIFIC NEEDS:
+    - Group type: {group_type} (adjust activities to be appropriate for this group type)
+    - Number of people: {people} (consider group discounts or family packages if applicable)
+    - Length of stay: {days} days (pace the itinerary appropriately)
+    - Budget: ${budget} (very important - all suggestions must be affordable within this budget)
+
+    Return ONLY a valid JSON object with this exact structure and field names. Do NOT include any example values, explanations, or extra text.
+
+    {{
+      "itinerary": [
+        {{"day": 1, "activities": [""], "notes": "", "approximate_cost": 0}},
+        {{"day": 2, "activities": [""], "notes": "", "approximate_cost": 0}}
+      ],
+      "accommodation_suggestions": [
+        {{"name": "", "price_per_night": 0, "total_cost": 0}}
+      ],
+      "local_customs": [""],
+      "packing_tips": [""],
+      "budget_breakdown": {{
+        "accommodation": 0,
+        "food": 0,
+        "activities": 0,
+        "transportation": 0,
+        "other": 0,
+        "total": 0
+      }}
+    }}
+
+    IMPORTANT: The sum of all costs in the budget_breakdown MUST equal or be less than {budget}. Each suggested activity, hotel, and restaurant must be realistically priced for {destination}.
+    Do not include any explanation, markdown formatting, or code blocks. Return only the valid JSON object.
+    """
+
+def build_repair_prompt(original_prompt, data, problems):
+    fields = ", ".join(problems)
+    issues = "\n".join(f"    - {field}: {problem}" for field, problem in problems.items())
+    return f"""
+    You previously answered the travel request below, but some fields of your JSON were invalid.
+
+    PROBLEMS:
+{issues}
+
+    YOUR PREVIOUS JSON:
+    {json.dumps(data)}
+
+    ORIGINAL REQUEST:
+    {original_prompt}
+
+    Return ONLY a valid JSON object containing just the corrected fields ({fields}), using exactly the structure and field names required by the original request. Keep all costs within the original budget.
+    Do not include any explanation, markdown formatting, or code blocks. Return only the valid JSON object.
+    """
@@ -0,0 +1,251 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import httpx
+from collections import deque
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "1"))
+UPSTREAM_RETRY_BACKOFF = float(os.getenv("UPSTREAM_RETRY_BACKOFF", "0.2"))
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HF_RETRIES = int(os.getenv("HF_RETRIES", "1"))
+HF_HEDGE = os.getenv("HF_HEDGE", "false").lower() == "true"
+LATENCY_WINDOW = 200
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"{upstream} is temporarily unavailable")
+        self.upstream = upstream
+        self.retry_after = max(1, round(retry_after))
+
+class UpstreamFailed(Exception):
+    """
+    Raised when an upstream call failed (after the policy's retries) for a
+    reason other than an open circuit. The cause is logged, not shown to clients.
+    """
+    def __init__(self, upstream, timed_out=False):
+        super().__init__(f"{upstream} {'timed out' if timed_out else 'failed'}")
+        self.upstream = upstream
+        self.timed_out = timed_out
+
+    @classmethod
+    def from_error(cls, upstream, error):
+        return cls(upstream, timed_out=isinstance(error, (TimeoutError, asyncio.TimeoutError, httpx.TimeoutException)))
+
+def retryable_error(error):
+    """
+    Whether an exception from an upstream call means the upstream is in
+    trouble: timeouts, connection errors, and 429 or 5xx responses. Other
+    errors (a bad key, a bad request) are not retried and do not count
+    towards opening the circuit.
+    """
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status >= 500 or status == 429
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError, OSError, httpx.TransportError))
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failed calls. After reset_timeout
+    one probe call is let through (half-open): success closes the circuit,
+    failure opens it again.
+    """
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self):
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def is_available(self):
+        """Whether allow() would let a call through, without claiming the half-open probe."""
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        return self.state == self.CLOSED or not self._probing
+
+    def retry_after(self):
+        if self.state == self.OPEN:
+            return self.reset_timeout - (time.monotonic() - self.opened_at)
+        return 1
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self):
+        """Give up a half-open probe that ended without a verdict (e.g. cancelled)."""
+        self._probing = False
+
+class UpstreamPolicy:
+    """
+    Resilience for one upstream: a circuit breaker, bounded retries with full
+    jitter, and a hedged second attempt when the first is slower than the
+    HEDGE_PERCENTILE of recent latencies.
+    """
+    def __init__(self, name, retries=UPSTREAM_RETRIES, hedge=True, backoff=UPSTREAM_RETRY_BACKOFF):
+        self.name = name
+        self.retries = retries
+        self.hedge = hedge
+        self.backoff = backoff
+        self.breaker = CircuitBreaker()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.stats = {"calls": 0, "failures": 0, "retries": 0, "hedged": 0, "hedge_wins": 0, "rejected": 0}
+
+    def check(self):
+        """Raise CircuitOpen unless a call may go through now (claims the half-open probe)."""
+        if not self.breaker.allow():
+            self.stats["rejected"] += 1
+            raise CircuitOpen(self.name, self.breaker.retry_after())
+
+    def ensure_available(self):
+        """Fail fast with CircuitOpen before queueing work that will call the upstream."""
+        if not self.breaker.is_available():
+            self.stats["rejected"] += 1
+            raise CircuitOpen(self.name, self.breaker.retry_after())
+
+    def record(self, success, seconds=None):
+        if success:
+            if seconds is not None:
+                self.latencies.append(seconds)
+            self.breaker.record_success()
+        else:
+            self.stats["failures"] += 1
+            previous = self.breaker.state
+            self.breaker.record_failure()
+            if self.breaker.state == CircuitBreaker.OPEN and previous != CircuitBreaker.OPEN:
+                logger.warning(f"Circuit breaker for {self.name} opened")
+
+    def hedge_delay(self):
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))
+        return max(ordered[index], HEDGE_MIN_DELAY)
+
+    async def _hedged(self, attempt):
+        delay = self.hedge_delay()
+        first = asyncio.ensure_future(attempt())
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return first.result()
+            self.stats["hedged"] += 1
+            second = asyncio.ensure_future(attempt())
+            tasks.add(second)
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call(self, attempt, is_failure=None, retries=None, hedge=None, deadline=None):
+        """
+        Run attempt() (a coroutine factory) under the policy. Exceptions that are
+        retryable_error()s, and results for which is_failure() is true, are
+        retried and count as failures; a result is returned if it is still
+        failing after the last retry. Any other exception is raised straight
+        away without counting. deadline (seconds) bounds all attempts, retries
+        and hedges together; running out of it is a timeout failure. Raises
+        CircuitOpen without calling the upstream while the circuit is open.
+        """
+        self.check()
+        self.stats["calls"] += 1
+        retries = self.retries if retries is None else retries
+        hedge = self.hedge if hedge is None else hedge
+        give_up_at = None if deadline is None else time.monotonic() + deadline
+        result = error = None
+        verdict = False
+        try:
+            for retry in range(retries + 1):
+                if retry:
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(random.uniform(0, self.backoff * 2 ** (retry - 1)))
+                remaining = None if give_up_at is None else give_up_at - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    result, error = None, TimeoutError(f"{self.name} did not answer within {deadline}s")
+                    break
+                started = time.monotonic()
+                try:
+                    pending = self._hedged(attempt) if hedge else attempt()
+                    result = await (pending if remaining is None else asyncio.wait_for(pending, remaining))
+                    error = None
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if not retryable_error(e):
+                        raise
+                    result, error = None, e
+                    continue
+                if is_failure is not None and is_failure(result):
+                    continue
+                verdict = True
+                self.record(True, time.monotonic() - started)
+                return result
+            verdict = True
+            self.record(False)
+        finally:
+            if not verdict:
+                self.breaker.release()
+        if error is not None:
+            raise error
+        return result
+
+    def status(self):
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "hedge_delay": self.hedge_delay(),
+            **self.stats,
+        }
+
+policies = {
+    "weatherapi": UpstreamPolicy("weatherapi"),
+    "foursquare": UpstreamPolicy("foursquare"),
+    # Inference calls are slow and costly, so they are not hedged by default.
+    "huggingface": UpstreamPolicy("huggingface", retries=HF_RETRIES, hedge=HF_HEDGE),
+}
+
+def retryable_status(response):
+    return response.status_code >= 500 or response.status_code == 429
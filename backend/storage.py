@@ -0,0 +1,536 @@
+import os
+import json
+import bisect
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from bson import ObjectId
+
+def project(doc, fields):
+    """
+    Apply a Mongo-style inclusion projection of dotted paths to a document.
+    Lists are projected element-wise; _id is always kept.
+    """
+    if not fields or doc is None:
+        return doc
+    tree = {}
+    for field in fields:
+        node = tree
+        for part in field.split("."):
+            node = node.setdefault(part, {})
+    projected = _project(doc, tree)
+    if "_id" in doc:
+        projected["_id"] = doc["_id"]
+    return projected
+
+def _project(value, tree):
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value if isinstance(item, (dict, list))]
+    projected = {}
+    for key, subtree in tree.items():
+        if key in value:
+            child = value[key]
+            if not subtree or isinstance(child, (dict, list)):
+                projected[key] = _project(child, subtree)
+    return projected
+
+def _matches(doc, expected):
+    return all(doc.get(field) == value for field, value in (expected or {}).items())
+
+def _claimable(job, now):
+    return job.get("status") == "queued" or (job.get("status") == "running" and (job.get("lease_expires") or 0) < now)
+
+def page_key(trip):
+    created_at = trip.get("created_at")
+    if not isinstance(created_at, datetime):
+        created_at = datetime.min
+    return created_at, str(trip.get("_id"))
+
+class MemoryStore:
+    """
+    In-process user/trip store with hash indexes on email, _id, user_id,
+    (user_id, import_key) and data_blob, plus a per-user list of page keys
+    kept sorted for keyset pagination.
+    Lookups are O(1) and pages O(log n); mutations are guarded by a lock so
+    the store can be shared with worker threads.
+    """
+    blocking = False
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.users = {}
+        self.trips = {}
+        self._users_by_email = {}
+        self._trips_by_user = {}
+        self._trip_pages = {}
+        self._trip_versions = {}
+        self._trips_by_import_key = {}
+        self._blob_refs = {}
+        self.jobs = {}
+        self._jobs_by_key = {}
+
+    def insert_user(self, user_data):
+        with self._lock:
+            user_id = str(user_data.get("_id") or ObjectId())
+            user_data["_id"] = user_id
+            self.users[user_id] = user_data
+            self._users_by_email[user_data.get("email")] = user_id
+            return user_id
+
+    def find_user_by_email(self, email):
+        with self._lock:
+            user_id = self._users_by_email.get(email)
+            return self.users.get(user_id) if user_id else None
+
+    def update_user(self, email, fields):
+        with self._lock:
+            user = self.find_user_by_email(email)
+            if not user:
+                return 0
+            user.update(fields)
+            return 1
+
+    def insert_trip(self, trip_data):
+        with self._lock:
+            trip_id = str(trip_data.get("_id") or ObjectId())
+            trip_data["_id"] = trip_id
+            self.trips[trip_id] = trip_data
+            # dict keys keep insertion order and give O(1) removal
+            self._trips_by_user.setdefault(trip_data.get("user_id"), {})[trip_id] = None
+            bisect.insort(self._trip_pages.setdefault(trip_data.get("user_id"), []), page_key(trip_data))
+            self._bump_trips_version(trip_data.get("user_id"))
+            if trip_data.get("import_key"):
+                self._trips_by_import_key[(trip_data.get("user_id"), trip_data["import_key"])] = trip_id
+            if trip_data.get("data_blob"):
+                self._blob_refs[trip_data["data_blob"]] = self._blob_refs.get(trip_data["data_blob"], 0) + 1
+            return trip_id
+
+    def insert_trips(self, trips):
+        """Insert a batch of trips, skipping any whose (user_id, import_key) already exists. Returns the inserted ids."""
+        with self._lock:
+            return [
+                self.insert_trip(trip) for trip in trips
+                if not trip.get("import_key")
+                or (trip.get("user_id"), trip["import_key"]) not in self._trips_by_import_key
+            ]
+
+    def find_trip_keys(self, user_id, keys):
+        """The keys that are already the id or import_key of one of user_id's trips."""
+        with self._lock:
+            return {
+                key for key in keys
+                if (user_id, key) in self._trips_by_import_key or self.find_trip(key, user_id) is not None
+            }
+
+    def find_trip(self, trip_id, user_id=None):
+        with self._lock:
+            trip = self.trips.get(str(trip_id))
+            if trip and (not user_id or trip.get("user_id") == user_id):
+                return trip
+            return None
+
+    def find_trips_by_user(self, user_id):
+        with self._lock:
+            return [self.trips[trip_id] for trip_id in self._trips_by_user.get(user_id, {})]
+
+    def _bump_trips_version(self, user_id):
+        self._trip_versions[user_id] = self._trip_versions.get(user_id, 0) + 1
+
+    def trips_version(self, user_id):
+        """A counter bumped by every insert and delete of user_id's trips."""
+        with self._lock:
+            return self._trip_versions.get(user_id, 0)
+
+    def trip_usage(self, user_id):
+        trips = self.find_trips_by_user(user_id)
+        return {"count": len(trips), "bytes": sum(trip.get("data_size") or 0 for trip in trips)}
+
+    def find_trips_page(self, user_id, limit, after=None):
+        """
+        Newest-first page of a user's trips strictly after the (created_at, _id) position.
+        """
+        with self._lock:
+            pages = self._trip_pages.get(user_id, [])
+            end = bisect.bisect_left(pages, after) if after else len(pages)
+            return [self.trips[trip_id] for _, trip_id in reversed(pages[max(0, end - limit):end])]
+
+    def find_referenced_blobs(self, digests):
+        """The digests that at least one trip's data_blob points to."""
+        with self._lock:
+            return {digest for digest in digests if digest in self._blob_refs}
+
+    def delete_trip(self, trip_id, user_id):
+        with self._lock:
+            trip = self.find_trip(trip_id, user_id)
+            if not trip:
+                return 0
+            del self.trips[str(trip_id)]
+            if trip.get("import_key"):
+                self._trips_by_import_key.pop((user_id, trip["import_key"]), None)
+            if trip.get("data_blob"):
+                self._blob_refs[trip["data_blob"]] -= 1
+                if not self._blob_refs[trip["data_blob"]]:
+                    del self._blob_refs[trip["data_blob"]]
+            user_trips = self._trips_by_user.get(user_id, {})
+            user_trips.pop(str(trip_id), None)
+            if not user_trips:
+                self._trips_by_user.pop(user_id, None)
+            pages = self._trip_pages.get(user_id, [])
+            position = bisect.bisect_left(pages, page_key(trip))
+            if position < len(pages) and pages[position] == page_key(trip):
+                del pages[position]
+            if not pages:
+                self._trip_pages.pop(user_id, None)
+            self._bump_trips_version(user_id)
+            return 1
+
+    def insert_job(self, job):
+        with self._lock:
+            self.jobs[job["_id"]] = job
+            self._jobs_by_key[job["dedupe_key"]] = job["_id"]
+            return job["_id"]
+
+    def find_job(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def find_job_by_key(self, dedupe_key):
+        with self._lock:
+            return self.jobs.get(self._jobs_by_key.get(dedupe_key))
+
+    def update_job(self, job_id, fields, expected=None):
+        """Set fields on a job if its current values match expected. Returns 1 if it was updated."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or not _matches(job, expected):
+                return 0
+            job.update(fields)
+            return 1
+
+    def claim_job(self, owner, lease_expires, now):
+        """
+        Take the oldest queued job, or a running one whose lease has expired,
+        for owner until lease_expires. Returns the job or None.
+        """
+        with self._lock:
+            for job in self.jobs.values():
+                if _claimable(job, now):
+                    job.update({"status": "running", "owner": owner, "lease_expires": lease_expires})
+                    return job
+            return None
+
+    def count_jobs(self, status):
+        with self._lock:
+            return sum(1 for job in self.jobs.values() if job.get("status") == status)
+
+    def delete_jobs_finished_before(self, cutoff):
+        with self._lock:
+            expired = [job_id for job_id, job in self.jobs.items() if job.get("finished_at") and job["finished_at"] < cutoff]
+            for job_id in expired:
+                job = self.jobs.pop(job_id)
+                if self._jobs_by_key.get(job["dedupe_key"]) == job_id:
+                    del self._jobs_by_key[job["dedupe_key"]]
+            return len(expired)
+
+    def close(self):
+        pass
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _json_object_hook(obj):
+    if len(obj) == 1 and "$date" in obj:
+        return datetime.fromisoformat(obj["$date"])
+    return obj
+
+def encode_document(doc):
+    return json.dumps(doc, default=_json_default, separators=(",", ":"))
+
+def decode_document(text):
+    return json.loads(text, object_hook=_json_object_hook)
+
+class SQLiteStore:
+    """
+    File-backed store on embedded SQLite in WAL mode, so several uvicorn
+    workers can read concurrently while one writes. fsync is one of
+    "off", "normal" or "full" (PRAGMA synchronous).
+    """
+    FSYNC_MODES = {"off": "OFF", "normal": "NORMAL", "full": "FULL"}
+    blocking = True
+
+    def __init__(self, path, fsync="normal"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={self.FSYNC_MODES.get(fsync.lower(), 'NORMAL')}")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                id TEXT PRIMARY KEY,
+                email TEXT UNIQUE,
+                doc TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS trips (
+                id TEXT PRIMARY KEY,
+                user_id TEXT,
+                created_at TEXT,
+                doc TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS trips_user_created_id ON trips (user_id, created_at, id);
+            DROP INDEX IF EXISTS trips_user_import_key;
+            CREATE UNIQUE INDEX IF NOT EXISTS trips_user_import_key_unique
+                ON trips (user_id, json_extract(doc, '$.import_key'))
+                WHERE json_extract(doc, '$.import_key') IS NOT NULL;
+            CREATE INDEX IF NOT EXISTS trips_data_blob ON trips (json_extract(doc, '$.data_blob'));
+            CREATE TABLE IF NOT EXISTS trip_versions (
+                user_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            );
+            CREATE TRIGGER IF NOT EXISTS trips_version_insert AFTER INSERT ON trips BEGIN
+                INSERT INTO trip_versions (user_id, version) VALUES (NEW.user_id, 1)
+                ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS trips_version_delete AFTER DELETE ON trips BEGIN
+                INSERT INTO trip_versions (user_id, version) VALUES (OLD.user_id, 1)
+                ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+            END;
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                dedupe_key TEXT,
+                status TEXT,
+                lease_expires REAL,
+                created_at REAL,
+                finished_at REAL,
+                doc TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS jobs_dedupe_key ON jobs (dedupe_key, created_at);
+            CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at);
+        """)
+        self._conn.commit()
+
+    def _write(self, sql, params):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor.rowcount
+
+    def _read(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @contextmanager
+    def _transaction(self):
+        """A write transaction that holds the database lock from its first read, across processes."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def insert_user(self, user_data):
+        user_id = str(user_data.get("_id") or ObjectId())
+        user_data["_id"] = user_id
+        self._write(
+            "INSERT INTO users (id, email, doc) VALUES (?, ?, ?)",
+            (user_id, user_data.get("email"), encode_document(user_data))
+        )
+        return user_id
+
+    def find_user_by_email(self, email):
+        rows = self._read("SELECT doc FROM users WHERE email = ?", (email,))
+        return decode_document(rows[0][0]) if rows else None
+
+    def update_user(self, email, fields):
+        with self._lock:
+            user = self.find_user_by_email(email)
+            if not user:
+                return 0
+            user.update(fields)
+            return self._write(
+                "UPDATE users SET doc = ? WHERE email = ?", (encode_document(user), email)
+            )
+
+    @staticmethod
+    def _trip_row(trip_data):
+        trip_id = str(trip_data.get("_id") or ObjectId())
+        trip_data["_id"] = trip_id
+        created_at = trip_data.get("created_at")
+        return (
+            trip_id,
+            trip_data.get("user_id"),
+            created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+            encode_document(trip_data)
+        )
+
+    def insert_trip(self, trip_data):
+        row = self._trip_row(trip_data)
+        self._write("INSERT INTO trips (id, user_id, created_at, doc) VALUES (?, ?, ?, ?)", row)
+        return row[0]
+
+    def insert_trips(self, trips):
+        """
+        Insert a batch of trips in one transaction, skipping any whose
+        (user_id, import_key) already exists. Returns the inserted ids.
+        """
+        rows = [self._trip_row(trip) for trip in trips]
+        inserted = []
+        with self._transaction() as conn:
+            for row in rows:
+                cursor = conn.execute("INSERT OR IGNORE INTO trips (id, user_id, created_at, doc) VALUES (?, ?, ?, ?)", row)
+                if cursor.rowcount:
+                    inserted.append(row[0])
+        return inserted
+
+    def find_trip_keys(self, user_id, keys):
+        """The keys that are already the id or import_key of one of user_id's trips."""
+        keys = list(keys)
+        if not keys:
+            return set()
+        placeholders = ",".join("?" * len(keys))
+        by_id = self._read(f"SELECT id FROM trips WHERE user_id = ? AND id IN ({placeholders})", (user_id, *keys))
+        by_import_key = self._read(
+            f"SELECT json_extract(doc, '$.import_key') FROM trips "
+            f"WHERE user_id = ? AND json_extract(doc, '$.import_key') IN ({placeholders})",
+            (user_id, *keys)
+        )
+        return {row[0] for row in by_id + by_import_key}
+
+    def find_trip(self, trip_id, user_id=None):
+        rows = self._read("SELECT doc, user_id FROM trips WHERE id = ?", (str(trip_id),))
+        if not rows or (user_id and rows[0][1] != user_id):
+            return None
+        return decode_document(rows[0][0])
+
+    def find_trips_by_user(self, user_id):
+        rows = self._read(
+            "SELECT doc FROM trips WHERE user_id = ? ORDER BY created_at, rowid", (user_id,)
+        )
+        return [decode_document(row[0]) for row in rows]
+
+    def trips_version(self, user_id):
+        """A counter bumped (by triggers, so from any process) on every insert and delete of user_id's trips."""
+        rows = self._read("SELECT version FROM trip_versions WHERE user_id = ?", (user_id,))
+        return rows[0][0] if rows else 0
+
+    def trip_usage(self, user_id):
+        count, size = self._read(
+            "SELECT COUNT(*), COALESCE(SUM(json_extract(doc, '$.data_size')), 0) FROM trips WHERE user_id = ?",
+            (user_id,)
+        )[0]
+        return {"count": count, "bytes": size}
+
+    def find_trips_page(self, user_id, limit, after=None):
+        if after:
+            created_at, trip_id = after
+            rows = self._read(
+                "SELECT doc FROM trips WHERE user_id = ? AND (created_at < ? OR (created_at = ? AND id < ?)) "
+                "ORDER BY created_at DESC, id DESC LIMIT ?",
+                (user_id, created_at.isoformat(), created_at.isoformat(), trip_id, limit)
+            )
+        else:
+            rows = self._read(
+                "SELECT doc FROM trips WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+                (user_id, limit)
+            )
+        return [decode_document(row[0]) for row in rows]
+
+    def find_referenced_blobs(self, digests):
+        """The digests that at least one trip's data_blob points to."""
+        digests = list(digests)
+        if not digests:
+            return set()
+        placeholders = ",".join("?" * len(digests))
+        rows = self._read(
+            f"SELECT DISTINCT json_extract(doc, '$.data_blob') FROM trips "
+            f"WHERE json_extract(doc, '$.data_blob') IN ({placeholders})",
+            digests
+        )
+        return {row[0] for row in rows}
+
+    def delete_trip(self, trip_id, user_id):
+        return self._write("DELETE FROM trips WHERE id = ? AND user_id = ?", (str(trip_id), user_id))
+
+    @staticmethod
+    def _job_row(job):
+        return (
+            job["dedupe_key"], job.get("status"), job.get("lease_expires"),
+            job.get("created_at"), job.get("finished_at"), encode_document(job), job["_id"]
+        )
+
+    def insert_job(self, job):
+        self._write(
+            "INSERT INTO jobs (dedupe_key, status, lease_expires, created_at, finished_at, doc, id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            self._job_row(job)
+        )
+        return job["_id"]
+
+    def find_job(self, job_id):
+        rows = self._read("SELECT doc FROM jobs WHERE id = ?", (job_id,))
+        return decode_document(rows[0][0]) if rows else None
+
+    def find_job_by_key(self, dedupe_key):
+        rows = self._read(
+            "SELECT doc FROM jobs WHERE dedupe_key = ? ORDER BY created_at DESC LIMIT 1", (dedupe_key,)
+        )
+        return decode_document(rows[0][0]) if rows else None
+
+    def _save_job(self, conn, job):
+        conn.execute(
+            "UPDATE jobs SET dedupe_key = ?, status = ?, lease_expires = ?, created_at = ?, finished_at = ?, doc = ? "
+            "WHERE id = ?",
+            self._job_row(job)
+        )
+
+    def update_job(self, job_id, fields, expected=None):
+        """Set fields on a job if its current values match expected. Returns 1 if it was updated."""
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT doc FROM jobs WHERE id = ?", (job_id,)).fetchall()
+            job = decode_document(rows[0][0]) if rows else None
+            if job is None or not _matches(job, expected):
+                return 0
+            job.update(fields)
+            self._save_job(conn, job)
+            return 1
+
+    def claim_job(self, owner, lease_expires, now):
+        """
+        Take the oldest queued job, or a running one whose lease has expired,
+        for owner until lease_expires. Returns the job or None.
+        """
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT doc FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now,)
+            ).fetchall()
+            if not rows:
+                return None
+            job = decode_document(rows[0][0])
+            job.update({"status": "running", "owner": owner, "lease_expires": lease_expires})
+            self._save_job(conn, job)
+            return job
+
+    def count_jobs(self, status):
+        return self._read("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,))[0][0]
+
+    def delete_jobs_finished_before(self, cutoff):
+        return self._write("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
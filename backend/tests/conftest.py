@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+# Modules read their settings at import time, so point storage at a scratch
+# directory before any of them are imported.
+_scratch = tempfile.mkdtemp(prefix="holiday-planner-tests-")
+os.environ.update({
+    "STORAGE_BACKEND": "memory",
+    "BLOB_STORE_PATH": os.path.join(_scratch, "blobs"),
+    "CATALOG_ENABLED": "false",
+    "PLACES_CACHE_BACKENDS": "memory",
+    "GAZETTEER_ENABLED": "true",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
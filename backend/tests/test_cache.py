@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+import cache
+from cache import MemoryBackend, TieredCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    return clock
+
+class Loader:
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.fail = fail
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return f"value {self.calls}"
+
+def tiered():
+    return TieredCache([MemoryBackend()], fresh_ttl=10, stale_ttl=100)
+
+def test_fresh_entries_are_served_without_loading(clock):
+    async def scenario():
+        tiers, loader = tiered(), Loader()
+        assert await tiers.get_or_load("k", loader) == "value 1"
+        clock.now += 5
+        assert await tiers.get_or_load("k", loader) == "value 1"
+        assert loader.calls == 1
+    asyncio.run(scenario())
+
+def test_stale_entries_are_served_while_refreshing(clock):
+    async def scenario():
+        tiers, loader = tiered(), Loader()
+        await tiers.get_or_load("k", loader)
+        clock.now += 50
+        assert await tiers.get_or_load("k", loader) == "value 1"
+        assert tiers.stats["memory"]["stale_hits"] == 1
+        await asyncio.gather(*tiers._refresh_tasks)
+        assert loader.calls == 2
+        assert await tiers.get_or_load("k", loader) == "value 2"
+    asyncio.run(scenario())
+
+def test_entries_past_stale_ttl_are_reloaded(clock):
+    async def scenario():
+        tiers, loader = tiered(), Loader()
+        await tiers.get_or_load("k", loader)
+        clock.now += 101
+        assert await tiers.get_or_load("k", loader) == "value 2"
+        assert tiers._refresh_tasks == set()
+    asyncio.run(scenario())
+
+def test_failed_refresh_keeps_the_stale_value(clock):
+    async def scenario():
+        tiers = tiered()
+        await tiers.get_or_load("k", Loader())
+        clock.now += 50
+        failing = Loader(fail=True)
+        assert await tiers.get_or_load("k", failing) == "value 1"
+        await asyncio.gather(*tiers._refresh_tasks)
+        assert tiers.stats["memory"]["errors"] == 1
+        assert await tiers.get_or_load("k", failing) == "value 1"
+    asyncio.run(scenario())
+
+def test_concurrent_misses_load_once(clock):
+    async def scenario():
+        tiers, loader = tiered(), Loader()
+        values = await asyncio.gather(*(tiers.get_or_load("k", loader) for _ in range(5)))
+        assert values == ["value 1"] * 5
+        assert loader.calls == 1
+    asyncio.run(scenario())
+
+def test_lower_tier_hits_are_copied_up(clock):
+    async def scenario():
+        upper, lower = MemoryBackend(), MemoryBackend()
+        lower.name = "lower"
+        await lower.set("k", "from lower", clock.now)
+        tiers = TieredCache([upper, lower], fresh_ttl=10, stale_ttl=100)
+        assert await tiers.get_or_load("k", Loader()) == "from lower"
+        assert await upper.get("k") == (clock.now, "from lower")
+    asyncio.run(scenario())
@@ -0,0 +1,57 @@
+import pytest
+
+import gazetteer
+
+@pytest.fixture(scope="module", autouse=True)
+def loaded():
+    gazetteer.load_gazetteer()
+
+@pytest.mark.parametrize("text, key, match", [
+    ("Paris", "fr:paris", "exact"),
+    ("  paris ", "fr:paris", "exact"),
+    ("PARIS, France", "fr:paris", "exact"),
+    ("londres", "gb:london", "exact"),
+    ("nyc", "us:new-york-city", "exact"),
+    ("Sao Paulo", "br:sao-paulo", "exact"),
+    ("Barcelonna", "es:barcelona", "fuzzy"),
+    ("Barcelonna, Spain", "es:barcelona", "fuzzy"),
+    ("New Yrok", "us:new-york-city", "fuzzy"),
+])
+def test_resolve(text, key, match):
+    place = gazetteer.resolve(text)
+    assert (place["key"], place["match"]) == (key, match)
+
+@pytest.mark.parametrize("text", [
+    "Atlantis",
+    "Paris, Texas",
+    "Vancouver WA",
+    "Vancouver, WA",
+    "Melbourne FL",
+    "Manchester NH",
+    "Amsterdam NY",
+    "Mexico",
+    "Sant",
+    "Cape",
+    "Lond",
+    "Hawaii",
+    "Machu Picchu",
+    "Maldives",
+    "Malta",
+    "Kuta",
+])
+def test_unknown_places_and_leftover_words_do_not_resolve(text):
+    assert gazetteer.resolve(text) is None
+    assert gazetteer.canonical_name(text) == text
+
+def test_place_key_groups_spellings():
+    assert gazetteer.place_key("Kyoto") == gazetteer.place_key("kyoto, japan") == "jp:kyoto"
+    assert gazetteer.place_key("  Atlantis ") == "atlantis"
+
+def test_canonical_name():
+    assert gazetteer.canonical_name("paris ") == "Paris, France"
+    assert gazetteer.canonical_name("sao paulo") == "São Paulo, Brazil"
+    assert gazetteer.canonical_name("  Lost   City ") == "Lost City"
+
+def test_normalize_text():
+    assert gazetteer.normalize_text("  São  Paulo! ") == "sao paulo"
+    assert gazetteer.normalize_text("St. John's") == "st johns"
@@ -0,0 +1,63 @@
+import pytest
+
+from llm_output import ParseError, extract_json, validate_output
+
+def test_extract_json_strips_fences_and_prose():
+    text = 'Here is your plan:\n```json\n{"a": 1, "b": {"c": "x"}}\n```\nEnjoy!'
+    assert extract_json(text) == {"a": 1, "b": {"c": "x"}}
+
+def test_extract_json_drops_trailing_commas():
+    assert extract_json('{"a": [1, 2,], "b": 3,}') == {"a": [1, 2], "b": 3}
+
+def test_extract_json_closes_truncated_output():
+    data = extract_json('{"itinerary": [{"day": 1}, {"day": 2, "notes": "Muse')
+    assert data == {"itinerary": [{"day": 1}, {"day": 2, "notes": "Muse"}]}
+
+def test_extract_json_drops_a_key_cut_before_its_value():
+    assert extract_json('{"a": 1, "b": ') == {"a": 1}
+
+def test_extract_json_ignores_braces_in_strings_and_later_objects():
+    assert extract_json('{"a": "}{", "b": 1} and then {"c": 2}') == {"a": "}{", "b": 1}
+
+@pytest.mark.parametrize("text", [None, "no json here", "[1, 2]"])
+def test_extract_json_rejects_non_objects(text):
+    with pytest.raises(ParseError):
+        extract_json(text)
+
+def plan(total=0, **parts):
+    return {
+        "itinerary": [{"day": 1, "activities": ["Walk"], "approximate_cost": "$40"}],
+        "budget_breakdown": {"total": total, **parts},
+    }
+
+def test_validate_output_parses_costs():
+    result, problems = validate_output("plan", plan(total="$1,000"), 1000)
+    assert problems == {}
+    assert result["budget_breakdown"]["total"] == 1000
+    assert result["itinerary"][0]["approximate_cost"] == 40
+
+def test_budget_problems_allow_the_tolerance():
+    _, problems = validate_output("plan", plan(total=1049), 1000)
+    assert problems == {}
+
+def test_budget_problems_flag_a_plan_over_budget():
+    _, problems = validate_output("plan", plan(total=1200), 1000)
+    assert "budget_breakdown" in problems
+
+def test_budget_problems_sum_the_parts_without_a_total():
+    _, problems = validate_output("plan", plan(accommodation=800, food=300), 1000)
+    assert "budget_breakdown" in problems
+
+def test_budget_problems_name_suggestions_over_budget():
+    data = {"suggested_destinations": [
+        {"destination": "Lisbon", "estimated_total_cost": 900},
+        {"destination": "Tokyo", "estimated_total_cost": "3,000"},
+    ]}
+    _, problems = validate_output("suggestions", data, 1000)
+    assert "Tokyo" in problems["suggested_destinations"]
+    assert "Lisbon" not in problems["suggested_destinations"]
+
+def test_validate_output_reports_schema_errors_by_field():
+    result, problems = validate_output("plan", {"itinerary": [{"day": "one"}]}, 1000)
+    assert result is None
+    assert set(problems) == {"itinerary", "budget_breakdown"}
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from storage import MemoryStore, SQLiteStore, page_key
+from trips import encode_cursor, decode_cursor
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = MemoryStore() if request.param == "memory" else SQLiteStore(str(tmp_path / "trips.sqlite3"))
+    yield store
+    store.close()
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    cursor = encode_cursor({"id": "abc123", "created_at": created_at})
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, "abc123")
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "eyJjIjoxfQ", encode_cursor({"id": "x", "created_at": None})])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+def test_pages_walk_every_trip_newest_first(store):
+    start = datetime(2024, 1, 1)
+    for minute in [5, 1, 3, 3, 3, 0, 9, 7, 7, 2]:
+        store.insert_trip({"user_id": "u1", "trip_type": "plan", "created_at": start + timedelta(minutes=minute)})
+    store.insert_trip({"user_id": "u2", "trip_type": "plan", "created_at": start})
+    expected = sorted(store.find_trips_by_user("u1"), key=page_key, reverse=True)
+
+    seen, after = [], None
+    while True:
+        page = store.find_trips_page("u1", 3, after)
+        seen.extend(page)
+        if len(page) < 3:
+            break
+        after = decode_cursor(encode_cursor({"id": page[-1]["_id"], "created_at": page[-1]["created_at"]}))
+    assert [trip["_id"] for trip in seen] == [trip["_id"] for trip in expected]
+
+def test_pages_skip_deleted_trips(store):
+    start = datetime(2024, 1, 1)
+    ids = [
+        store.insert_trip({"user_id": "u1", "trip_type": "plan", "created_at": start + timedelta(minutes=minute)})
+        for minute in range(6)
+    ]
+    store.delete_trip(ids[4], "u1")
+    store.delete_trip(ids[1], "u1")
+    page = store.find_trips_page("u1", 10)
+    assert [trip["_id"] for trip in page] == [ids[5], ids[3], ids[2], ids[0]]
+    assert store.find_trips_page("u1", 10, page_key(page[1])) == page[2:]
@@ -0,0 +1,133 @@
+import asyncio
+
+import httpx
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, retryable_error
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert not breaker.is_available()
+    assert breaker.retry_after() == 30
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.is_available()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    assert not breaker.is_available()
+
+def test_successful_probe_closes_the_circuit(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+def test_failed_probe_opens_the_circuit_again(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 30
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+def test_released_probe_can_be_retried(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+def status_error(code):
+    request = httpx.Request("GET", "https://upstream.test")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(code, request=request))
+
+@pytest.mark.parametrize("error, retryable", [
+    (status_error(500), True),
+    (status_error(503), True),
+    (status_error(429), True),
+    (status_error(401), False),
+    (status_error(404), False),
+    (httpx.ConnectError("refused"), True),
+    (httpx.ReadTimeout("slow"), True),
+    (asyncio.TimeoutError(), True),
+    (ValueError("bad payload"), False),
+])
+def test_retryable_error(error, retryable):
+    assert retryable_error(error) is retryable
+
+def test_deadline_timeouts_count_as_failures():
+    async def slow():
+        await asyncio.sleep(1)
+
+    async def scenario():
+        policy = resilience.UpstreamPolicy("slow", retries=1, hedge=False, backoff=0)
+        policy.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        for _ in range(2):
+            with pytest.raises(TimeoutError):
+                await policy.call(slow, deadline=0.05)
+        assert policy.breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(resilience.CircuitOpen):
+            await policy.call(slow, deadline=0.05)
+    asyncio.run(scenario())
+
+def test_slow_foursquare_opens_the_breaker(monkeypatch):
+    import http_client
+    import places
+
+    async def slow_upstream(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200, json={"results": []})
+
+    policy = resilience.UpstreamPolicy("foursquare", retries=1, backoff=0)
+    policy.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    monkeypatch.setitem(resilience.policies, "foursquare", policy)
+    client = httpx.AsyncClient(base_url="https://foursquare.test", transport=httpx.MockTransport(slow_upstream))
+    monkeypatch.setitem(http_client._clients, "foursquare", client)
+
+    async def scenario():
+        for n in range(3):
+            with pytest.raises(resilience.UpstreamFailed) as failure:
+                await places.fetch_categories(f"Nowhere {n}", ["cat"], deadline=0.05)
+            assert failure.value.timed_out
+        assert policy.breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(resilience.CircuitOpen):
+            await places.fetch_categories("Nowhere 4", ["cat"], deadline=0.05)
+    asyncio.run(scenario())
@@ -0,0 +1,109 @@
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import database
+from blob_store import encode_payload
+from storage import SQLiteStore
+from trips import store_trip_data
+from trip_transfer import TripImport, export_trips, read_ndjson, _parse_timestamp
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+async def collect(generator):
+    return [item async for item in generator]
+
+def test_read_ndjson_splits_lines_across_chunks():
+    lines = asyncio.run(collect(read_ndjson(
+        chunks(b'{"trip_type": "plan", "da', b'ta": {}}\n\n[1]\n{"trip_type": "plan"}\nnot json\n{"trip_type": "x", "data": {"a": 1}}'),
+        max_line_bytes=1024,
+    )))
+    assert [(number, record) for number, record, _ in lines] == [
+        (1, {"trip_type": "plan", "data": {}}),
+        (3, None),
+        (4, None),
+        (5, None),
+        (6, {"trip_type": "x", "data": {"a": 1}}),
+    ]
+    assert [error for _, _, error in lines][1:3] == ["Each line must be a JSON object", "data must be an object"]
+
+def test_read_ndjson_skips_oversized_lines():
+    oversized = b'{"trip_type": "plan", "data": {"x": "' + b"a" * 100 + b'"}}\n'
+    lines = asyncio.run(collect(read_ndjson(
+        chunks(oversized[:40], oversized[40:], b'{"trip_type": "plan", "data": {}}\n'), max_line_bytes=32
+    )))
+    assert [(number, error) for number, _, error in lines] == [(1, "Line is too large"), (2, None)]
+
+def test_imported_timestamps_are_naive_utc():
+    default = datetime(2000, 1, 1)
+    assert _parse_timestamp("2024-05-01T12:00:00+02:00", default) == datetime(2024, 5, 1, 10, 0)
+    assert _parse_timestamp("2024-05-01T12:00:00Z", default) == datetime(2024, 5, 1, 12, 0)
+    assert _parse_timestamp("yesterday", default) == default
+
+async def save_trip(user_id, trip_type, data):
+    trip = {"user_id": user_id, "trip_type": trip_type, "created_at": datetime.utcnow(), "updated_at": datetime.utcnow()}
+    trip.update(await store_trip_data(trip_type, data))
+    return await database.insert_trip(trip)
+
+async def import_ndjson(user_id, payload):
+    return await TripImport(user_id, batch_size=2).run(read_ndjson(chunks(payload), max_line_bytes=1 << 20))
+
+def test_export_import_round_trip_is_idempotent():
+    async def scenario():
+        plans = [
+            {"formParams": {"destination": f"City {n}", "budget": 100 * n, "people": 2, "days": 3, "groupType": "family"},
+             "planData": {"itinerary": [{"day": 1, "activities": [f"Sight {n}"]}]}}
+            for n in range(1, 6)
+        ]
+        for plan in plans:
+            await save_trip("exporter", "plan", plan)
+        exported = b"".join(await collect(export_trips("exporter", batch_size=2, chunk_bytes=64)))
+        records = [json.loads(line) for line in exported.splitlines()]
+        assert sorted(encode_payload(record["data"]) for record in records) == sorted(encode_payload(plan) for plan in plans)
+
+        first = await import_ndjson("importer", exported)
+        assert (first["imported"], first["skipped"], first["failed"]) == (5, 0, 0)
+        again = await import_ndjson("importer", exported)
+        assert (again["imported"], again["skipped"], again["failed"]) == (0, 5, 0)
+
+        reexported = b"".join(await collect(export_trips("importer")))
+        assert sorted(json.loads(line)["data"]["formParams"]["destination"] for line in reexported.splitlines()) == [
+            f"City {n}" for n in range(1, 6)
+        ]
+    asyncio.run(scenario())
+
+def test_import_without_ids_deduplicates_by_payload():
+    async def scenario():
+        line = json.dumps({"trip_type": "plan", "data": {"formParams": {"destination": "Oslo"}}}).encode()
+        summary = await import_ndjson("hasher", line + b"\n" + line + b"\n")
+        assert (summary["imported"], summary["skipped"]) == (1, 1)
+        summary = await import_ndjson("hasher", line)
+        assert (summary["imported"], summary["skipped"]) == (0, 1)
+    asyncio.run(scenario())
+
+def test_concurrent_imports_of_the_same_file_insert_each_trip_once():
+    async def scenario():
+        payload = b"".join(
+            json.dumps({"trip_type": "plan", "data": {"formParams": {"destination": f"Town {n}"}}}).encode() + b"\n"
+            for n in range(6)
+        )
+        first, second = await asyncio.gather(import_ndjson("racer", payload), import_ndjson("racer", payload))
+        assert first["imported"] + second["imported"] == 6
+        assert first["skipped"] + second["skipped"] == 6
+        assert len(await database.find_trips_by_user("racer")) == 6
+    asyncio.run(scenario())
+
+def test_sqlite_insert_trips_skips_existing_import_keys(tmp_path):
+    path = str(tmp_path / "trips.sqlite3")
+    stores = [SQLiteStore(path), SQLiteStore(path)]
+    batch = lambda: [{"user_id": "u1", "trip_type": "plan", "import_key": f"k{n}"} for n in range(20)]
+    with ThreadPoolExecutor(2) as pool:
+        inserted = list(pool.map(lambda store: store.insert_trips(batch()), stores))
+    assert sum(len(ids) for ids in inserted) == 20
+    assert len(stores[0].find_trips_by_user("u1")) == 20
+    assert len(stores[0].insert_trips([{"user_id": "u1", "import_key": "k0"}, {"user_id": "u2", "import_key": "k0"}])) == 1
+    for store in stores:
+        store.close()
@@ -0,0 +1,291 @@
+import os
+import re
+import bisect
+import logging
+from collections import Counter
+from datetime import datetime
+from dotenv import load_dotenv
+
+import gazetteer
+from cache import TTLCache, SingleFlight
+from trips import extract_trip_fields, extract_search_text, load_trip_data, TRIP_SUMMARY_FIELDS
+from database import iter_trips_by_user, trips_version
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+SEARCH_INDEX_USERS = int(os.getenv("SEARCH_INDEX_USERS", "256"))
+SEARCH_INDEX_TTL = int(os.getenv("SEARCH_INDEX_TTL", "600"))
+SEARCH_BUILD_BATCH_SIZE = int(os.getenv("SEARCH_BUILD_BATCH_SIZE", "500"))
+SEARCH_FACET_LIMIT = 10
+
+SEARCH_FIELDS = [
+    "trip_type", "created_at", "updated_at", "data_blob", "search_text",
+    "destination", "location", "budget", "people", "days", "group_type", "data",
+]
+FACET_FIELDS = ["trip_type", "group_type", "country", "place"]
+RANGE_FIELDS = ["budget", "days", "people"]
+# Range facet buckets are [min, max); None means unbounded.
+RANGE_BUCKETS = {
+    "budget": [(0, 500), (500, 1000), (1000, 2000), (2000, 5000), (5000, None)],
+    "days": [(1, 4), (4, 8), (8, 15), (15, None)],
+}
+SORTS = {
+    "newest": ("created_at", True),
+    "oldest": ("created_at", False),
+    "budget_asc": ("budget", False),
+    "budget_desc": ("budget", True),
+    "days_asc": ("days", False),
+    "days_desc": ("days", True),
+}
+STOPWORDS = {"a", "an", "and", "at", "for", "in", "of", "on", "the", "to", "with"}
+
+def tokenize(text):
+    return [
+        token for token in re.split(r"[^\w]+", gazetteer.normalize_text(text or ""))
+        if token and token not in STOPWORDS
+    ]
+
+def _bucket_of(value, buckets):
+    for low, high in buckets:
+        if value >= low and (high is None or value < high):
+            return low, high
+    return None
+
+class TripIndex:
+    """
+    Search index over one user's trips: an inverted index of text tokens,
+    postings per facet value and sorted (value, trip_id) lists for the
+    numeric range fields. Queries intersect id sets smallest first and never
+    touch storage.
+    """
+    def __init__(self, version=0):
+        self.version = version
+        self.docs = {}
+        self.postings = {}
+        self.facets = {field: {} for field in FACET_FIELDS}
+        self.ranges = {field: [] for field in RANGE_FIELDS}
+        self.country_codes = {}
+        self._vocabulary = None
+
+    def add(self, trip_id, doc, text):
+        self.remove(trip_id)
+        self.docs[trip_id] = doc
+        tokens = set(tokenize(text)) | set(tokenize(doc["country"]))
+        doc["_tokens"] = tokens
+        for token in tokens:
+            self.postings.setdefault(token, set()).add(trip_id)
+        for field in FACET_FIELDS:
+            if doc.get(field):
+                self.facets[field].setdefault(doc[field], set()).add(trip_id)
+        if doc.get("country"):
+            self.country_codes[doc["country"]] = doc["country_code"]
+        for field in RANGE_FIELDS:
+            if doc.get(field) is not None:
+                bisect.insort(self.ranges[field], (doc[field], trip_id))
+        self._vocabulary = None
+
+    def remove(self, trip_id):
+        doc = self.docs.pop(trip_id, None)
+        if doc is None:
+            return
+        for token in doc["_tokens"]:
+            ids = self.postings.get(token)
+            ids.discard(trip_id)
+            if not ids:
+                del self.postings[token]
+        for field in FACET_FIELDS:
+            ids = self.facets[field].get(doc.get(field))
+            if ids is not None:
+                ids.discard(trip_id)
+                if not ids:
+                    del self.facets[field][doc[field]]
+        for field in RANGE_FIELDS:
+            if doc.get(field) is not None:
+                entries = self.ranges[field]
+                index = bisect.bisect_left(entries, (doc[field], trip_id))
+                if index < len(entries) and entries[index] == (doc[field], trip_id):
+                    del entries[index]
+        self._vocabulary = None
+
+    def _prefix_ids(self, prefix):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        ids = set()
+        for token in self._vocabulary[bisect.bisect_left(self._vocabulary, prefix):]:
+            if not token.startswith(prefix):
+                break
+            ids |= self.postings[token]
+        return ids
+
+    def _range_ids(self, field, low, high):
+        """Ids with low <= value <= high."""
+        entries = self.ranges[field]
+        start = 0 if low is None else bisect.bisect_left(entries, low, key=lambda entry: entry[0])
+        end = len(entries) if high is None else bisect.bisect_right(entries, high, key=lambda entry: entry[0])
+        return {trip_id for _, trip_id in entries[start:end]}
+
+    def _facet_ids(self, field, value):
+        """
+        Ids whose facet value matches value: places compare by gazetteer key,
+        countries by name or ISO code, the rest case-insensitively.
+        """
+        wanted = gazetteer.place_key(value) if field == "place" else gazetteer.normalize_text(value)
+
+        def same(facet_value):
+            if field == "place":
+                return gazetteer.place_key(facet_value) == wanted
+            names = {gazetteer.normalize_text(str(facet_value))}
+            if field == "country":
+                names.add((self.country_codes.get(facet_value) or "").casefold())
+            return wanted in names
+
+        ids = set()
+        for facet_value, facet_ids in self.facets[field].items():
+            if same(facet_value):
+                ids |= facet_ids
+        return ids
+
+    def search(self, q=None, filters=None, ranges=None, sort="newest", limit=20, offset=0):
+        """
+        q: free text; every token must match, the last one as a prefix.
+        filters: {facet field: value}. ranges: {field: (low, high)}, either bound None.
+        Returns (total, page of docs, facet counts over all matches).
+        """
+        candidates = []
+        tokens = tokenize(q)
+        for position, token in enumerate(tokens):
+            if position == len(tokens) - 1:
+                candidates.append(self._prefix_ids(token))
+            else:
+                candidates.append(self.postings.get(token, set()))
+        for field, value in (filters or {}).items():
+            if value:
+                candidates.append(self._facet_ids(field, value))
+        for field, (low, high) in (ranges or {}).items():
+            if low is not None or high is not None:
+                candidates.append(self._range_ids(field, low, high))
+
+        if candidates:
+            candidates.sort(key=len)
+            matches = set(candidates[0])
+            for ids in candidates[1:]:
+                if not matches:
+                    break
+                matches &= ids
+        else:
+            matches = set(self.docs)
+
+        field, descending = SORTS.get(sort, SORTS["newest"])
+        present = [trip_id for trip_id in matches if self.docs[trip_id].get(field) is not None]
+        missing = [trip_id for trip_id in matches if self.docs[trip_id].get(field) is None]
+        present.sort(key=lambda trip_id: (self.docs[trip_id][field], trip_id), reverse=descending)
+        ordered = present + missing
+        page = [self.docs[trip_id] for trip_id in ordered[offset:offset + limit]]
+        return len(matches), page, self._facet_counts(matches)
+
+    def _facet_counts(self, matches):
+        """Top SEARCH_FACET_LIMIT values per facet field and counts per range bucket, over the matches."""
+        counters = {field: Counter() for field in FACET_FIELDS + list(RANGE_BUCKETS)}
+        for trip_id in matches:
+            doc = self.docs[trip_id]
+            for field in FACET_FIELDS:
+                if doc.get(field):
+                    counters[field][doc[field]] += 1
+            for field, buckets in RANGE_BUCKETS.items():
+                if doc.get(field) is not None:
+                    counters[field][_bucket_of(doc[field], buckets)] += 1
+        facets = {}
+        for field in FACET_FIELDS:
+            ranked = sorted(counters[field].items(), key=lambda item: (-item[1], str(item[0])))
+            facets[field] = [{"value": value, "count": count} for value, count in ranked[:SEARCH_FACET_LIMIT]]
+        for field, buckets in RANGE_BUCKETS.items():
+            facets[field] = [
+                {"min": low, "max": high, "count": counters[field][(low, high)]} for low, high in buckets
+            ]
+        return facets
+
+def index_document(trip, fields, text):
+    """
+    The indexed view of a trip: its summary fields plus the canonical place
+    name and country of its destination, so "Kyoto" and "kyoto, japan" facet together.
+    """
+    destination = fields.get("destination")
+    place = gazetteer.resolve(destination) if destination else None
+    created_at = trip.get("created_at")
+    return {
+        "id": trip.get("id"),
+        "trip_type": trip.get("trip_type"),
+        "created_at": created_at if isinstance(created_at, datetime) else None,
+        "updated_at": trip.get("updated_at"),
+        **{field: fields.get(field) for field in TRIP_SUMMARY_FIELDS},
+        "place": gazetteer.canonical_name(destination) if destination else None,
+        "country": place["country"] if place else None,
+        "country_code": place["country_code"] if place else None,
+    }
+
+async def _index_entry(trip):
+    """Fields and search text for a stored trip; trips saved before either was extracted are read in full."""
+    if "data_blob" in trip and "search_text" in trip:
+        return trip, trip["search_text"]
+    data = await load_trip_data(trip)
+    return extract_trip_fields(trip.get("trip_type"), data), extract_search_text(trip.get("trip_type"), data)
+
+class TripSearch:
+    """
+    Per-user TripIndex instances, built on first search from storage and kept
+    for SEARCH_INDEX_TTL seconds (LRU over SEARCH_INDEX_USERS users). Each
+    index remembers the storage trips version it reflects. Saves, deletes and
+    imports in this process update a loaded index in place and advance its
+    version with storage's; when the stored version has moved on anyway (a
+    change by another worker or the import CLI) the index is rebuilt.
+    """
+    def __init__(self, users=SEARCH_INDEX_USERS, ttl=SEARCH_INDEX_TTL):
+        self.indexes = TTLCache(maxsize=users, ttl=ttl)
+        self._building = SingleFlight()
+        self.stats = {"builds": 0, "searches": 0}
+
+    async def _build(self, user_id):
+        index = TripIndex(await trips_version(user_id))
+        async for trip in iter_trips_by_user(user_id, SEARCH_BUILD_BATCH_SIZE, SEARCH_FIELDS):
+            try:
+                fields, text = await _index_entry(trip)
+            except Exception as e:
+                # Still indexed (without fields or text) so it shows up in listings.
+                logger.error(f"Could not index trip {trip.get('id')}: {e}")
+                fields, text = {}, ""
+            index.add(trip["id"], index_document(trip, fields, text), text)
+        self.indexes.set(user_id, index)
+        self.stats["builds"] += 1
+        return index
+
+    async def get_index(self, user_id):
+        index = self.indexes.get(user_id)
+        if index is not None and index.version == await trips_version(user_id):
+            return index
+        return await self._building.do(user_id, lambda: self._build(user_id))
+
+    async def search(self, user_id, **query):
+        index = await self.get_index(user_id)
+        self.stats["searches"] += 1
+        return index.search(**query)
+
+    def add(self, user_id, trip):
+        """Index a newly saved trip (as returned by store_trip_data) if the user's index is loaded."""
+        index = self.indexes.peek(user_id)
+        if index is not None:
+            text = trip.get("search_text", "")
+            index.add(trip["id"], index_document(trip, trip, text), text)
+            index.version += 1
+
+    def remove(self, user_id, trip_id):
+        index = self.indexes.peek(user_id)
+        if index is not None:
+            index.remove(trip_id)
+            index.version += 1
+
+trip_search = TripSearch()
+
+def public_doc(doc):
+    """A search hit as returned to clients, without index internals."""
+    return {key: value for key, value in doc.items() if not key.startswith("_")}
@@ -0,0 +1,296 @@
+import os
+import sys
+import json
+import asyncio
+import hashlib
+import logging
+import argparse
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+from blob_store import blob_store, encode_payload
+from trips import trip_data_fields, load_trip_data
+from trip_search import trip_search
+from database import iter_trips_by_user, insert_trips, find_trip_keys, trip_usage
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+TRIP_EXPORT_BATCH_SIZE = int(os.getenv("TRIP_EXPORT_BATCH_SIZE", "200"))
+TRIP_IMPORT_BATCH_SIZE = int(os.getenv("TRIP_IMPORT_BATCH_SIZE", "200"))
+TRIP_EXPORT_CHUNK_BYTES = int(os.getenv("TRIP_EXPORT_CHUNK_BYTES", str(64 * 1024)))
+MAX_REPORTED_ERRORS = 50
+
+def _timestamp(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def export_record(trip, data):
+    """One NDJSON line of an export: the trip metadata and its full payload."""
+    record = {
+        "id": trip.get("id"),
+        "trip_type": trip.get("trip_type"),
+        "created_at": _timestamp(trip.get("created_at")),
+        "updated_at": _timestamp(trip.get("updated_at")),
+        "data": data,
+    }
+    return json.dumps(record, separators=(",", ":"), default=str).encode("utf-8") + b"\n"
+
+async def export_trips(user_id, batch_size=TRIP_EXPORT_BATCH_SIZE, chunk_bytes=TRIP_EXPORT_CHUNK_BYTES):
+    """
+    Async generator of NDJSON byte chunks with every trip of a user. Trips are
+    read page by page and payloads one at a time, so memory does not grow
+    with the number of trips.
+    """
+    chunk = bytearray()
+    async for trip in iter_trips_by_user(user_id, batch_size):
+        try:
+            data = await load_trip_data(trip)
+        except Exception as e:
+            logger.error(f"Export could not read trip {trip.get('id')}: {e}")
+            data = None
+        chunk += export_record(trip, data)
+        if len(chunk) >= chunk_bytes:
+            yield bytes(chunk)
+            chunk.clear()
+    if chunk:
+        yield bytes(chunk)
+
+async def read_ndjson(chunks, max_line_bytes):
+    """
+    Split an async stream of byte chunks into parsed NDJSON lines, yielding
+    (line_number, record, error). Lines longer than max_line_bytes are
+    skipped with an error without ever being buffered whole.
+    """
+    buffer = b""
+    line_number = 0
+    oversized = False
+    async for chunk in chunks:
+        lines = (buffer + chunk).split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            line_number += 1
+            if oversized:
+                oversized = False
+                yield line_number, None, "Line is too large"
+            elif line.strip():
+                yield (line_number, *_parse_line(line))
+        if len(buffer) > max_line_bytes:
+            oversized = True
+            buffer = b""
+    if oversized:
+        yield line_number + 1, None, "Line is too large"
+    elif buffer.strip():
+        yield (line_number + 1, *_parse_line(buffer))
+
+def _parse_line(line):
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return None, f"Invalid JSON: {e}"
+    if not isinstance(record, dict):
+        return None, "Each line must be a JSON object"
+    if not isinstance(record.get("trip_type"), str) or not record["trip_type"]:
+        return None, "trip_type is required"
+    if not isinstance(record.get("data"), dict):
+        return None, "data must be an object"
+    return record, None
+
+def _parse_timestamp(value, default):
+    """
+    An ISO timestamp as naive UTC, like every other timestamp in the app;
+    values with an offset (or "Z") are converted.
+    """
+    if not isinstance(value, str):
+        return default
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return default
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def import_key(record, raw):
+    """
+    Idempotency key for an imported trip: an explicit idempotency_key, else
+    the id it was exported with, else a hash of its type and payload.
+    """
+    key = record.get("idempotency_key") or record.get("id")
+    if key:
+        return str(key)
+    return hashlib.sha256(record["trip_type"].encode("utf-8") + b"\0" + raw).hexdigest()
+
+class TripImport:
+    """
+    Batched, idempotent import of NDJSON trip records for one user. Records
+    whose key already matches one of the user's trips (by import_key or id)
+    are skipped, so re-running an interrupted import is safe.
+    """
+    def __init__(self, user_id, batch_size=TRIP_IMPORT_BATCH_SIZE, max_payload_bytes=None, max_trips=None, quota_bytes=None):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.max_payload_bytes = max_payload_bytes
+        self.max_trips = max_trips
+        self.quota_bytes = quota_bytes
+        self.summary = {"imported": 0, "skipped": 0, "failed": 0, "errors": []}
+        self._batch = []
+        self._usage = None
+
+    def _fail(self, line_number, error):
+        self.summary["failed"] += 1
+        if len(self.summary["errors"]) < MAX_REPORTED_ERRORS:
+            self.summary["errors"].append({"line": line_number, "error": error})
+
+    async def run(self, records):
+        """Consume (line_number, record, error) tuples from read_ndjson. Returns the summary."""
+        if self.max_trips is not None or self.quota_bytes is not None:
+            self._usage = await trip_usage(self.user_id)
+        async for line_number, record, error in records:
+            if error:
+                self._fail(line_number, error)
+                continue
+            raw = encode_payload(record["data"])
+            if self.max_payload_bytes and len(raw) > self.max_payload_bytes:
+                self._fail(line_number, "Trip is too large to save")
+                continue
+            self._batch.append((line_number, record, raw))
+            if len(self._batch) >= self.batch_size:
+                if not await self._flush():
+                    break
+        else:
+            await self._flush()
+        return self.summary
+
+    async def _flush(self):
+        """Write the pending batch. Returns False once the user's quota is used up."""
+        batch, self._batch = self._batch, []
+        if not batch:
+            return True
+        keyed = {}
+        for line_number, record, raw in batch:
+            key = import_key(record, raw)
+            if key in keyed:
+                self.summary["skipped"] += 1
+            else:
+                keyed[key] = (line_number, record, raw)
+        existing = await find_trip_keys(self.user_id, keyed)
+        self.summary["skipped"] += len(existing)
+
+        pending = [(key, item) for key, item in keyed.items() if key not in existing]
+        within_quota = True
+        if self._usage is not None:
+            count, size = self._usage["count"], self._usage["bytes"]
+            allowed = []
+            for key, (line_number, record, raw) in pending:
+                if (self.max_trips is not None and count >= self.max_trips) or (
+                    self.quota_bytes is not None and size + len(raw) > self.quota_bytes
+                ):
+                    self._fail(line_number, "Saved trip limit reached")
+                    within_quota = False
+                    break
+                count += 1
+                size += len(raw)
+                allowed.append((key, (line_number, record, raw)))
+            pending = allowed
+
+        now = datetime.utcnow()
+        trips = []
+        for key, (line_number, record, raw) in pending:
+            trip = {
+                "user_id": self.user_id,
+                "trip_type": record["trip_type"],
+                "created_at": _parse_timestamp(record.get("created_at"), now),
+                "updated_at": _parse_timestamp(record.get("updated_at"), now),
+                "import_key": key,
+            }
+            trip.update(trip_data_fields(record["trip_type"], record["data"], raw))
+            trips.append((line_number, trip, raw))
+        # Blobs first, so no inserted trip is ever missing its data. Blobs are
+        # content-addressed: one left behind by a trip another import got in
+        # first is shared or removed by blob garbage collection.
+        stored = await asyncio.gather(*(self._write_blob(line_number, raw) for line_number, _, raw in trips))
+        trips = [trip for trip, ok in zip(trips, stored) if ok]
+        if not trips:
+            return within_quota
+        inserted = set(await insert_trips([trip for _, trip, _ in trips]))
+        self.summary["skipped"] += len(trips) - len(inserted)
+        for _, trip, raw in trips:
+            # a skipped trip may have no _id, depending on the store
+            trip_id = str(trip.get("_id"))
+            if trip_id not in inserted:
+                continue
+            self.summary["imported"] += 1
+            if self._usage is not None:
+                self._usage["count"] += 1
+                self._usage["bytes"] += len(raw)
+            trip_search.add(self.user_id, {**trip, "id": trip_id})
+        if self._usage is not None and len(inserted) < len(trips):
+            # another import saved some of these meanwhile; count what it added
+            self._usage = await trip_usage(self.user_id)
+        return within_quota
+
+    async def _write_blob(self, line_number, raw):
+        try:
+            await blob_store.put(raw)
+            return True
+        except Exception as e:
+            logger.error(f"Import could not store the data of line {line_number}: {e}")
+            self._fail(line_number, "Could not store trip data")
+            return False
+
+async def _read_file(f, chunk_size=64 * 1024):
+    while True:
+        chunk = await asyncio.to_thread(f.read, chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+async def _cli(args):
+    from database import start_db, wait_for_db, close_db, find_user_by_email
+
+    start_db()
+    await wait_for_db()
+    try:
+        user = await find_user_by_email(args.email)
+        if not user:
+            print(f"No user with email {args.email}", file=sys.stderr)
+            return 1
+        if args.command == "export":
+            out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+            try:
+                async for chunk in export_trips(user["id"], args.batch_size):
+                    await asyncio.to_thread(out.write, chunk)
+            finally:
+                if out is not sys.stdout.buffer:
+                    out.close()
+            return 0
+        source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+        try:
+            trip_import = TripImport(user["id"], args.batch_size)
+            summary = await trip_import.run(read_ndjson(_read_file(source), args.max_line_bytes))
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+        print(json.dumps(summary, indent=2))
+        return 0 if not summary["failed"] else 2
+    finally:
+        await close_db()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export or import a user's saved trips as NDJSON, using the configured storage backend."
+    )
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("--email", required=True, help="Account whose trips are exported or imported into")
+    parser.add_argument("--output", default="-", help="Export file (default: stdout)")
+    parser.add_argument("--input", default="-", help="Import file (default: stdin)")
+    parser.add_argument("--batch-size", type=int, default=None, help="Trips read or written per batch")
+    parser.add_argument("--max-line-bytes", type=int, default=8 * 1024 * 1024, help="Skip import lines larger than this")
+    args = parser.parse_args(argv)
+    if args.batch_size is None:
+        args.batch_size = TRIP_EXPORT_BATCH_SIZE if args.command == "export" else TRIP_IMPORT_BATCH_SIZE
+    logging.basicConfig(level=logging.WARNING)
+    return asyncio.run(_cli(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+import os
+import json
+import base64
+import asyncio
+import logging
+import binascii
+from datetime import datetime
+from dotenv import load_dotenv
+
+from blob_store import blob_store, blob_digest, encode_payload
+from database import find_referenced_blobs
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+BLOB_GC_INTERVAL = int(os.getenv("BLOB_GC_INTERVAL", str(6 * 3600)))
+BLOB_GC_BATCH_SIZE = 500
+
+class TripDataMissing(Exception):
+    """
+    The trip's payload blob is not in this host's blob store, e.g. because
+    BLOB_STORE_PATH is not shared between the hosts serving a Mongo database.
+    """
+
+TRIP_SUMMARY_FIELDS = ["destination", "location", "budget", "people", "days", "group_type"]
+SEARCH_TEXT_MAX_CHARS = 4000
+
+def _parse_json(value):
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+def _number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+def extract_trip_fields(trip_type, data):
+    """
+    Pull the structured trip fields (the ones on TripBase) out of a saved
+    plan/suggestion payload, mirroring how the dashboard reads them.
+    """
+    data = _parse_json(data)
+    if trip_type == "plan":
+        params = data.get("formParams") or {}
+        plan = _parse_json(data.get("planData"))
+        destination = params.get("destination")
+        location = None
+        budget = params.get("budget") or plan.get("budget")
+        days = params.get("days") or plan.get("days") or len(plan.get("itinerary") or []) or None
+        people = params.get("people") or plan.get("people")
+        group_type = params.get("groupType") or plan.get("groupType")
+    else:
+        suggestions = _parse_json(data.get("suggestions")) or data
+        destinations = suggestions.get("suggested_destinations") or []
+        destination = destinations[0].get("destination") if destinations and isinstance(destinations[0], dict) else None
+        location = data.get("location")
+        budget = data.get("budget") or suggestions.get("budget")
+        days = (
+            data.get("days") or suggestions.get("days")
+            or len(suggestions.get("itinerary_for_top_choice") or []) or None
+        )
+        people = data.get("people") or suggestions.get("people")
+        group_type = data.get("groupType") or suggestions.get("groupType")
+    return {
+        "destination": destination,
+        "location": location,
+        "budget": _number(budget),
+        "people": _number(people, int),
+        "days": _number(days, int),
+        "group_type": group_type,
+    }
+
+def _itinerary_text(days):
+    parts = []
+    for day in days if isinstance(days, list) else []:
+        if isinstance(day, dict):
+            parts.extend(activity for activity in day.get("activities") or [] if isinstance(activity, str))
+            if isinstance(day.get("notes"), str):
+                parts.append(day["notes"])
+    return parts
+
+def extract_search_text(trip_type, data, max_chars=SEARCH_TEXT_MAX_CHARS):
+    """
+    The free text of a trip worth searching: places, itinerary activities and
+    notes, and accommodation or destination names, capped at max_chars.
+    """
+    data = _parse_json(data)
+    fields = extract_trip_fields(trip_type, data)
+    parts = [fields["destination"], fields["location"]]
+    if trip_type == "plan":
+        plan = _parse_json(data.get("planData"))
+        parts.extend(_itinerary_text(plan.get("itinerary")))
+        parts.extend(item.get("name") for item in plan.get("accommodation_suggestions") or [] if isinstance(item, dict))
+    else:
+        suggestions = _parse_json(data.get("suggestions")) or data
+        for item in suggestions.get("suggested_destinations") or []:
+            if isinstance(item, dict):
+                parts.extend([item.get("destination"), item.get("reason")])
+        parts.extend(_itinerary_text(suggestions.get("itinerary_for_top_choice")))
+    return " ".join(part for part in parts if isinstance(part, str) and part)[:max_chars]
+
+def summarize_trip(trip):
+    summary = {
+        "id": trip.get("id"),
+        "trip_type": trip.get("trip_type"),
+        "created_at": trip.get("created_at"),
+        "updated_at": trip.get("updated_at"),
+    }
+    if "data_blob" in trip:
+        summary.update({field: trip.get(field) for field in TRIP_SUMMARY_FIELDS})
+    else:
+        summary.update(extract_trip_fields(trip.get("trip_type"), trip.get("data")))
+    return summary
+
+def trip_data_fields(trip_type, data, raw):
+    """
+    The fields that replace the inline data on the trip document: the blob
+    reference, its size and the structured fields and search text extracted
+    from it. Nothing is written; see store_trip_data.
+    """
+    fields = {"data_blob": blob_digest(raw), "data_size": len(raw)}
+    fields.update(extract_trip_fields(trip_type, data))
+    fields["search_text"] = extract_search_text(trip_type, data)
+    return fields
+
+async def store_trip_data(trip_type, data, raw=None):
+    """Write a trip payload to the blob store and return its trip_data_fields."""
+    raw = raw if raw is not None else encode_payload(data)
+    fields = trip_data_fields(trip_type, data, raw)
+    await blob_store.put(raw)
+    return fields
+
+def listed_trip_data(trip):
+    """
+    The data shown for a trip in a list, without reading its blob: inline data
+    (already projected by storage) for older trips, otherwise the structured
+    fields stored beside the blob, in the payload's own shape.
+    """
+    if "data" in trip or not trip.get("data_blob"):
+        return trip.get("data")
+    if trip.get("trip_type") == "plan":
+        return {"formParams": {
+            "destination": trip.get("destination"),
+            "budget": trip.get("budget"),
+            "people": trip.get("people"),
+            "days": trip.get("days"),
+            "groupType": trip.get("group_type"),
+        }}
+    destination = trip.get("destination")
+    return {
+        "location": trip.get("location"),
+        "budget": trip.get("budget"),
+        "people": trip.get("people"),
+        "days": trip.get("days"),
+        "groupType": trip.get("group_type"),
+        "suggestions": {"suggested_destinations": [{"destination": destination}] if destination else []},
+    }
+
+async def load_trip_data(trip):
+    """
+    The trip payload, read from the blob store for trips saved by reference.
+    Raises TripDataMissing if the blob is not in the store.
+    """
+    if "data" in trip or not trip.get("data_blob"):
+        return trip.get("data")
+    try:
+        data = await blob_store.get_json(trip["data_blob"])
+    except FileNotFoundError:
+        raise TripDataMissing(f"Blob {trip['data_blob']} of trip {trip.get('id')} is missing")
+    return data
+
+async def release_trip_data(trip):
+    """
+    Delete a deleted trip's payload blob unless another trip still uses it.
+    Blobs inside the save grace period are left for collect_blob_garbage.
+    """
+    digest = trip.get("data_blob")
+    if not digest:
+        return False
+    try:
+        if await find_referenced_blobs([digest]):
+            return False
+        return await blob_store.delete(digest)
+    except Exception as e:
+        logger.error(f"Could not release blob {digest}: {e}")
+        return False
+
+async def collect_blob_garbage(batch_size=BLOB_GC_BATCH_SIZE):
+    """
+    Sweep the blob store and delete every blob no trip references (older than
+    the grace period). Returns the number of blobs deleted.
+    """
+    digests = await blob_store.list_digests()
+    deleted = 0
+    for start in range(0, len(digests), batch_size):
+        batch = digests[start:start + batch_size]
+        referenced = await find_referenced_blobs(batch)
+        for digest in batch:
+            if digest not in referenced and await blob_store.delete(digest):
+                deleted += 1
+    if deleted:
+        logger.info(f"Deleted {deleted} unreferenced trip blobs")
+    return deleted
+
+async def _gc_loop(interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await collect_blob_garbage()
+        except Exception as e:
+            logger.error(f"Blob garbage collection failed: {e}")
+
+_gc_task = None
+
+def start_blob_gc(interval=BLOB_GC_INTERVAL):
+    """Sweep unreferenced blobs every interval seconds (0 disables)."""
+    global _gc_task
+    if interval > 0 and (_gc_task is None or _gc_task.done()):
+        _gc_task = asyncio.create_task(_gc_loop(interval))
+
+async def stop_blob_gc():
+    global _gc_task
+    if _gc_task is not None:
+        _gc_task.cancel()
+        try:
+            await _gc_task
+        except asyncio.CancelledError:
+            pass
+        _gc_task = None
+
+def encode_cursor(trip):
+    created_at = trip.get("created_at")
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    raw = json.dumps({"c": created_at, "i": trip.get("id")}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    """
+    Returns (created_at, trip_id) or raises ValueError for a malformed cursor.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+        return datetime.fromisoformat(position["c"]), str(position["i"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
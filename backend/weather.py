@@ -0,0 +1,86 @@
+import os
+import logging
+from dotenv import load_dotenv
+
+import http_client
+import gazetteer
+from cache import TTLCache, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+API_KEY = os.getenv("WEATHERAPI_KEY")
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "3600"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "512"))
+WEATHER_LAST_GOOD_TTL = int(os.getenv("WEATHER_LAST_GOOD_TTL", str(3 * 24 * 3600)))
+MAX_DAYS = 14
+
+forecast_cache = TTLCache(maxsize=WEATHER_CACHE_SIZE, ttl=WEATHER_CACHE_TTL)
+# Last successful forecast per city, served (marked stale) when WeatherAPI is failing.
+last_good = TTLCache(maxsize=WEATHER_CACHE_SIZE, ttl=WEATHER_LAST_GOOD_TTL)
+_inflight = SingleFlight()
+
+class WeatherError(Exception):
+    pass
+
+def trim_forecast(forecast, days):
+    forecast_days = forecast.get("forecast", {}).get("forecastday", [])
+    if len(forecast_days) <= days:
+        return forecast
+    trimmed = dict(forecast)
+    trimmed["forecast"] = dict(forecast["forecast"], forecastday=forecast_days[:days])
+    return trimmed
+
+def lookup_cached(city_key, days):
+    for cached_days in range(days, MAX_DAYS + 1):
+        forecast = forecast_cache.peek((city_key, cached_days))
+        if forecast is not None:
+            return trim_forecast(forecast, days)
+    return None
+
+async def fetch_forecast(query, days):
+    params = {
+        "key": API_KEY,
+        "q": query,
+        "days": days,
+        "aqi": "no",
+        "alerts": "no"
+    }
+    response = await http_client.get("weatherapi", "/forecast.json", params=params)
+    if response.status_code != 200:
+        raise WeatherError(f"Failed to fetch weather: {response.text}")
+    return response.json()
+
+async def get_forecast(city, days=5):
+    """
+    Return the forecast for a city, served from the in-memory cache when a
+    fresh entry for the same place covers at least the requested number of days.
+    Cities in the gazetteer are keyed and looked up by their coordinates, so
+    "Paris", "paris, france" and "PARIS" share one entry and one upstream call.
+    If WeatherAPI fails (or its circuit is open) the last good forecast for the
+    city is returned with "stale": true.
+    """
+    days = max(1, min(days, MAX_DAYS))
+    place = gazetteer.resolve(city)
+    city_key = gazetteer.place_key(city)
+    cached = lookup_cached(city_key, days)
+    forecast_cache.record(cached is not None)
+    if cached is not None:
+        return cached
+
+    async def load():
+        try:
+            forecast = await fetch_forecast(gazetteer.coordinates(place) if place else city, days)
+        except Exception as e:
+            fallback = last_good.peek(city_key)
+            if fallback is None:
+                raise
+            logger.warning(f"Serving last known forecast for {city}: {e}")
+            return dict(trim_forecast(fallback, days), stale=True)
+        forecast_cache.set((city_key, days), forecast)
+        previous = last_good.peek(city_key)
+        if previous is None or days >= len(previous.get("forecast", {}).get("forecastday", [])):
+            last_good.set(city_key, forecast)
+        return forecast
+
+    return await _inflight.do((city_key, days), load)
@@ -29,13 +29,16 @@ const DashboardPage = () => {
         const userResponse = await axios.get(`${BACKEND_URL}/auth/me`);
         setUser(userResponse.data);
         
-        const tripsResponse = await axios.get(`${BACKEND_URL}/api/trips`);
-        const tripsSorted = (tripsResponse.data || []).slice().sort((a, b) => {
-          const dateA = new Date(a.created_at);
-          const dateB = new Date(b.created_at);
-          return dateB - dateA;
-        });
-        setTrips(tripsSorted);
+        let allTrips = [];
+        let cursor = null;
+        do {
+          const tripsResponse = await axios.get(`${BACKEND_URL}/api/trips`, {
+            params: { summary: true, limit: 50, ...(cursor ? { cursor } : {}) }
+          });
+          allTrips = allTrips.concat(tripsResponse.data.trips || []);
+          cursor = tripsResponse.data.next_cursor;
+        } while (cursor);
+        setTrips(allTrips);
       } catch (err) {
         console.error('Error fetching data:', err);
         setError('Failed to load your trips. Please try again later.');
@@ -134,45 +137,13 @@ const DashboardPage = () => {
             ) : (
               <div className="grid grid-cols-1 md:grid-cols-2 xl:grid-cols-3 gap-6 lg:gap-8">
                 {trips.map(trip => {
-                  let data = trip.data || {};
-                  if (typeof data === "string") {
-                    try {
-                      data = JSON.parse(data);
-                    } catch {
-                      data = {};
-                    }
-                  }
-                  let formParams = data.formParams || {};
-                  let planData = data.planData || {};
-                  if (typeof planData === "string") {
-                    try {
-                      planData = JSON.parse(planData);
-                    } catch {
-                      planData = {};
-                    }
-                  }
-                  const suggestData = data.suggestions || data;
-
-                  let title = "";
-                  let budget = "";
-                  let days = "";
-                  let people = "";
-                  let groupType = "";
-                  if (trip.trip_type === "plan") {
-                    title = formParams.destination || "Planned Trip";
-                    budget = formParams.budget || planData.budget || "";
-                    days = formParams.days || planData.days || (planData.itinerary?.length || "");
-                    people = formParams.people || planData.people || "";
-                    groupType = formParams.groupType || planData.groupType || "";
-                  } else {
-                    title = suggestData.suggested_destinations?.[0]?.destination
-                      ? `Suggestions: ${suggestData.suggested_destinations[0].destination}`
-                      : "Suggestions";
-                    budget = data.budget || suggestData.budget || "";
-                    days = data.days || suggestData.days || (suggestData.itinerary_for_top_choice?.length || "");
-                    people = data.people || suggestData.people || "";
-                    groupType = data.groupType || suggestData.groupType || "";
-                  }
+                  const title = trip.trip_type === "plan"
+                    ? trip.destination || "Planned Trip"
+                    : trip.destination ? `Suggestions: ${trip.destination}` : "Suggestions";
+                  const budget = trip.budget || "";
+                  const days = trip.days || "";
+                  const people = trip.people || "";
+                  const groupType = trip.group_type || "";
 
                   return (
                     <div key={trip.id} className="bg-white rounded-2xl overflow-hidden shadow-lg hover:shadow-xl transition-all duration-300 border border-gray-100 hover:border-gray-200 group">
@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from "react";
 import { Link, useNavigate, useParams } from "react-router-dom";
-import { fetchWeatherData, fetchPlacesData, apiClient } from "../../utils/api";
+import { fetchDestinationsData, apiClient } from "../../utils/api";
 import SummaryTable from "../SummaryTable";
 import ResultSection from "./ResultSection";
 import ListItems from "./ListItems";
@@ -90,32 +90,29 @@ const TripDisplay = ({ trip, weatherData: initialWeatherData }) => {
     ? parseInt(formParams?.days) || planData?.itinerary?.length || 1
     : parseInt(data.days || suggestData.days) || 5;
 
-  useEffect(() => {
-    let cancelled = false;
-    if ((weatherData === null) && weatherLocation) {
-      setWeatherLoading(true);
-      fetchWeatherData(weatherLocation, weatherDays).then((w) => {
-        if (!cancelled) setWeatherData(w);
-        setWeatherLoading(false);
-      });
-    }
-    return () => { cancelled = true; };
-  }, [weatherLocation, weatherDays]);
-
   useEffect(() => {
     if (!weatherLocation) return;
+    let cancelled = false;
+    const needsWeather = weatherData === null;
+    if (needsWeather) setWeatherLoading(true);
     setPlacesLoading(true);
     setPlacesError(null);
-    fetchPlacesData(weatherLocation, { section: "all", limit: 6 })
-      .then((data) => {
-        setPlaces(data);
-        setPlacesLoading(false);
-      })
-      .catch((err) => {
+    fetchDestinationsData([weatherLocation], { days: weatherDays }).then((results) => {
+      if (cancelled) return;
+      const result = results[weatherLocation];
+      if (needsWeather) {
+        setWeatherData(result?.weather || { error: "Could not load weather data" });
+        setWeatherLoading(false);
+      }
+      if (result?.places) {
+        setPlaces(result.places);
+      } else {
         setPlacesError("Could not load restaurants/hotels.");
-        setPlacesLoading(false);
-      });
-  }, [weatherLocation]);
+      }
+      setPlacesLoading(false);
+    });
+    return () => { cancelled = true; };
+  }, [weatherLocation, weatherDays]);
 
   const shouldShowWeatherLoading = weatherLoading || (weatherData === null && weatherLocation);
   const shouldShowPlacesLoading = placesLoading || (places === null && weatherLocation);
@@ -36,6 +36,22 @@ apiClient.interceptors.response.use(
   }
 );
 
+const formatForecast = (data) => {
+  if (data && data.forecast && data.forecast.forecastday) {
+    return data.forecast.forecastday.map(day => ({
+      day: new Date(day.date).toLocaleDateString('en-US', { weekday: 'short' }),
+      date: new Date(day.date).toLocaleDateString('en-US', { month: 'short', day: 'numeric' }),
+      temp: Math.round(day.day.avgtemp_c),
+      tempMin: Math.round(day.day.mintemp_c),
+      tempMax: Math.round(day.day.maxtemp_c),
+      humidity: day.day.avghumidity,
+      description: day.day.condition.text,
+      icon: `https:${day.day.condition.icon}`
+    }));
+  }
+  return null;
+};
+
 export const fetchWeatherData = async (city, tripDays = 5) => {
   try {
     console.log(`Fetching weather for ${city} for ${tripDays} days`);
@@ -43,17 +59,9 @@ export const fetchWeatherData = async (city, tripDays = 5) => {
       params: { days: tripDays }
     });
 
-    if (response.data && response.data.forecast && response.data.forecast.forecastday) {
-      return response.data.forecast.forecastday.map(day => ({
-        day: new Date(day.date).toLocaleDateString('en-US', { weekday: 'short' }),
-        date: new Date(day.date).toLocaleDateString('en-US', { month: 'short', day: 'numeric' }),
-        temp: Math.round(day.day.avgtemp_c),
-        tempMin: Math.round(day.day.mintemp_c),
-        tempMax: Math.round(day.day.maxtemp_c),
-        humidity: day.day.avghumidity,
-        description: day.day.condition.text,
-        icon: `https:${day.day.condition.icon}`
-      }));
+    const forecast = formatForecast(response.data);
+    if (forecast) {
+      return forecast;
     }
 
     if (response.data.error) {
@@ -67,6 +75,30 @@ export const fetchWeatherData = async (city, tripDays = 5) => {
   }
 };
 
+// Weather and places for several cities in one request. Returns
+// { [city]: { weather, places } } in the same shapes as fetchWeatherData/fetchPlacesData.
+export const fetchDestinationsData = async (cities, { days = 5, section = "all" } = {}) => {
+  try {
+    const response = await apiClient.post('/destinations/batch', {
+      cities,
+      days: parseInt(days) || 5,
+      section
+    });
+    const results = {};
+    for (const [city, result] of Object.entries(response.data.destinations || {})) {
+      const places = result.places || {};
+      results[city] = {
+        weather: formatForecast(result.weather) || { error: "Could not load weather data" },
+        places: places.error ? { error: places.error } : places
+      };
+    }
+    return results;
+  } catch (error) {
+    console.error('Error fetching destination data:', error);
+    return { error: "Could not load destination data" };
+  }
+};
+
 export const fetchPlanData = async (destination, budget, people, days, groupType) => {
   try {
     localStorage.removeItem('holidayPlan');
@@ -84,17 +116,8 @@ export const fetchPlanData = async (destination, budget, people, days, groupType
     });
     console.log('Received plan data:', response.data);
 
-    let data = response.data;
-    if (typeof data === "string") {
-      data = data.replace(/^[`\s]+|[`]+$/g, '');
-      data = JSON.parse(data);
-    }
-
-    if (data && typeof data.plan === "string") {
-      data = JSON.parse(data.plan);
-    } else if (data && data.plan) {
-      data = data.plan;
-    }
+    // The server parses and validates the model output, so plan is already an object.
+    const data = response.data.plan;
 
     data.itinerary = data.itinerary || [];
     data.accommodation_suggestions = data.accommodation_suggestions || [];
@@ -102,19 +125,9 @@ export const fetchPlanData = async (destination, budget, people, days, groupType
     data.packing_tips = data.packing_tips || [];
     data.budget_breakdown = data.budget_breakdown || {};
 
-    let weather = null;
-    try {
-      weather = await fetchWeatherData(destination, days);
-    } catch (e) {
-      weather = { error: "Could not load weather data" };
-    }
-
-    let places = null;
-    try {
-      places = await fetchPlacesData(destination, { section: "all", limit: 4 });
-    } catch (e) {
-      places = { error: "Could not load places data" };
-    }
+    const details = await fetchDestinationsData([destination], { days });
+    const weather = details[destination]?.weather || { error: "Could not load weather data" };
+    const places = details[destination]?.places || { error: "Could not load places data" };
 
     const localData = {
       formParams: { destination, budget, people, days, groupType },
@@ -147,18 +160,8 @@ export const fetchSuggestData = async (location, budget, people, days, groupType
       group_type: groupType
     });
 
-    let data = response.data;
-    console.log('Received suggestion data:', data);
-    if (typeof data === "string") {
-      data = data.replace(/^[`\s]+|[`]+$/g, '');
-      data = JSON.parse(data);
-    }
-
-    if (data && typeof data.suggestions === "string") {
-      data = JSON.parse(data.suggestions);
-    } else if (data && data.suggestions) {
-      data = data.suggestions;
-    }
+    console.log('Received suggestion data:', response.data);
+    const data = response.data.suggestions;
 
     data.suggested_destinations = data.suggested_destinations || [];
     data.itinerary_for_top_choice = data.itinerary_for_top_choice || [];
@@ -168,18 +171,12 @@ export const fetchSuggestData = async (location, budget, people, days, groupType
 
     let weather = null;
     let places = null;
-    const topDestination = data.suggested_destinations?.[0]?.destination;
+    const topDestination = data.suggested_destinations[0]?.destination;
     if (topDestination) {
-      try {
-        weather = await fetchWeatherData(topDestination, days);
-      } catch (e) {
-        weather = { error: "Could not load weather data" };
-      }
-      try {
-        places = await fetchPlacesData(topDestination, { section: "all", limit: 4 });
-      } catch (e) {
-        places = { error: "Could not load places data" };
-      }
+      // Only the top destination's weather and places are shown.
+      const details = await fetchDestinationsData([topDestination], { days });
+      weather = details[topDestination]?.weather || { error: "Could not load weather data" };
+      places = details[topDestination]?.places || { error: "Could not load places data" };
     }
 
     localStorage.setItem('destinationSuggestions', JSON.stringify({